@@ -0,0 +1,292 @@
+"""
+Детерминированный генератор страхового портфеля для нагрузочных тестов:
+python -m bench.generator --db big.db --applications 1m --seed 42
+
+Строки сразу пишутся в конечном состоянии (заявка, оценка, решение, договор,
+подписи), без пошагового прохождения статусов. Вставка — executemany по
+CHUNK строк, все части одной транзакцией. Одинаковые seed и параметры дают
+одинаковую БД.
+"""
+import argparse
+import bisect
+import math
+import random
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from core import db, migrations
+from core.enums import ApplicationStatus, BranchStatus
+
+CHUNK = 50_000
+
+# доля заявок, остановившихся на каждом статусе
+STATUS_SHARES: Dict[ApplicationStatus, float] = {
+    ApplicationStatus.CREATED: 0.12,
+    ApplicationStatus.RISK_ANALYSIS: 0.10,
+    ApplicationStatus.REJECTED: 0.13,
+    ApplicationStatus.APPROVED: 0.08,
+    ApplicationStatus.CONTRACT_PREPARED: 0.07,
+    ApplicationStatus.CLIENT_SIGNED: 0.05,
+    ApplicationStatus.DIRECTOR_SIGNED: 0.05,
+    ApplicationStatus.ARCHIVED: 0.40,
+}
+
+_ASSESSED = set(STATUS_SHARES) - {ApplicationStatus.CREATED}
+_PRICED = {
+    ApplicationStatus.APPROVED, ApplicationStatus.CONTRACT_PREPARED, ApplicationStatus.CLIENT_SIGNED,
+    ApplicationStatus.DIRECTOR_SIGNED, ApplicationStatus.ARCHIVED,
+}
+# статус заявки -> (status договора, client_signed, director_signed, archived)
+_CONTRACT_STATE = {
+    ApplicationStatus.CONTRACT_PREPARED: ("prepared", 0, 0, 0),
+    ApplicationStatus.CLIENT_SIGNED: ("client_signed", 1, 0, 0),
+    ApplicationStatus.DIRECTOR_SIGNED: ("director_signed", 1, 1, 0),
+    ApplicationStatus.ARCHIVED: ("archived", 1, 1, 1),
+}
+
+_LAST_NAMES = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов", "Михайлов", "Новиков"]
+_FIRST_NAMES = ["Иван", "Пётр", "Сергей", "Анна", "Ольга", "Дмитрий", "Мария", "Елена", "Алексей", "Наталья"]
+_OBJECTS = ["Квартира", "Дом", "Автомобиль", "Дача", "Офис", "Склад", "Здоровье", "Грузовик", "Гараж", "Яхта"]
+
+
+@dataclass
+class PortfolioSpec:
+    applications: int = 10_000
+    branches: int = 100
+    clients: int = 20_000
+    seed: int = 0
+    start: datetime = datetime(2024, 1, 1)
+    days: int = 730
+    approved_branch_share: float = 0.8
+    status_shares: Dict[ApplicationStatus, float] = field(default_factory=lambda: dict(STATUS_SHARES))
+
+
+class _Clock:
+    """Форматирует «секунды от начала периода» в ISO-строку: префикс до часа кэшируется, MM:SS — из таблицы."""
+
+    _MMSS = [f"{m:02d}:{sec:02d}" for m in range(60) for sec in range(60)]
+
+    def __init__(self, start: datetime):
+        self.start = start
+        self._hours: Dict[int, str] = {}
+
+    def iso(self, seconds: float) -> str:
+        hour, rest = divmod(int(seconds), 3600)
+        prefix = self._hours.get(hour)
+        if prefix is None:
+            prefix = (self.start + timedelta(hours=hour)).strftime("%Y-%m-%dT%H:")
+            self._hours[hour] = prefix
+        return prefix + self._MMSS[rest]
+
+
+class _Generator:
+    def __init__(self, spec: PortfolioSpec, type_ids: List[int], first_app_id: int, first_branch_id: int):
+        self.spec = spec
+        self.rng = random.Random(spec.seed)
+        self.clock = _Clock(spec.start)
+        self.type_ids = type_ids
+        self.first_app_id = first_app_id
+        self.first_branch_id = first_branch_id
+        self.approved_branch_ids: List[int] = []
+        self.statuses = list(spec.status_shares)
+        total = sum(spec.status_shares.values())
+        self.cum_weights = []
+        acc = 0.0
+        for s in self.statuses:
+            acc += spec.status_shares[s] / total
+            self.cum_weights.append(acc)
+        self.fio = [f"{last} {first}" for first in _FIRST_NAMES for last in _LAST_NAMES]
+        self.contracts: List[tuple] = []
+
+    def branches(self) -> Iterator[tuple]:
+        rng, iso = self.rng, self.clock.iso
+        for n in range(self.spec.branches):
+            branch_id = self.first_branch_id + n
+            # первый филиал одобрен всегда: договорам нужен хотя бы один
+            approved = n == 0 or rng.random() < self.spec.approved_branch_share
+            if approved:
+                self.approved_branch_ids.append(branch_id)
+            created = rng.uniform(0, 30 * 86400)
+            updated = created + rng.uniform(0, 10 * 86400) if approved else created
+            yield (
+                branch_id, f"Филиал №{n + 1}",
+                (BranchStatus.APPROVED if approved else BranchStatus.PENDING).name,
+                1, int(approved), "Дмитрий", iso(created), iso(updated),
+                f"г. Город, ул. Улица, д. {n + 1}", f"+7 900 {rng.randrange(10 ** 7):07d}",
+            )
+
+    def applications(self) -> Iterator[tuple]:
+        spec = self.spec
+        rng = self.rng
+        random_, uniform, gauss, choice = rng.random, rng.uniform, rng.gauss, rng.choice
+        iso = self.clock.iso
+        statuses, cum_weights, last_status = self.statuses, self.cum_weights, len(self.statuses) - 1
+        type_ids, branch_ids, fio = self.type_ids, self.approved_branch_ids, self.fio
+        clients, period = spec.clients, spec.days * 86400
+        hour, day = 3600, 86400
+
+        for n in range(spec.applications):
+            app_id = self.first_app_id + n
+            status = statuses[min(last_status, bisect.bisect_left(cum_weights, random_()))]
+            # степенное распределение: у немногих клиентов много заявок
+            client = int(clients * random_() ** 2)
+            created = uniform(0, period)
+            t = created
+
+            risk, type_id, uw_at = 0, None, None
+            if status in _ASSESSED:
+                # риск ~ Beta(1, 2): чаще низкий, среднее ~33%
+                risk = int(100 * min(random_(), random_()))
+                type_id = choice(type_ids)
+                t += uniform(1, 72) * hour
+                uw_at = iso(t)
+
+            ins_sum = rate = amount = admin_at = None
+            if status in _PRICED:
+                # сумма — логнормальная (медиана ~450 тыс.), ставка растёт с риском
+                ins_sum = float(min(50_000_000, max(50_000, round(math.exp(gauss(13.0, 0.8)), -3))))
+                rate = round(min(12.0, max(0.3, 0.5 + risk * 0.06 + gauss(0, 0.3))), 2)
+                amount = ins_sum * (rate / 100.0)
+                t += uniform(1, 72) * hour
+                admin_at = iso(t)
+
+            if status in _CONTRACT_STATE:
+                contract_date = t + uniform(1, 48) * hour
+                c_status, client_signed, director_signed, archived = _CONTRACT_STATE[status]
+                t = contract_date + (uniform(0, 20) * day if client_signed else 0)
+                self.contracts.append((
+                    app_id, c_status, client_signed, director_signed, archived,
+                    iso(contract_date), ins_sum, type_id, rate, amount,
+                    choice(branch_ids), "Проект договора (сгенерирован).",
+                    iso(contract_date), iso(t),
+                ))
+
+            yield (
+                app_id, f"client{client}", status.name, iso(created), iso(t),
+                fio[client % 100], f"{_OBJECTS[n % 10]} {n + 1}", f"Прошу застраховать объект. Заявка {n + 1}.",
+                risk, type_id, uw_at, ins_sum, rate, amount, admin_at,
+            )
+
+
+def _chunks(rows: Iterator[tuple], size: int = CHUNK) -> Iterator[List[tuple]]:
+    chunk: List[tuple] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def generate(path: Path, spec: PortfolioSpec) -> Dict[str, int]:
+    """
+    Добавляет сгенерированный портфель в БД path (схема создаётся при необходимости).
+    Построчный журнал изменений (changelog) при загрузке не ведётся, сводка портфеля
+    и полнотекстовый индекс строятся один раз в конце — генератор рассчитан на БД,
+    которую в этот момент никто не открывает.
+    """
+    if spec.branches < 1:
+        raise ValueError("Нужен хотя бы один филиал: к нему привязываются договоры")
+    db.DB_PATH = Path(path)
+    db.db_init()
+    db.close_pool()
+
+    conn = sqlite3.connect(Path(path))
+    try:
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -262144")
+        # сводка портфеля пересчитывается вместе с перенесёнными в архив заявками (если архив уже есть)
+        if db.archive_path().exists():
+            conn.execute(f"ATTACH DATABASE ? AS {migrations.ARCHIVE_SCHEMA}", (str(db.archive_path()),))
+        type_ids = [r[0] for r in conn.execute("SELECT id FROM insurance_types WHERE is_active = 1 ORDER BY id")]
+        # по sqlite_sequence: id заявок, перенесённых в архив, повторно не выдаются
+        first_app_id = conn.execute(
+            "SELECT MAX(COALESCE(MAX(id), 0), COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'applications'), 0)) + 1"
+            " FROM applications"
+        ).fetchone()[0]
+        first_branch_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM branches").fetchone()[0]
+        gen = _Generator(spec, type_ids, first_app_id, first_branch_id)
+
+        conn.execute("BEGIN IMMEDIATE")
+        migrations.drop_changelog_triggers(conn)
+        migrations.drop_summary_triggers(conn)
+        migrations.drop_search_triggers(conn)
+        # вторичные индексы дешевле построить заново по готовым данным, чем обновлять на каждой вставке
+        indexes = [sql for (sql,) in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name IN ('applications', 'contracts') AND sql IS NOT NULL"
+        )]
+        for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name IN ('applications', 'contracts') AND sql IS NOT NULL"
+        ).fetchall():
+            conn.execute(f"DROP INDEX {name}")
+
+        conn.executemany("""
+            INSERT INTO branches(id, branch_name, status, confirmed_by_director, approved_by_lawyer,
+                                 created_by, created_at, updated_at, address, phone)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, gen.branches())
+
+        contracts = 0
+        for chunk in _chunks(gen.applications()):
+            conn.executemany("""
+                INSERT INTO applications(id, client_name, status, created_at, updated_at,
+                                         client_fio, insured_object, request_text,
+                                         risk_percent, insurance_type_id, underwriter_updated_at,
+                                         insurance_sum, tariff_rate, tariff_amount, admin_updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, chunk)
+            conn.executemany("""
+                INSERT INTO contracts(application_id, status, client_signed, director_signed, archived,
+                                      contract_date, insurance_sum, insurance_type_id, tariff_rate, tariff_amount,
+                                      branch_id, draft_text, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, gen.contracts)
+            contracts += len(gen.contracts)
+            gen.contracts = []
+
+        for sql in indexes:
+            conn.execute(sql)
+        migrations.create_changelog_triggers(conn)
+        migrations.create_summary_triggers(conn)
+        migrations.rebuild_portfolio_summary(conn)
+        migrations.create_search_triggers(conn)
+        migrations.rebuild_search_index(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    db.invalidate_reference_cache()
+    return {"applications": spec.applications, "branches": spec.branches, "contracts": contracts}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from bench.run import parse_scale
+
+    parser = argparse.ArgumentParser(prog="python -m bench.generator", description="Генерация тестового портфеля")
+    parser.add_argument("--db", required=True, help="файл БД (будет дополнен)")
+    parser.add_argument("--applications", default="10k", help="число заявок: 10k, 1m, ...")
+    parser.add_argument("--branches", type=int, default=100)
+    parser.add_argument("--clients", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    spec = PortfolioSpec(
+        applications=parse_scale(args.applications), branches=args.branches, clients=args.clients, seed=args.seed,
+    )
+    t = time.perf_counter()
+    counts = generate(Path(args.db), spec)
+    print(f"{counts} за {time.perf_counter() - t:.1f} с", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
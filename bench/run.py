@@ -0,0 +1,254 @@
+"""
+Замеры производительности слоя БД, сервиса и списка задач: python -m bench ...
+
+Для каждого масштаба БД наполняется один раз (bench/generator.py) и кэшируется в --data-dir;
+замеры идут на копии, поэтому действия сервиса не портят исходные данные.
+Результат — JSON; --compare сравнивает его с прошлым запуском и возвращает 1 при регрессии.
+"""
+import argparse
+import json
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from bench.generator import PortfolioSpec, generate
+from core import audit, db, pricing, repository
+from core.actions import Action
+from core.enums import ApplicationStatus, Role
+from core.models import DEFAULT_USERS, User
+from core.permissions import ACTION_ROLES
+from core.services import InsuranceService
+from core.workflow import ALLOWED_ACTIONS
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_SCALES = ["10k"]
+
+
+def parse_scale(text: str) -> int:
+    text = text.strip().lower().replace("_", "")
+    mult = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * mult)
+
+
+def _stats(samples: List[float]) -> Dict[str, float]:
+    ms = sorted(s * 1000.0 for s in samples)
+    return {
+        "n": len(ms),
+        "min_ms": round(ms[0], 4),
+        "mean_ms": round(statistics.fmean(ms), 4),
+        "p50_ms": round(ms[len(ms) // 2], 4),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 4),
+        "max_ms": round(ms[-1], 4),
+    }
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    return samples
+
+
+# -------------------------
+# Scenarios
+# -------------------------
+
+def _cold_start(path: Path, repeat: int) -> List[float]:
+    # отдельный процесс: импорт core.db + пул + db_init, как при запуске приложения
+    code = (
+        "import sys, time; t = time.perf_counter(); sys.path.insert(0, sys.argv[1]);"
+        "from core import db; db.DB_PATH = sys.argv[2]; db.db_init(); print(time.perf_counter() - t)"
+    )
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code, str(ROOT), str(path)], check=True, capture_output=True, text=True)
+        samples.append(float(out.stdout.strip()))
+    return samples
+
+
+def _worklist_users() -> List[User]:
+    users = []
+    for u in DEFAULT_USERS:
+        # у сгенерированных заявок клиенты client0..clientN
+        users.append(User(u.id, "client1", u.role) if u.role == Role.CLIENT else u)
+    return users
+
+
+def _action_data(action: Action, rng: random.Random, branch_id: int) -> Dict[str, Any]:
+    if action == Action.ASSESS_RISK:
+        return {"risk_percent": rng.randint(0, 100), "insurance_type_id": 1}
+    if action == Action.APPROVE:
+        return {"insurance_sum": rng.randrange(100_000, 1_000_000, 1000), "tariff_rate": 2.5}
+    if action == Action.PREPARE_CONTRACT:
+        return {"branch_id": branch_id, "draft_text": "Проект договора"}
+    return {}
+
+
+def run_scale(applications: int, args) -> Dict[str, Any]:
+    data_dir = Path(args.data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    seeded = data_dir / f"seed-{applications}-{args.seed}.db"
+    work = data_dir / f"work-{applications}.db"
+
+    seed_seconds = None
+    if args.reseed or not seeded.exists():
+        seeded.unlink(missing_ok=True)
+        db.close_pool()
+        t = time.perf_counter()
+        generate(seeded, PortfolioSpec(applications=applications, seed=args.seed))
+        seed_seconds = round(time.perf_counter() - t, 3)
+        db.close_pool()
+
+    shutil.copyfile(seeded, work)
+    db.archive_path(work).unlink(missing_ok=True)   # архив прошлого запуска к свежей копии не относится
+    db.DB_PATH = work
+    db.db_init()
+
+    rng = random.Random(args.seed)
+    results: Dict[str, Dict[str, float]] = {}
+
+    results["db_init.cold_start"] = _stats(_cold_start(work, args.cold_repeat))
+    empty = data_dir / "empty.db"
+    empty.unlink(missing_ok=True)
+    results["db_init.new_database"] = _stats(_cold_start(empty, 1))
+    empty.unlink(missing_ok=True)
+    db.archive_path(empty).unlink(missing_ok=True)
+
+    results["db.list_applications"] = _stats(_time(db.list_applications, args.list_repeat))
+
+    max_id = max(1, applications)
+    results["db.get_application"] = _stats(_time(lambda: db.get_application(rng.randint(1, max_id)), args.repeat))
+    results["db.get_application_detail"] = _stats(
+        _time(lambda: db.get_application_detail(rng.randint(1, max_id)), args.repeat)
+    )
+    results["repository.get_application_detail"] = _stats(
+        _time(lambda: repository.get_application_detail(rng.randint(1, max_id)), args.repeat)
+    )
+
+    # обновление списка задач в главном окне: первая страница + счётчик
+    for user in _worklist_users():
+        def refresh(u=user):
+            db.list_worklist(u.role, u.name, 200)
+            db.count_worklist(u.role, u.name)
+        results[f"worklist.refresh.{user.role.name}"] = _stats(_time(refresh, args.repeat))
+
+    def scroll(u=DEFAULT_USERS[3]):  # юрист: длинный список, 10 страниц подряд
+        after = None
+        for _ in range(10):
+            page = db.list_worklist(u.role, u.name, 200, sort="updated_at", after=after)
+            if not page:
+                break
+            after = (page[-1]["sort_key"], page[-1]["id"])
+    results["worklist.scroll_10_pages"] = _stats(_time(scroll, max(1, args.repeat // 10)))
+
+    # пересчёт тарифов всех одобренных заявок без записи (векторный расчёт; нужен numpy)
+    table = pricing.TariffTable(
+        {int(t["id"]): 2.0 + int(t["id"]) / 10 for t in db.list_insurance_types(active_only=False)},
+        [(0, 0.9), (50, 1.2), (80, 1.6)],
+    )
+    try:
+        results["pricing.reprice_dry_run.APPROVED"] = _stats(_time(
+            lambda: pricing.reprice(table, ApplicationStatus.APPROVED, dry_run=True), max(1, args.list_repeat)
+        ))
+    except ImportError as e:
+        print(f"bench: пропущен pricing.reprice_dry_run — {e}", file=sys.stderr)
+
+    # действия сервиса: для каждого — заявки в подходящем статусе
+    service = InsuranceService()
+    branches = db.list_approved_branches()
+    branch_id = int(branches[0]["id"]) if branches else 0
+    for action in Action:
+        status = next(s for s, actions in ALLOWED_ACTIONS.items() if action in actions)
+        role = next(iter(ACTION_ROLES[action]))
+        user = next(u for u in DEFAULT_USERS if u.role == role)
+        candidates = [r["id"] for r in db.list_applications_page(status=status, limit=args.action_repeat)]
+        samples = []
+        for app_id in candidates:
+            data = _action_data(action, rng, branch_id)
+            t = time.perf_counter()
+            service.perform_action(app_id, action, user, data=data)
+            samples.append(time.perf_counter() - t)
+        if samples:
+            results[f"service.perform_action.{action.name}"] = _stats(samples)
+
+    audit.flush()
+    db.close_pool()
+    work.unlink(missing_ok=True)
+    db.archive_path(work).unlink(missing_ok=True)
+    return {"applications": applications, "seed_seconds": seed_seconds, "results": results}
+
+
+# -------------------------
+# Comparison
+# -------------------------
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Список регрессий: p50 вырос больше чем в threshold раз."""
+    regressions = []
+    for scale, run in current["scales"].items():
+        base_run = baseline.get("scales", {}).get(scale)
+        if not base_run:
+            continue
+        for name, stats in run["results"].items():
+            base = base_run["results"].get(name)
+            if not base or base["p50_ms"] <= 0:
+                continue
+            ratio = stats["p50_ms"] / base["p50_ms"]
+            line = f"{scale:>8} {name:<45} {base['p50_ms']:>10.3f} -> {stats['p50_ms']:>10.3f} ms  x{ratio:.2f}"
+            print(line)
+            if ratio > threshold:
+                regressions.append(line)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Замеры производительности")
+    parser.add_argument("--scale", action="append", help="число заявок: 10k, 100k, 1m (можно повторять)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default="bench_data", help="где хранить наполненные БД")
+    parser.add_argument("--reseed", action="store_true", help="наполнить БД заново")
+    parser.add_argument("--repeat", type=int, default=200, help="повторов для точечных запросов")
+    parser.add_argument("--list-repeat", type=int, default=5, help="повторов для db.list_applications")
+    parser.add_argument("--action-repeat", type=int, default=50, help="заявок на каждое действие сервиса")
+    parser.add_argument("--cold-repeat", type=int, default=5)
+    parser.add_argument("--out", default="-", help="файл для JSON (по умолчанию stdout)")
+    parser.add_argument("--compare", help="JSON прошлого запуска")
+    parser.add_argument("--threshold", type=float, default=1.25, help="допустимый рост p50 при --compare")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": args.seed,
+        },
+        "scales": {},
+    }
+    for scale in args.scale or DEFAULT_SCALES:
+        report["scales"][scale] = run_scale(parse_scale(scale), args)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        Path(args.out).write_text(text, encoding="utf-8")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"Регрессий: {len(regressions)}", file=sys.stderr)
+            return 1
+    return 0
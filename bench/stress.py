@@ -0,0 +1,245 @@
+"""
+Нагрузочная проверка совместного доступа: python -m bench.stress --processes 8 --seconds 20
+
+Несколько процессов одновременно работают с одним файлом БД: читают списки задач и карточки,
+создают заявки и переводят их по статусам через InsuranceService. Для каждого режима журнала
+(--journal DELETE / WAL) БД наполняется заново. Итог — пропускная способность, задержки,
+число конфликтов (заявку уже обработал другой процесс — это нормально), ошибок «database is locked»
+и проверка целостности (включая сводку портфеля). Код возврата 1 — если были блокировки, прочие ошибки
+или данные несогласованы.
+"""
+import argparse
+import json
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from bench.generator import PortfolioSpec, generate
+from bench.run import _action_data, _stats
+from core import audit, db
+from core.enums import ApplicationStatus, Role
+from core.models import DEFAULT_USERS, User
+from core.permissions import ACTION_ROLES
+from core.services import InsuranceService
+from core.workflow import ALLOWED_ACTIONS
+
+START_DELAY_S = 3.0   # запас на запуск процессов: нагрузка начинается у всех одновременно
+CANDIDATES = 50       # из скольких первых заявок статуса выбирать — чем меньше, тем больше столкновений
+
+_CONTRACT_STATUSES = [
+    ApplicationStatus.CONTRACT_PREPARED, ApplicationStatus.CLIENT_SIGNED,
+    ApplicationStatus.DIRECTOR_SIGNED, ApplicationStatus.ARCHIVED,
+]
+
+
+# -------------------------
+# Worker process
+# -------------------------
+
+def _transition(service: InsuranceService, rng: random.Random, branch_id: int):
+    status = rng.choice([s for s, actions in ALLOWED_ACTIONS.items() if actions])
+    rows = db.list_applications_page(status=status, limit=CANDIDATES)
+    if not rows:
+        return False
+    row = rng.choice(rows)
+    action = rng.choice(sorted(ALLOWED_ACTIONS[status], key=lambda a: a.name))
+    role = next(iter(ACTION_ROLES[action]))
+    user = next(u for u in DEFAULT_USERS if u.role == role)
+    if role == Role.CLIENT:
+        user = User(user.id, row["client_name"], role)
+    # статус из прочитанного списка: если заявку успел перевести другой процесс — db.ConcurrentUpdateError
+    service.perform_action(
+        int(row["id"]), action, user, data=_action_data(action, rng, branch_id), expected_status=status
+    )
+    return True
+
+
+def _worker(job: Dict[str, Any]) -> Dict[str, Any]:
+    db.DB_PATH = Path(job["path"])
+    db.configure(
+        journal_mode=job["journal"],
+        busy_timeout_ms=job["busy_timeout_ms"],
+        busy_retries=job["retries"],
+        pool_size=2,
+    )
+    db.db_init()   # как при запуске приложения: здесь же включается режим журнала (с повтором при блокировке)
+    rng = random.Random(job["seed"])
+    service = InsuranceService()
+    branches = db.list_approved_branches()
+    branch_id = int(branches[0]["id"]) if branches else 0
+    max_id = max(1, job["applications"])
+    users = list(DEFAULT_USERS)
+
+    counts = {"reads": 0, "transitions": 0, "creates": 0, "conflicts": 0, "locked": 0, "errors": 0}
+    read_samples: List[float] = []
+    write_samples: List[float] = []
+    errors: List[str] = []
+
+    time.sleep(max(0.0, job["start_at"] - time.time()))
+    deadline = time.monotonic() + job["seconds"]
+    while time.monotonic() < deadline:
+        is_write = rng.random() < job["write_share"]
+        t = time.perf_counter()
+        try:
+            if not is_write:
+                if rng.random() < 0.5:
+                    user = rng.choice(users)
+                    db.list_worklist(user.role, user.name, 200)
+                    db.count_worklist(user.role, user.name)
+                else:
+                    db.get_application_detail(rng.randint(1, max_id))
+                counts["reads"] += 1
+            elif rng.random() < 0.2:
+                db.create_application(
+                    f"stress{job['worker']}", client_fio="Нагрузочный тест",
+                    insured_object="Объект", request_text="Заявка нагрузочного теста",
+                )
+                counts["creates"] += 1
+            elif _transition(service, rng, branch_id):
+                counts["transitions"] += 1
+        except sqlite3.OperationalError as e:
+            if not db.is_busy_error(e):
+                raise
+            counts["locked"] += 1
+            continue
+        except db.ConcurrentUpdateError:
+            # статус заявки уже сменил другой процесс — ожидаемый конфликт; прочие ValueError — ошибки
+            counts["conflicts"] += 1
+            continue
+        except Exception as e:
+            counts["errors"] += 1
+            if len(errors) < 5:
+                errors.append(f"{type(e).__name__}: {e}")
+            continue
+        (write_samples if is_write else read_samples).append(time.perf_counter() - t)
+
+    audit.flush()
+    db.close_pool()
+    return {"counts": counts, "reads": read_samples, "writes": write_samples,
+            "retry": db.retry_stats(), "errors": errors}
+
+
+# -------------------------
+# Runs
+# -------------------------
+
+def _verify(path: Path) -> Dict[str, Any]:
+    conn = sqlite3.connect(path)
+    try:
+        integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        statuses = ", ".join("?" * len(_CONTRACT_STATUSES))
+        without_contract = conn.execute(
+            f"""
+            SELECT COUNT(*) FROM applications a
+            LEFT JOIN contracts c ON c.application_id = a.id
+            WHERE a.status IN ({statuses}) AND c.id IS NULL
+            """,
+            [s.name for s in _CONTRACT_STATUSES],
+        ).fetchone()[0]
+    finally:
+        conn.close()
+    db.DB_PATH = path
+    summary_problems = len(db.verify_portfolio_summary())
+    db.close_pool()
+    return {"integrity": integrity, "applications_without_contract": int(without_contract),
+            "summary_problems": summary_problems}
+
+
+def run_mode(journal: str, seeded: Path, work: Path, args) -> Dict[str, Any]:
+    shutil.copyfile(seeded, work)
+    for suffix in ("-wal", "-shm"):
+        Path(f"{work}{suffix}").unlink(missing_ok=True)
+    db.archive_path(work).unlink(missing_ok=True)
+
+    start_at = time.time() + START_DELAY_S
+    jobs = [
+        {
+            "worker": n, "path": str(work), "journal": journal, "seed": args.seed * 1000 + n,
+            "seconds": args.seconds, "start_at": start_at, "write_share": args.write_share,
+            "busy_timeout_ms": args.busy_timeout_ms, "retries": args.retries,
+            "applications": args.applications,
+        }
+        for n in range(args.processes)
+    ]
+    with ProcessPoolExecutor(max_workers=args.processes, mp_context=get_context("spawn")) as pool:
+        outcomes = list(pool.map(_worker, jobs))
+
+    counts = {k: sum(o["counts"][k] for o in outcomes) for k in outcomes[0]["counts"]}
+    reads = [s for o in outcomes for s in o["reads"]]
+    writes = [s for o in outcomes for s in o["writes"]]
+    ops = counts["reads"] + counts["transitions"] + counts["creates"]
+    return {
+        "journal": journal,
+        "processes": args.processes,
+        "seconds": args.seconds,
+        "ops_per_s": round(ops / args.seconds, 1),
+        "counts": counts,
+        "retries": sum(o["retry"]["retries"] for o in outcomes),
+        "retries_exhausted": sum(o["retry"]["exhausted"] for o in outcomes),
+        "read_latency": _stats(reads) if reads else None,
+        "write_latency": _stats(writes) if writes else None,
+        "errors": [e for o in outcomes for e in o["errors"]][:10],
+        "verify": _verify(work),
+    }
+
+
+def _print_summary(run: Dict[str, Any]):
+    c = run["counts"]
+    print(
+        f"{run['journal']:<8} {run['ops_per_s']:>9.1f} оп/с  чтений {c['reads']}, переходов {c['transitions']}, "
+        f"создано {c['creates']}, конфликтов {c['conflicts']}, блокировок {c['locked']}, ошибок {c['errors']}, "
+        f"повторов {run['retries']}",
+        file=sys.stderr,
+    )
+    for name in ("read_latency", "write_latency"):
+        st = run[name]
+        if st:
+            print(f"{'':<8} {name:<14} p50 {st['p50_ms']:.2f} мс, p95 {st['p95_ms']:.2f} мс, max {st['max_ms']:.2f} мс",
+                  file=sys.stderr)
+    v = run["verify"]
+    print(f"{'':<8} integrity_check: {v['integrity']}, заявок без договора: {v['applications_without_contract']}, "
+          f"расхождений сводки портфеля: {v['summary_problems']}", file=sys.stderr)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.stress", description="Нагрузка из нескольких процессов")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--applications", type=int, default=5000, help="размер исходной БД")
+    parser.add_argument("--journal", action="append", choices=["DELETE", "WAL"],
+                        help="режим журнала (можно повторять для сравнения); по умолчанию WAL")
+    parser.add_argument("--write-share", type=float, default=0.3, help="доля операций записи")
+    parser.add_argument("--busy-timeout-ms", type=int, default=5000)
+    parser.add_argument("--retries", type=int, default=5, help="повторов при блокировке (0 — без повторов)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="файл для JSON-отчёта")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="insurance-stress-") as tmp:
+        seeded = Path(tmp) / "seed.db"
+        generate(seeded, PortfolioSpec(applications=args.applications, seed=args.seed))
+        runs = [run_mode(journal, seeded, Path(tmp) / f"work-{journal}.db", args) for journal in args.journal or ["WAL"]]
+
+    for run in runs:
+        _print_summary(run)
+    if args.out:
+        Path(args.out).write_text(json.dumps({"runs": runs}, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    failed = any(
+        r["counts"]["locked"] or r["counts"]["errors"]
+        or r["verify"]["integrity"] != "ok" or r["verify"]["applications_without_contract"]
+        or r["verify"]["summary_problems"]
+        for r in runs
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
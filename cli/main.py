@@ -0,0 +1,599 @@
+"""
+Консольный интерфейс для пакетных операций: python -m cli <команда> ...
+
+Работает с той же БД и теми же правилами (InsuranceService), что и окно,
+но не импортирует PyQt5 — подходит для cron и серверов без дисплея.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from core import archive, audit, db, export, pricing, profiling
+from core.actions import Action
+from core.enums import ApplicationStatus, Role
+from core.models import DEFAULT_USERS, User
+from core.services import InsuranceService
+from core.storage import storage
+
+EXPORT_COLUMNS = ["id", "client_name", "client_fio", "insured_object", "status", "insurance_sum", "updated_at"]
+IMPORT_COLUMNS = ["client_name", "client_fio", "insured_object", "request_text"]
+IMPORT_BATCH = 1000
+
+
+EXIT_CONFLICT = 3   # заявку уже обработал другой пользователь (db.ConcurrentUpdateError)
+
+
+class CliError(Exception):
+    """Ошибка в аргументах или входных данных: печатается без трассировки, код выхода 2."""
+
+
+# -------------------------
+# Helpers
+# -------------------------
+
+def _resolve_user(spec: str) -> User:
+    """
+    Пользователь по имени из DEFAULT_USERS ("Ольга") или по роли ("UNDERWRITER");
+    "CLIENT:Пётр" — роль с произвольным именем (для клиента имя определяет его заявки).
+    """
+    role_name, _, name = spec.partition(":")
+    for u in DEFAULT_USERS:
+        if not name and u.name == spec:
+            return u
+    try:
+        role = Role[role_name.upper()]
+    except KeyError:
+        raise CliError(f"Неизвестный пользователь или роль: {spec}")
+    if name:
+        return User(0, name, role)
+    return next(u for u in DEFAULT_USERS if u.role == role)
+
+
+def _parse_action(name: str) -> Action:
+    try:
+        return Action[name.upper()]
+    except KeyError:
+        raise CliError(f"Неизвестное действие: {name} (допустимо: {', '.join(a.name for a in Action)})")
+
+
+def _parse_status(name: Optional[str]) -> Optional[ApplicationStatus]:
+    if name is None:
+        return None
+    try:
+        return ApplicationStatus[name.upper()]
+    except KeyError:
+        raise CliError(f"Неизвестный статус: {name}")
+
+
+def _scalar(value: str) -> Any:
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _action_data(args) -> Dict[str, Any]:
+    data: Dict[str, Any] = {}
+    if args.data:
+        try:
+            data.update(json.loads(args.data))
+        except ValueError as e:
+            raise CliError(f"--data: некорректный JSON ({e})")
+    for item in args.set or []:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise CliError(f"--set ожидает key=value, получено: {item}")
+        data[key.strip()] = _scalar(value.strip())
+    return data
+
+
+def _print_rows(rows: List[Dict[str, Any]], columns: List[str], as_json: bool):
+    if as_json:
+        for r in rows:
+            print(json.dumps({c: r.get(c) for c in columns}, ensure_ascii=False))
+        return
+    for r in rows:
+        print("\t".join("" if r.get(c) is None else str(r.get(c)) for c in columns))
+
+
+def _read_import(path: Path) -> Iterator[tuple]:
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".jsonl":
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            records = csv.DictReader(f)
+        for n, rec in enumerate(records, start=1):
+            missing = [c for c in IMPORT_COLUMNS if not str(rec.get(c) or "").strip()]
+            if missing:
+                raise CliError(f"{path}: запись {n}: не заполнены поля {', '.join(missing)}")
+            yield tuple(str(rec[c]).strip() for c in IMPORT_COLUMNS)
+
+
+# -------------------------
+# Commands
+# -------------------------
+
+def cmd_create(args) -> int:
+    user = _resolve_user(args.user)
+    if user.role != Role.CLIENT:
+        raise CliError("Создать заявку может только клиент.")
+    new_id = db.create_application(user.name, client_fio=args.fio, insured_object=args.object, request_text=args.text)
+    storage.log(f"Клиент '{user.name}' создал заявку #{new_id}", application_id=new_id)
+    audit.record(user.name, user.role.name, "CREATE_APPLICATION", "application", new_id,
+                 {"client_fio": args.fio, "insured_object": args.object, "cli": True})
+    print(new_id)
+    return 0
+
+
+def cmd_list(args) -> int:
+    if args.user:
+        user = _resolve_user(args.user)
+        rows = db.list_worklist(user.role, user.name, args.limit, sort=args.sort)
+    else:
+        rows = db.list_applications_page(status=_parse_status(args.status), limit=args.limit)
+    _print_rows(rows, EXPORT_COLUMNS, args.json)
+    return 0
+
+
+def cmd_search(args) -> int:
+    if args.rebuild:
+        db.rebuild_search_index()
+        print("Полнотекстовый индекс перестроен", file=sys.stderr)
+    if not args.text:
+        if args.rebuild:
+            return 0
+        raise CliError("Укажите текст для поиска.")
+    client_name = None
+    if args.user:
+        user = _resolve_user(args.user)
+        client_name = user.name if user.role == Role.CLIENT else None
+    rows = db.search_applications(args.text, client_name=client_name, limit=args.limit)
+    _print_rows(rows, EXPORT_COLUMNS, args.json)
+    return 0
+
+
+def cmd_act(args) -> int:
+    user = _resolve_user(args.user)
+    action = _parse_action(args.action)
+    InsuranceService().perform_action(
+        args.application_id, action, user, data=_action_data(args), expected_status=_parse_status(args.expect_status)
+    )
+    print(f"#{args.application_id}: {action.name} — выполнено")
+    return 0
+
+
+def cmd_bulk_act(args) -> int:
+    user = _resolve_user(args.user)
+    action = _parse_action(args.action)
+    data = _action_data(args)
+
+    # статусы, которые видел оператор: из --expect-status для всех заявок или из строк списка задач
+    expect_all = _parse_status(args.expect_status)
+    expected: Dict[int, ApplicationStatus] = {}
+    ids: List[int] = []
+    for part in args.ids or []:
+        ids.extend(int(x) for x in part.split(",") if x.strip())
+    if args.ids_file:
+        with open(args.ids_file, encoding="utf-8") as f:
+            ids.extend(int(line) for line in f if line.strip())
+    if args.from_worklist:
+        after = None
+        while True:
+            page = db.list_worklist(user.role, user.name, 1000, after=after)
+            ids.extend(int(r["id"]) for r in page)
+            expected.update((int(r["id"]), ApplicationStatus[r["status"]]) for r in page)
+            if len(page) < 1000:
+                break
+            after = (page[-1]["sort_key"], page[-1]["id"])
+    if not ids:
+        raise CliError("Не заданы заявки (--ids, --ids-file или --from-worklist).")
+
+    if expect_all is not None:
+        expected = dict.fromkeys(ids, expect_all)
+
+    results = InsuranceService().perform_actions_bulk(
+        [(i, action, data) for i in ids], user, chunk_size=args.chunk_size, expected_statuses=expected
+    )
+    conflicts = [r for r in results if r.conflict]
+    failed = [r for r in results if not r.ok and not r.conflict]
+    for r in conflicts:
+        print(f"#{r.application_id}: конфликт — {r.error}", file=sys.stderr)
+    for r in failed:
+        print(f"#{r.application_id}: {r.error}", file=sys.stderr)
+    print(f"Выполнено: {sum(r.ok for r in results)} из {len(results)}, конфликтов: {len(conflicts)}")
+    if failed:
+        return 1
+    return EXIT_CONFLICT if conflicts else 0
+
+
+def cmd_import(args) -> int:
+    path = Path(args.file)
+    total = 0
+    batch: List[tuple] = []
+    for row in _read_import(path):
+        batch.append(row)
+        if len(batch) >= IMPORT_BATCH:
+            total += db.create_applications(batch)
+            batch = []
+    if batch:
+        total += db.create_applications(batch)
+    audit.record(args.actor, "CLI", "IMPORT_APPLICATIONS", "application", None, {"file": str(path), "count": total})
+    print(f"Импортировано заявок: {total}")
+    return 0
+
+
+def cmd_export(args) -> int:
+    status = args.status
+    if status is not None:
+        status = status.lower() if args.entity == "contracts" else status.upper()
+    filters = export.ExportFilters(
+        status=status, branch_id=args.branch, date_column=args.date_field,
+        since=args.since, until=args.until, include_archive=not args.no_archive,
+    )
+    columns = [c.strip() for c in args.columns.split(",") if c.strip()] if args.columns else None
+    to_stdout = args.file == "-"
+    try:
+        report = export.export(
+            args.entity, None if to_stdout else Path(args.file),
+            fmt=args.format, columns=columns, filters=filters,
+            segment_rows=args.segment_rows, resume=args.resume,
+            stream=sys.stdout if to_stdout else None,
+            user=_resolve_user(args.user),
+        )
+    except ImportError as e:
+        raise CliError(str(e))
+
+    if args.json:
+        print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2), file=sys.stderr if to_stdout else sys.stdout)
+        return 0
+    resumed = f", продолжено после id {report.resumed_after_id}" if report.resumed_after_id is not None else ""
+    print(f"Выгружено ({report.entity}, {report.format}): {report.rows}{resumed}", file=sys.stderr)
+    if report.skipped_columns:
+        print(f"  в npz не записаны текстовые колонки: {', '.join(report.skipped_columns)}", file=sys.stderr)
+    result = report.to_dict()
+    print(f"  {result['seconds']} с ({result['rows_per_s']} строк/с, сегментов {report.segments})", file=sys.stderr)
+    return 0
+
+
+def _parse_pairs(items: Optional[List[str]], option: str) -> Dict[int, float]:
+    pairs = {}
+    for item in items or []:
+        key, _, value = item.partition("=")
+        try:
+            pairs[int(key)] = float(value.replace(",", "."))
+        except ValueError:
+            raise CliError(f"{option}: ожидалось ЧИСЛО=ЧИСЛО, получено {item!r}")
+    return pairs
+
+
+def cmd_reprice(args) -> int:
+    status = _parse_status(args.status)
+    data: Dict[str, Any] = {}
+    if args.rates:
+        try:
+            data = json.loads(Path(args.rates).read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            raise CliError(f"Не удалось прочитать тарифную таблицу {args.rates}: {e}")
+        if not isinstance(data, dict):
+            raise CliError(f"Тарифная таблица {args.rates} должна быть JSON-объектом")
+    # ставки и полосы из командной строки дополняют (и перекрывают) файл
+    data["base_rates"] = {**data.get("base_rates", {}), **_parse_pairs(args.base, "--base")}
+    try:
+        bands = dict(data.get("risk_bands", [(0, 1.0)]))
+    except (TypeError, ValueError):
+        raise CliError("risk_bands в тарифной таблице — список пар [риск, множитель]")
+    bands.update(_parse_pairs(args.band, "--band"))
+    data["risk_bands"] = sorted(bands.items())
+    for key in ("min_rate", "max_rate"):
+        if getattr(args, key) is not None:
+            data[key] = getattr(args, key)
+    if not data["base_rates"]:
+        raise CliError("Нужны базовые ставки: --rates файл.json или --base ВИД=СТАВКА")
+
+    try:
+        table = pricing.TariffTable.from_dict(data)
+    except ValueError as e:
+        raise CliError(str(e))
+
+    try:
+        report = pricing.reprice(
+            table, status,
+            insurance_type_id=args.type, dry_run=args.dry_run,
+            chunk_size=args.chunk_size, user=_resolve_user(args.user),
+        )
+    except ImportError as e:
+        raise CliError(str(e))
+
+    result = report.to_dict()
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 0
+    mode = "Проверка (без записи)" if report.dry_run else "Пересчёт выполнен"
+    print(f"{mode}: {report.status}" + (f", вид {report.insurance_type_id}" if report.insurance_type_id else ""))
+    print(f"  просмотрено {report.scanned}, изменится {report.changed}, без ставки в таблице {report.no_rate}")
+    print(f"  тарифы изменённых заявок: {result['tariff_before']:.2f} -> {result['tariff_after']:.2f} "
+          f"(разница {result['delta']:+.2f})")
+    for type_id, t in result["by_type"].items():
+        print(f"  вид {type_id:>3}: {int(t['changed']):>9} заявок, {t['tariff_before']:>16.2f} -> {t['tariff_after']:>16.2f}")
+    for sample in result["samples"][:args.samples]:
+        print(f"  #{sample['id']}: ставка {sample['tariff_rate'][0]} -> {sample['tariff_rate'][1]}, "
+              f"тариф {sample['tariff_amount'][0]} -> {sample['tariff_amount'][1]}")
+    print(f"  {result['seconds']} с ({result['rows_per_s']} строк/с, расчёт {result['compute_seconds']} с)",
+          file=sys.stderr)
+    return 0
+
+
+def cmd_archive(args) -> int:
+    if args.stats:
+        counts = db.archive_status_counts()
+        if args.json:
+            print(json.dumps({"path": str(db.archive_path()), "by_status": counts}, ensure_ascii=False))
+            return 0
+        print(f"Архивная БД: {db.archive_path()}")
+        for status, n in sorted(counts.items()):
+            print(f"  {status:<20} {n:>9}")
+        print(f"  {'всего':<20} {sum(counts.values()):>9}")
+        return 0
+
+    report = archive.archive_terminal(
+        older_than_days=args.older_than_days, dry_run=args.dry_run,
+        chunk_size=args.chunk_size, user=_resolve_user(args.user),
+    )
+    result = report.to_dict()
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 0
+    mode = "Проверка (без переноса)" if report.dry_run else "Перенос выполнен"
+    print(f"{mode}: заявок, завершённых до {report.before}: {report.moved}")
+    for status, n in result["by_status"].items():
+        print(f"  {status:<20} {n:>9}")
+    print(f"  {result['seconds']} с ({result['rows_per_s']} строк/с, порций {report.chunks})", file=sys.stderr)
+    return 0
+
+
+def cmd_profile(args) -> int:
+    if args.file:
+        try:
+            data = json.loads(Path(args.file).read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            raise CliError(f"Не удалось прочитать отчёт {args.file}: {e}")
+    else:
+        data = profiling.report()
+    if args.json:
+        print(json.dumps(data, ensure_ascii=False, indent=2))
+    else:
+        print(profiling.format_report(data, limit=args.limit))
+    return 0
+
+
+def cmd_stats(args) -> int:
+    stats = {
+        "applications": db.application_status_counts(),
+        "branches": db.branch_status_counts(),
+        "worklists": {
+            u.role.name: db.count_worklist(u.role, u.name) for u in DEFAULT_USERS
+        },
+    }
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+        return 0
+    print("Заявки по статусам:")
+    for s in ApplicationStatus:
+        print(f"  {s.name:<18} {stats['applications'].get(s.name, 0)}")
+    print("Филиалы по статусам:")
+    for name, count in sorted(stats["branches"].items()):
+        print(f"  {name:<18} {count}")
+    print("Задачи по ролям (демо-пользователи):")
+    for name, count in stats["worklists"].items():
+        print(f"  {name:<18} {count}")
+    return 0
+
+
+_SUMMARY_KEYS = {
+    "branch": lambda r: r["branch_name"] or "(без договора)",
+    "type": lambda r: r["insurance_type_name"] or "(вид не выбран)",
+    "status": lambda r: r["status"],
+}
+
+
+def cmd_summary(args) -> int:
+    if args.rebuild:
+        db.rebuild_portfolio_summary()
+        print("Сводка портфеля пересчитана", file=sys.stderr)
+    if args.verify or args.rebuild:
+        problems = db.verify_portfolio_summary()
+        if problems:
+            for p in problems:
+                print(
+                    f"Расхождение: филиал {p['branch_id']}, вид {p['insurance_type_id']}, {p['status']}: "
+                    f"ожидалось {p['expected']}, в сводке {p['actual']}",
+                    file=sys.stderr,
+                )
+            print(f"Сводка портфеля не совпадает с заявками ({len(problems)}); исправить: summary --rebuild",
+                  file=sys.stderr)
+            return 1
+        print("Сводка портфеля совпадает с заявками", file=sys.stderr)
+        if args.verify:
+            return 0
+
+    by = args.by or ["branch"]
+    totals: Dict[tuple, Dict[str, float]] = {}
+    for row in db.portfolio_summary(director=args.director):
+        key = tuple(_SUMMARY_KEYS[k](row) for k in by)
+        t = totals.setdefault(key, {"applications": 0, "insurance_sum": 0.0, "tariff_amount": 0.0})
+        for field in t:
+            t[field] += row[field]
+
+    if args.json:
+        for key, t in sorted(totals.items()):
+            print(json.dumps({**dict(zip(by, key)), **t}, ensure_ascii=False))
+        return 0
+    for key, t in sorted(totals.items()):
+        label = " / ".join(key)
+        print(f"{label:<60} {t['applications']:>9} {t['insurance_sum']:>18.2f} {t['tariff_amount']:>15.2f}")
+    return 0
+
+
+# -------------------------
+# Entry point
+# -------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Пакетные операции со страховыми заявками")
+    parser.add_argument("--db", help=f"файл БД (по умолчанию {db.DB_PATH})")
+    parser.add_argument("--wal", action="store_true",
+                        help=f"режим WAL для совместной работы нескольких процессов (как {db.ENV_JOURNAL_MODE}=WAL)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"профилировать команду и вывести отчёт в stderr (как {profiling.ENV_ENABLE}=1)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("create", help="создать заявку от имени клиента")
+    p.add_argument("--user", default="CLIENT", help="клиент: имя, CLIENT или CLIENT:<имя>")
+    p.add_argument("--fio", required=True)
+    p.add_argument("--object", required=True)
+    p.add_argument("--text", required=True)
+    p.set_defaults(func=cmd_create)
+
+    p = sub.add_parser("list", help="заявки: все или задачи пользователя")
+    p.add_argument("--user", help="показать задачи пользователя (имя или роль)")
+    p.add_argument("--status", help="фильтр по статусу (без --user)")
+    p.add_argument("--sort", default="id", choices=sorted(db.WORKLIST_SORTS))
+    p.add_argument("--limit", type=int, default=200)
+    p.add_argument("--json", action="store_true", help="вывод в JSON Lines")
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("search", help="полнотекстовый поиск заявок (ФИО, объект, описание, проект договора)")
+    p.add_argument("text", nargs="?", help='слова через пробел; "фраза в кавычках"; слово* — по началу слова')
+    p.add_argument("--user", help="искать от имени пользователя (клиент видит только свои заявки)")
+    p.add_argument("--limit", type=int, default=50)
+    p.add_argument("--json", action="store_true", help="вывод в JSON Lines")
+    p.add_argument("--rebuild", action="store_true", help="перестроить полнотекстовый индекс")
+    p.set_defaults(func=cmd_search)
+
+    for name, func, help_text in (
+        ("act", cmd_act, "выполнить действие над заявкой"),
+        ("bulk-act", cmd_bulk_act, "выполнить действие над набором заявок"),
+    ):
+        p = sub.add_parser(name, help=help_text)
+        if name == "act":
+            p.add_argument("application_id", type=int)
+        p.add_argument("action", help=", ".join(a.name for a in Action))
+        p.add_argument("--user", required=True, help="имя, роль или РОЛЬ:<имя>")
+        p.add_argument("--data", help='данные действия в JSON, например {"risk_percent": 10}')
+        p.add_argument("--set", action="append", metavar="KEY=VALUE", help="поле данных действия (можно повторять)")
+        p.add_argument("--expect-status", metavar="STATUS",
+                       help=f"статус, в котором заявку видел оператор; если он изменился — конфликт, код {EXIT_CONFLICT}")
+        if name == "bulk-act":
+            p.add_argument("--ids", action="append", help="id через запятую")
+            p.add_argument("--ids-file", help="файл с id, по одному в строке")
+            p.add_argument("--from-worklist", action="store_true", help="все задачи пользователя")
+            p.add_argument("--chunk-size", type=int, default=500)
+        p.set_defaults(func=func)
+
+    p = sub.add_parser("import", help="загрузить заявки из CSV или JSONL")
+    p.add_argument("file", help=f"поля: {', '.join(IMPORT_COLUMNS)}")
+    p.add_argument("--actor", default="cli", help="кто выполняет импорт (для журнала действий)")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("export", help="выгрузить заявки, договоры или филиалы (CSV, JSONL, npz)")
+    p.add_argument("file", help="файл, каталог для npz или - для stdout")
+    p.add_argument("--entity", choices=export.ENTITIES, default="applications")
+    p.add_argument("--format", choices=export.FORMATS, default="csv",
+                   help="npz — каталог сжатых частей с числовыми колонками (нужен numpy)")
+    p.add_argument("--columns", help="колонки через запятую (по умолчанию — без длинных текстов)")
+    p.add_argument("--status", help="статус заявки, договора (prepared, ..., archived) или филиала")
+    p.add_argument("--branch", type=int, help="только договоры этого филиала (для заявок — по договору)")
+    p.add_argument("--since", help="с даты включительно (ISO)")
+    p.add_argument("--until", help="по дату не включительно (ISO)")
+    p.add_argument("--date-field", choices=db.EXPORT_DATE_COLUMNS, default="created_at")
+    p.add_argument("--no-archive", action="store_true", help="без заявок и договоров архивной БД")
+    p.add_argument("--resume", action="store_true", help="продолжить прерванную выгрузку с контрольной точки")
+    p.add_argument("--segment-rows", type=int, default=export.SEGMENT_ROWS,
+                   help="строк между контрольными точками")
+    p.add_argument("--user", default="ADMIN", help="кто выполняет выгрузку (администратор)")
+    p.add_argument("--json", action="store_true", help="итог в JSON")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("reprice", help="пересчитать тарифы сегмента заявок по тарифной таблице (нужен numpy)")
+    p.add_argument("status", help=", ".join(st.name for st in pricing.REPRICEABLE_STATUSES))
+    p.add_argument("--type", type=int, help="только этот вид страхования")
+    p.add_argument("--rates", help='JSON: {"base_rates": {"1": 2.5}, "risk_bands": [[0, 1.0], [50, 1.4]], ...}')
+    p.add_argument("--base", action="append", metavar="ВИД=СТАВКА", help="базовая ставка вида, %% (можно повторять)")
+    p.add_argument("--band", action="append", metavar="РИСК=МНОЖИТЕЛЬ",
+                   help="множитель для risk_percent от указанной границы (можно повторять)")
+    p.add_argument("--min-rate", type=float)
+    p.add_argument("--max-rate", type=float)
+    p.add_argument("--dry-run", action="store_true", help="только показать изменения")
+    p.add_argument("--chunk-size", type=int, default=pricing.CHUNK_SIZE)
+    p.add_argument("--user", default="ADMIN", help="кто выполняет пересчёт (администратор)")
+    p.add_argument("--samples", type=int, default=5, help="сколько изменений показать")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_reprice)
+
+    p = sub.add_parser("archive", help="перенести завершённые заявки (ARCHIVED, REJECTED) в архивную БД")
+    p.add_argument("--older-than-days", type=float, default=archive.OLDER_THAN_DAYS,
+                   help="только заявки, не менявшиеся столько дней")
+    p.add_argument("--dry-run", action="store_true", help="только посчитать")
+    p.add_argument("--chunk-size", type=int, default=archive.CHUNK_SIZE)
+    p.add_argument("--user", default="ADMIN", help="кто выполняет перенос (администратор)")
+    p.add_argument("--stats", action="store_true",
+                   help=f"показать содержимое архивной БД (файл задаёт {db.ENV_ARCHIVE})")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("profile", help="показать отчёт профилирования (файл из INSURANCE_PROFILE_DUMP)")
+    p.add_argument("file", nargs="?", help="JSON-отчёт; без файла — отчёт текущего процесса")
+    p.add_argument("--limit", type=int, default=40)
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_profile)
+
+    p = sub.add_parser("summary", help="итоги портфеля по филиалам, видам страхования и статусам")
+    p.add_argument("--by", action="append", choices=sorted(_SUMMARY_KEYS),
+                   help="группировка (можно повторять), по умолчанию по филиалу")
+    p.add_argument("--director", help="только филиалы этого директора")
+    p.add_argument("--json", action="store_true", help="вывод в JSON Lines")
+    p.add_argument("--verify", action="store_true", help="сверить сводку с полным пересчётом (код 1 при расхождении)")
+    p.add_argument("--rebuild", action="store_true", help="пересчитать сводку заново и сверить")
+    p.set_defaults(func=cmd_summary)
+
+    p = sub.add_parser("stats", help="сводка по заявкам, филиалам и задачам")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_stats)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.db:
+        db.DB_PATH = Path(args.db)
+    db.configure_from_env()
+    if args.wal:
+        db.configure(journal_mode="WAL")
+    profiling.enable_from_env(force=args.profile)
+    try:
+        db.db_init()
+        return args.func(args)
+    except CliError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+    except db.ConcurrentUpdateError as e:
+        print(f"Конфликт: {e}", file=sys.stderr)
+        return EXIT_CONFLICT
+    except (ValueError, PermissionError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # вывод оборвал получатель (например, | head) — это не ошибка
+        sys.stdout = open(os.devnull, "w")
+        return 0
+    finally:
+        audit.flush()
+        if args.profile:
+            print(profiling.format_report(), file=sys.stderr)
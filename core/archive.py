@@ -0,0 +1,91 @@
+"""
+Перенос завершённых заявок в архивную БД (горячие и холодные данные).
+
+Заявки в статусах ARCHIVED и REJECTED больше не обрабатываются, но остаются в applications/contracts
+и утяжеляют списки и индексы. archive_terminal переносит те из них, что не менялись
+older_than_days дней, вместе с договорами в архивную БД (db.archive_path(): файл создаёт первый
+перенос, к соединениям он подключается как archive). Перенос идёт порциями: каждая — одна транзакция,
+при блокировке БД она повторяется целиком. id сохраняются, карточки перенесённых заявок
+по-прежнему открываются (db.get_application, db.get_application_detail, db.get_contract_by_application),
+сводка портфеля их учитывает. Обратного переноса нет: завершённая заявка не меняется.
+"""
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from core import audit, db
+from core.enums import ApplicationStatus, Role
+
+CHUNK_SIZE = 5000          # заявок за транзакцию (и параметров в IN (...))
+MAX_CHUNK_SIZE = 10_000
+OLDER_THAN_DAYS = 30       # недавно завершённые заявки ещё открывают — их оставляем в основной БД
+
+TERMINAL_STATUSES = (ApplicationStatus.ARCHIVED, ApplicationStatus.REJECTED)
+
+
+@dataclass
+class ArchiveReport:
+    before: str
+    dry_run: bool
+    moved: int = 0
+    by_status: Dict[str, int] = field(default_factory=dict)
+    chunks: int = 0
+    seconds: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "before": self.before,
+            "dry_run": self.dry_run,
+            "moved": self.moved,
+            "by_status": dict(sorted(self.by_status.items())),
+            "chunks": self.chunks,
+            "seconds": round(self.seconds, 3),
+            "rows_per_s": round(self.moved / self.seconds) if self.seconds and self.moved and not self.dry_run else None,
+        }
+
+
+def cutoff(older_than_days: float, now: Optional[datetime] = None) -> str:
+    """Граница updated_at (ISO, как в БД): переносятся заявки, изменённые раньше неё."""
+    return ((now or datetime.now()) - timedelta(days=older_than_days)).isoformat(timespec="seconds")
+
+
+def archive_terminal(
+    *,
+    older_than_days: float = OLDER_THAN_DAYS,
+    dry_run: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+    user=None,
+) -> ArchiveReport:
+    """
+    Переносит завершённые заявки старше older_than_days дней в архивную БД.
+    dry_run — только посчитать. user — кто выполняет перенос (только администратор).
+    """
+    if user is not None and user.role != Role.ADMIN:
+        raise PermissionError("Перенос заявок в архив доступен только администратору")
+    if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        raise ValueError(f"Размер порции должен быть от 1 до {MAX_CHUNK_SIZE}")
+    if older_than_days < 0:
+        raise ValueError("Возраст заявок не может быть отрицательным")
+
+    report = ArchiveReport(cutoff(older_than_days), dry_run)
+    started = time.perf_counter()
+    # завершённая заявка не меняется, а новые завершаются позже границы: подсчёт совпадает с переносом
+    report.by_status = db.count_archivable(TERMINAL_STATUSES, report.before)
+    if dry_run:
+        report.moved = sum(report.by_status.values())
+    else:
+        after_id = 0
+        while True:
+            ids = db.move_to_archive(TERMINAL_STATUSES, report.before, chunk_size, after_id=after_id)
+            if ids:
+                report.moved += len(ids)
+                report.chunks += 1
+                after_id = ids[-1]
+            if len(ids) < chunk_size:
+                break
+    report.seconds = time.perf_counter() - started
+
+    if not dry_run and user is not None and report.moved:
+        audit.record(user.name, user.role.name, "MOVE_TO_ARCHIVE", "application", None, report.to_dict())
+    return report
@@ -0,0 +1,119 @@
+"""
+Постоянный журнал действий (таблица audit_events).
+
+record() только кладёт событие в очередь и сразу возвращает управление.
+Фоновый поток собирает события в пакеты и пишет их одной транзакцией —
+раз в FLUSH_INTERVAL_MS или как только набралось MAX_BATCH событий.
+"""
+import atexit
+import json
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from core import db
+
+FLUSH_INTERVAL_MS = 250
+MAX_BATCH = 500
+MAX_PENDING = 100_000   # при недоступной БД храним не больше стольких событий
+
+
+class AuditWriter:
+    def __init__(self, flush_interval_ms: int = FLUSH_INTERVAL_MS, max_batch: int = MAX_BATCH):
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._retry: List[tuple] = []
+        self.written = 0
+        self.failed_batches = 0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def record(self, row: tuple):
+        self._ensure_started()
+        self._queue.put(row)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Дожидается записи всего, что было поставлено в очередь до вызова."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch: List[tuple] = []
+            waiters: List[threading.Event] = []
+            deadline = None
+
+            while len(batch) < self.max_batch:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            self._write(batch)
+            for w in waiters:
+                w.set()
+
+    def _write(self, batch: List[tuple]):
+        rows = self._retry + batch
+        if not rows:
+            return
+        try:
+            db.insert_audit_events(rows)
+        except Exception as e:
+            self.failed_batches += 1
+            self._retry = rows[-MAX_PENDING:]
+            print(f"audit: не удалось записать {len(rows)} событий: {e}", file=sys.stderr)
+            return
+        self._retry = []
+        self.written += len(rows)
+
+
+_writer = AuditWriter()
+atexit.register(_writer.flush)
+
+
+def record(
+    actor: str,
+    role: str,
+    action: str,
+    entity_type: str,
+    entity_id: Optional[int] = None,
+    payload: Optional[Dict[str, Any]] = None,
+):
+    """
+    Ставит событие в очередь на запись. role/action — имена (Role.X.name, Action.Y.name
+    или собственные коды вроде "CREATE_APPLICATION"), entity_type — "application" / "branch".
+    """
+    ts = datetime.now().isoformat(timespec="milliseconds")
+    data = json.dumps(payload or {}, ensure_ascii=False, default=str)
+    _writer.record((ts, actor, role, action, entity_type, None if entity_id is None else int(entity_id), data))
+
+
+def flush(timeout: float = 5.0) -> bool:
+    return _writer.flush(timeout)
+
+
+def writer() -> AuditWriter:
+    return _writer
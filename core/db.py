@@ -1,138 +1,321 @@
+import os
+import random
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from functools import wraps
+from dataclasses import replace
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterable, Sequence, Tuple
 
-from core.enums import ApplicationStatus, BranchStatus
+from core.enums import ApplicationStatus, BranchStatus, Role
+from core.workflow import ACTIONABLE_STATUSES
+from core.pool import ConnectionPool, PoolConfig
+from core import migrations
 
 DB_PATH = Path("insurance.db")
+# архивная БД для завершённых заявок; None — рядом с DB_PATH (insurance_archive.db), см. archive_path()
+ARCHIVE_PATH: Optional[Path] = None
 
 
 def _now_iso() -> str:
     return datetime.now().isoformat(timespec="seconds")
 
 
+# -------------------------
+# Connection pool
+# -------------------------
+
+_pool: Optional[ConnectionPool] = None
+_pool_config = PoolConfig()
+_pool_lock = threading.Lock()
+_commit_hooks: List = []
+_connect_hooks: List = []
+
+
+def configure(**options):
+    """
+    Меняет настройки пула (pool_size, cached_statements, cache_size_kib, mmap_size, synchronous...).
+    Открытые соединения закрываются, новые создаются уже с новыми настройками.
+    """
+    global _pool_config
+    with _pool_lock:
+        _pool_config = replace(_pool_config, **options)
+    close_pool()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    pool = _pool
+    if pool is not None and pool.path == Path(DB_PATH):
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.path != Path(DB_PATH):
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(Path(DB_PATH), _pool_config)
+            _pool.add_connect_hook(_attach_archive)
+            for hook in _commit_hooks:
+                _pool.add_commit_hook(hook)
+            for hook in _connect_hooks:
+                _pool.add_connect_hook(hook)
+        return _pool
+
+
+def add_connect_hook(hook):
+    """hook(conn) вызывается для каждого нового соединения пула (в том числе после configure())."""
+    with _pool_lock:
+        _connect_hooks.append(hook)
+        if _pool is not None:
+            _pool.add_connect_hook(hook)
+
+
+def add_commit_hook(hook):
+    """hook() вызывается после каждого коммита записи через пул (в потоке, который писал)."""
+    with _pool_lock:
+        _commit_hooks.append(hook)
+        if _pool is not None:
+            _pool.add_commit_hook(hook)
+
+
 def _connect():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON;")
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_pool().connection()
+
 
+# -------------------------
+# Concurrent access
+# -------------------------
+
+ENV_JOURNAL_MODE = "INSURANCE_DB_JOURNAL_MODE"
+ENV_BUSY_TIMEOUT_MS = "INSURANCE_DB_BUSY_TIMEOUT_MS"
+ENV_BUSY_RETRIES = "INSURANCE_DB_BUSY_RETRIES"
+ENV_CHECKPOINT_S = "INSURANCE_DB_CHECKPOINT_S"
+ENV_ARCHIVE = "INSURANCE_DB_ARCHIVE"
 
-def _table_has_column(conn: sqlite3.Connection, table: str, column: str) -> bool:
-    cur = conn.execute(f"PRAGMA table_info({table})")
-    cols = [r["name"] for r in cur.fetchall()]
-    return column in cols
+_retry_count = 0
+_retry_exhausted = 0
 
 
-def _ensure_column(conn: sqlite3.Connection, table: str, column: str, ddl: str):
-    if not _table_has_column(conn, table, column):
-        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+def configure_from_env():
+    """
+    Настройки совместного доступа из окружения (main.py, python -m cli):
+    INSURANCE_DB_JOURNAL_MODE=WAL, INSURANCE_DB_BUSY_TIMEOUT_MS, INSURANCE_DB_BUSY_RETRIES, INSURANCE_DB_CHECKPOINT_S,
+    а также файл архивной БД INSURANCE_DB_ARCHIVE.
+    """
+    global ARCHIVE_PATH
+    if os.environ.get(ENV_ARCHIVE):
+        ARCHIVE_PATH = Path(os.environ[ENV_ARCHIVE])
+        close_pool()
+    options: Dict[str, Any] = {}
+    if os.environ.get(ENV_JOURNAL_MODE):
+        options["journal_mode"] = os.environ[ENV_JOURNAL_MODE].strip().upper()
+    if os.environ.get(ENV_BUSY_TIMEOUT_MS):
+        options["busy_timeout_ms"] = int(os.environ[ENV_BUSY_TIMEOUT_MS])
+    if os.environ.get(ENV_BUSY_RETRIES):
+        options["busy_retries"] = int(os.environ[ENV_BUSY_RETRIES])
+    if os.environ.get(ENV_CHECKPOINT_S):
+        options["checkpoint_interval_s"] = float(os.environ[ENV_CHECKPOINT_S])
+    if options:
+        configure(**options)
+
 
+def is_busy_error(e: BaseException) -> bool:
+    """Временная блокировка БД другим соединением или процессом (операцию можно повторить)."""
+    if not isinstance(e, sqlite3.OperationalError):
+        return False
+    text = str(e).lower()
+    return "database is locked" in text or "database is busy" in text or "database table is locked" in text
 
+
+def run_with_retry(fn, *args, **kwargs):
+    """
+    Выполняет fn(*args, **kwargs); при блокировке БД повторяет её целиком
+    с экспоненциальной паузой со случайным разбросом (до busy_retries раз).
+    Внутри уже открытого блока соединения не повторяет: откатится и повторится
+    внешняя операция, иначе повтор попал бы в середину чужой транзакции.
+    """
+    global _retry_count, _retry_exhausted
+    pool = get_pool()
+    if pool.in_block():
+        return fn(*args, **kwargs)
+    cfg = pool.config
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e):
+                raise
+            if attempt >= cfg.busy_retries:
+                _retry_exhausted += 1
+                raise
+            # «full jitter»: процессы, столкнувшиеся на одной блокировке, не повторяют в такт
+            delay_ms = random.uniform(0, min(cfg.retry_max_ms, cfg.retry_base_ms * (2 ** attempt)))
+            attempt += 1
+            _retry_count += 1
+            time.sleep(delay_ms / 1000.0)
+
+
+def _retrying(fn):
+    """Запись, которую при блокировке БД можно повторить целиком (см. run_with_retry)."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        # генератор строк после первой попытки был бы пуст — фиксируем его заранее
+        args = tuple(list(a) if isinstance(a, Iterator) else a for a in args)
+        return run_with_retry(fn, *args, **kwargs)
+    return wrapper
+
+
+def retry_stats() -> Dict[str, int]:
+    return {"retries": _retry_count, "exhausted": _retry_exhausted}
+
+
+def checkpoint(mode: str = "PASSIVE") -> Dict[str, int]:
+    """
+    PRAGMA wal_checkpoint: переносит WAL в файл БД (PASSIVE, FULL, RESTART, TRUNCATE).
+    В режиме без WAL ничего не делает.
+    """
+    mode = mode.upper()
+    if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"Неизвестный режим checkpoint: {mode}")
+    with _connect() as conn:
+        busy, log, done = conn.execute(f"PRAGMA wal_checkpoint({mode});").fetchone()
+    return {"busy": int(busy), "log_frames": int(log), "checkpointed": int(done)}
+
+
+@contextmanager
+def transaction():
+    """
+    Объединяет все вызовы db.* внутри блока (в текущем потоке) в одну транзакцию.
+    Транзакция открывается как BEGIN IMMEDIATE: блокировка на запись берётся сразу,
+    поэтому чтение и проверка внутри блока не устаревают до коммита.
+    """
+    with _connect() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        yield conn
+
+
+class ConcurrentUpdateError(ValueError):
+    """Статус заявки изменился с момента чтения (её уже обработал другой пользователь)."""
+
+
+@_retrying
 def db_init():
+    """
+    Приводит схему БД и архивной БД к актуальной версии (см. core/migrations.py).
+    Если схема уже актуальна, стоит двух чтений PRAGMA user_version и чтения краёв журнала изменений
+    (переросший журнал здесь же обрезается, см. _trim_changelog).
+    """
     with _connect() as conn:
-        # -------------------------
-        # Applications
-        # -------------------------
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS applications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            client_name TEXT NOT NULL,
-            status TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL
-        )
-        """)
+        migrations.migrate(conn)
+        migrations.migrate_archive(conn)
+        _trim_changelog(conn)
 
-        # данные клиента/объекта (вводит клиент)
-        _ensure_column(conn, "applications", "client_fio", "TEXT NOT NULL DEFAULT ''")
-        _ensure_column(conn, "applications", "insured_object", "TEXT NOT NULL DEFAULT ''")
-        _ensure_column(conn, "applications", "request_text", "TEXT NOT NULL DEFAULT ''")
-
-        # оценка андеррайтера: риск + ОДИН вид страхования
-        _ensure_column(conn, "applications", "risk_percent", "INTEGER NOT NULL DEFAULT 0")
-        _ensure_column(conn, "applications", "insurance_type_id", "INTEGER")
-        _ensure_column(conn, "applications", "underwriter_updated_at", "TEXT")
-
-        # решение администратора: страховая сумма + тарифная ставка + рассчитанный тариф
-        _ensure_column(conn, "applications", "insurance_sum", "REAL")
-        _ensure_column(conn, "applications", "tariff_rate", "REAL")   # в процентах
-        _ensure_column(conn, "applications", "tariff_amount", "REAL") # сумма к оплате (можем считать)
-        _ensure_column(conn, "applications", "admin_updated_at", "TEXT")
-
-        # -------------------------
-        # Branches (филиалы)
-        # -------------------------
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS branches (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            branch_name TEXT NOT NULL,
-            status TEXT NOT NULL,
-            confirmed_by_director INTEGER NOT NULL DEFAULT 1,
-            approved_by_lawyer INTEGER NOT NULL DEFAULT 0,
-            created_by TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL
-        )
-        """)
-        _ensure_column(conn, "branches", "address", "TEXT NOT NULL DEFAULT ''")
-        _ensure_column(conn, "branches", "phone", "TEXT NOT NULL DEFAULT ''")
 
-        # -------------------------
-        # Insurance types (справочник видов страхования)
-        # -------------------------
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS insurance_types (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            is_active INTEGER NOT NULL DEFAULT 1
-        )
-        """)
+# -------------------------
+# Reference data cache
+# -------------------------
+
+class _ReferenceCache:
+    """
+    LRU-кэш справочных выборок (виды страхования, одобренные филиалы).
+    Записи сгруппированы; запись в БД, меняющая справочник, сбрасывает свою группу.
+    Значения общие для всех вызывающих — их нельзя изменять.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_load(self, group: str, key: tuple, loader):
+        full_key = (group, key)
+        with self._lock:
+            if full_key in self._entries:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return self._entries[full_key]
+            self.misses += 1
+            generation = self._generations.get(group, 0)
+
+        value = loader()
+
+        with self._lock:
+            # если группу сбросили, пока шла загрузка, значение могло устареть — не кэшируем
+            if self._generations.get(group, 0) == generation:
+                self._entries[full_key] = value
+                self._entries.move_to_end(full_key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, group: Optional[str] = None):
+        with self._lock:
+            groups = {g for g, _ in self._entries} | set(self._generations) if group is None else {group}
+            for g in groups:
+                self._generations[g] = self._generations.get(g, 0) + 1
+            for k in [k for k in self._entries if group is None or k[0] == group]:
+                del self._entries[k]
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
 
-        # seed видов страхования (если пусто)
-        cur = conn.execute("SELECT COUNT(*) as c FROM insurance_types")
-        if int(cur.fetchone()["c"]) == 0:
-            default_types = [
-                "Страхование автотранспорта от угона",
-                "Страхование домашнего имущества",
-                "Добровольное медицинское страхование",
-            ]
-            for n in default_types:
-                conn.execute("INSERT INTO insurance_types(name, is_active) VALUES (?, 1)", (n,))
-
-        # -------------------------
-        # Contracts (договоры)
-        # -------------------------
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS contracts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            application_id INTEGER NOT NULL UNIQUE,
-            status TEXT NOT NULL,
-            client_signed INTEGER NOT NULL DEFAULT 0,
-            director_signed INTEGER NOT NULL DEFAULT 0,
-            archived INTEGER NOT NULL DEFAULT 0,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            FOREIGN KEY(application_id) REFERENCES applications(id) ON DELETE CASCADE
-        )
-        """)
-        # поля договора по предметной области
-        _ensure_column(conn, "contracts", "contract_date", "TEXT")         # дата заключения
-        _ensure_column(conn, "contracts", "insurance_sum", "REAL")
-        _ensure_column(conn, "contracts", "insurance_type_id", "INTEGER")
-        _ensure_column(conn, "contracts", "tariff_rate", "REAL")
-        _ensure_column(conn, "contracts", "tariff_amount", "REAL")
-        _ensure_column(conn, "contracts", "branch_id", "INTEGER")
-        _ensure_column(conn, "contracts", "draft_text", "TEXT")
 
-        conn.commit()
+_reference_cache = _ReferenceCache()
+
+
+def _reference(group: str):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            return _reference_cache.get_or_load(group, key, lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def invalidate_reference_cache(group: Optional[str] = None):
+    """
+    Сбрасывает кэш справочников ("insurance_types", "branches" или всё).
+    Записи через core/db сбрасывают кэш сами; вызывать нужно после изменений из других процессов.
+    """
+    _reference_cache.invalidate(group)
+
+
+def cache_stats() -> Dict[str, int]:
+    return _reference_cache.stats()
 
 
 # -------------------------
 # Insurance types
 # -------------------------
 
+@_reference("insurance_types")
 def list_insurance_types(active_only: bool = True) -> List[Dict[str, Any]]:
     with _connect() as conn:
         if active_only:
@@ -142,6 +325,7 @@ def list_insurance_types(active_only: bool = True) -> List[Dict[str, Any]]:
         return [dict(r) for r in cur.fetchall()]
 
 
+@_reference("insurance_types")
 def get_insurance_type(type_id: int) -> Optional[Dict[str, Any]]:
     with _connect() as conn:
         cur = conn.execute("SELECT id, name, is_active FROM insurance_types WHERE id = ?", (type_id,))
@@ -153,6 +337,37 @@ def get_insurance_type(type_id: int) -> Optional[Dict[str, Any]]:
 # Applications
 # -------------------------
 
+# Проекции: списки и точечные чтения по умолчанию не тянут длинные тексты (описание заявки,
+# проект договора) — они нужны только в карточке и читаются отдельно по запросу
+# (get_application_text, get_contract_draft). Имена колонок подставляются в SQL текстом,
+# поэтому select_list пропускает только известные.
+APPLICATION_COLUMNS = (
+    "id", "client_name", "status", "client_fio", "insured_object", "request_text",
+    "risk_percent", "insurance_type_id", "insurance_sum", "tariff_rate", "tariff_amount",
+    "created_at", "updated_at", "underwriter_updated_at", "admin_updated_at",
+)
+APPLICATION_TEXT_COLUMNS = ("request_text",)
+APPLICATION_SUMMARY_COLUMNS = tuple(c for c in APPLICATION_COLUMNS if c not in APPLICATION_TEXT_COLUMNS)
+
+APPLICATION_DETAIL_COLUMNS = (
+    "id", "client_name", "status", "client_fio", "insured_object", "request_text", "created_at", "updated_at",
+    "risk_percent", "insurance_type_id", "insurance_type_name", "insurance_sum", "tariff_rate", "tariff_amount",
+    "contract_id", "contract_status", "contract_date", "contract_insurance_type_id", "contract_insurance_type_name",
+    "contract_insurance_sum", "contract_tariff_rate", "contract_tariff_amount",
+    "client_signed", "director_signed", "archived", "draft_text", "contract_updated_at",
+    "branch_id", "branch_name", "branch_address", "branch_phone",
+)
+APPLICATION_DETAIL_SUMMARY_COLUMNS = tuple(c for c in APPLICATION_DETAIL_COLUMNS if c not in ("request_text", "draft_text"))
+
+
+def select_list(columns: Sequence[str], allowed: Sequence[str]) -> str:
+    unknown = [c for c in columns if c not in allowed]
+    if unknown or not columns:
+        raise ValueError(f"Неизвестные колонки: {', '.join(unknown) or '(пусто)'}")
+    return ", ".join(columns)
+
+
+@_retrying
 def create_application(client_user: str, *, client_fio: str, insured_object: str, request_text: str) -> int:
     now = _now_iso()
     with _connect() as conn:
@@ -160,34 +375,292 @@ def create_application(client_user: str, *, client_fio: str, insured_object: str
             INSERT INTO applications(client_name, client_fio, insured_object, request_text, status, created_at, updated_at)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         """, (client_user, client_fio, insured_object, request_text, ApplicationStatus.CREATED.name, now, now))
-        conn.commit()
         return int(cur.lastrowid)
 
 
-def list_applications() -> List[Dict[str, Any]]:
+@_retrying
+def create_applications(rows: Iterable[Tuple[str, str, str, str]]) -> int:
+    """
+    Пакетное создание заявок (импорт): (client_user, client_fio, insured_object, request_text).
+    Возвращает число созданных заявок.
+    """
+    now = _now_iso()
+    params = [(client, fio, obj, text, ApplicationStatus.CREATED.name, now, now) for client, fio, obj, text in rows]
+    with transaction() as conn:
+        conn.executemany("""
+            INSERT INTO applications(client_name, client_fio, insured_object, request_text, status, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, params)
+        _trim_changelog(conn)
+    return len(params)
+
+
+def list_applications_page(
+    *, status: Optional[ApplicationStatus] = None, limit: int = 200, after_id: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Страница всех заявок (по убыванию id), при необходимости — только с заданным статусом."""
+    conditions, params = [], []
+    if status is not None:
+        conditions.append("status = ?")
+        params.append(status.name)
+    if after_id is not None:
+        conditions.append("id < ?")
+        params.append(int(after_id))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
     with _connect() as conn:
-        cur = conn.execute("SELECT * FROM applications ORDER BY id DESC")
+        cur = conn.execute(
+            f"SELECT {WORKLIST_COLUMNS} FROM applications {where} ORDER BY id DESC LIMIT ?",
+            (*params, int(limit)),
+        )
         return [dict(r) for r in cur.fetchall()]
 
 
-def get_application(app_id: int) -> Optional[Dict[str, Any]]:
+def application_status_counts() -> Dict[str, int]:
     with _connect() as conn:
-        cur = conn.execute("SELECT * FROM applications WHERE id = ?", (app_id,))
+        cur = conn.execute("SELECT status, COUNT(*) AS c FROM applications GROUP BY status")
+        return {r["status"]: int(r["c"]) for r in cur.fetchall()}
+
+
+def list_applications(columns: Sequence[str] = APPLICATION_SUMMARY_COLUMNS) -> List[Dict[str, Any]]:
+    cols = select_list(columns, APPLICATION_COLUMNS)
+    with _connect() as conn:
+        cur = conn.execute(f"SELECT {cols} FROM applications ORDER BY id DESC")
+        return [dict(r) for r in cur.fetchall()]
+
+
+def get_application(app_id: int, columns: Sequence[str] = APPLICATION_SUMMARY_COLUMNS) -> Optional[Dict[str, Any]]:
+    """Заявка по id; перенесённая в архивную БД читается оттуда (только чтение)."""
+    cols = select_list(columns, APPLICATION_COLUMNS)
+    with _connect() as conn:
+        cur = conn.execute(f"SELECT {cols} FROM applications WHERE id = ?", (app_id,))
         row = cur.fetchone()
+        if row is None and archive_ready(conn):
+            row = conn.execute(f"SELECT {cols} FROM archive.applications WHERE id = ?", (app_id,)).fetchone()
         return dict(row) if row else None
 
 
-def set_application_status(app_id: int, status: ApplicationStatus):
+def get_application_text(app_id: int) -> Optional[str]:
+    """Описание заявки (request_text) — отдельно от остальных полей, по запросу карточки."""
+    with _connect() as conn:
+        row = conn.execute("SELECT request_text FROM applications WHERE id = ?", (app_id,)).fetchone()
+        if row is None and archive_ready(conn):
+            row = conn.execute("SELECT request_text FROM archive.applications WHERE id = ?", (app_id,)).fetchone()
+        return row[0] if row else None
+
+
+# карточка заявки из архивной БД: те же колонки, что у application_detail_v (миграция 4)
+ARCHIVE_DETAIL_SELECT = """
+    SELECT
+        a.id, a.client_name, a.client_fio, a.insured_object, a.request_text,
+        a.status, a.created_at, a.updated_at,
+        a.risk_percent, a.insurance_type_id, t.name AS insurance_type_name,
+        a.insurance_sum, a.tariff_rate, a.tariff_amount,
+
+        c.id AS contract_id,
+        c.status AS contract_status,
+        c.contract_date,
+        c.insurance_type_id AS contract_insurance_type_id,
+        ct.name AS contract_insurance_type_name,
+        c.insurance_sum AS contract_insurance_sum,
+        c.tariff_rate AS contract_tariff_rate,
+        c.tariff_amount AS contract_tariff_amount,
+        c.client_signed, c.director_signed, c.archived,
+        c.draft_text,
+        c.updated_at AS contract_updated_at,
+
+        c.branch_id,
+        b.branch_name, b.address AS branch_address, b.phone AS branch_phone
+    FROM archive.applications a
+    LEFT JOIN main.insurance_types t ON t.id = a.insurance_type_id
+    LEFT JOIN archive.contracts c ON c.application_id = a.id
+    LEFT JOIN main.insurance_types ct ON ct.id = c.insurance_type_id
+    LEFT JOIN main.branches b ON b.id = c.branch_id
+"""
+
+
+def application_detail_sql(columns: Sequence[str] = APPLICATION_DETAIL_SUMMARY_COLUMNS) -> Tuple[str, str]:
+    """Выражения карточки заявки (основная БД, архивная БД) с выбранными колонками; параметр — id заявки."""
+    cols = select_list(columns, APPLICATION_DETAIL_COLUMNS)
+    return (
+        f"SELECT {cols} FROM application_detail_v WHERE id = ?",
+        f"SELECT {cols} FROM ({ARCHIVE_DETAIL_SELECT}) WHERE id = ?",
+    )
+
+
+def get_application_detail(
+    app_id: int, columns: Sequence[str] = APPLICATION_DETAIL_SUMMARY_COLUMNS
+) -> Optional[Dict[str, Any]]:
+    """
+    Заявка вместе с видом страхования, договором и филиалом (view application_detail_v).
+    Поля договора равны None, если договора ещё нет (contract_id is None).
+    Заявка, перенесённая в архивную БД, читается оттуда.
+    """
+    main_sql, archive_sql = application_detail_sql(columns)
+    with _connect() as conn:
+        row = conn.execute(main_sql, (app_id,)).fetchone()
+        if row is None and archive_ready(conn):
+            row = conn.execute(archive_sql, (app_id,)).fetchone()
+        return dict(row) if row else None
+
+
+def _placeholders(n: int) -> str:
+    return ", ".join("?" for _ in range(n))
+
+
+# -------------------------
+# Worklist ("Мои задачи")
+# -------------------------
+
+WORKLIST_COLUMNS = "id, client_name, client_fio, insured_object, status, insurance_sum, updated_at"
+
+# ключ сортировки списка -> SQL-выражение (под каждое есть индекс, см. migrations)
+WORKLIST_SORTS = {
+    "id": "id",
+    "updated_at": "updated_at",
+    "insurance_sum": "COALESCE(insurance_sum, 0)",
+    "status": "status",
+}
+
+
+def _worklist_filter(role: Role, user_name: str):
+    statuses = sorted(s.name for s in ACTIONABLE_STATUSES.get(role, ()))
+    if not statuses:
+        return None
+    where = f"status IN ({', '.join('?' for _ in statuses)})"
+    params: list = list(statuses)
+    if role == Role.CLIENT:
+        where = f"client_name = ? AND {where}"
+        params.insert(0, user_name)
+    return where, params
+
+
+def _keyset_page(table: str, columns: str, where: str, params: list, *, sort_expr: str, descending: bool,
+                 after: Optional[Tuple[Any, int]], limit: int, offset: int) -> List[Dict[str, Any]]:
+    """
+    Страница выборки, упорядоченной по (sort_expr, id).
+    after — (sort_key, id) последней строки предыдущей страницы: продолжение без OFFSET.
+    Каждая строка содержит sort_key для построения следующего after.
+    """
+    direction = "DESC" if descending else "ASC"
+    params = list(params)
+    if after is not None:
+        where = f"{where} AND ({sort_expr}, id) {'<' if descending else '>'} (?, ?)"
+        params.extend([after[0], int(after[1])])
+    with _connect() as conn:
+        cur = conn.execute(
+            f"SELECT {columns}, {sort_expr} AS sort_key FROM {table} WHERE {where} "
+            f"ORDER BY {sort_expr} {direction}, id {direction} LIMIT ? OFFSET ?",
+            (*params, int(limit), int(offset)),
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+
+def list_worklist(
+    role: Role,
+    user_name: str,
+    limit: int = 200,
+    offset: int = 0,
+    *,
+    sort: str = "id",
+    descending: bool = True,
+    after: Optional[Tuple[Any, int]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Заявки, по которым роль может выполнить действие (клиент видит только свои).
+    Фильтрация, сортировка (WORKLIST_SORTS) и постраничная выборка выполняются в SQL;
+    для последовательной подгрузки передавайте after вместо offset.
+    """
+    flt = _worklist_filter(role, user_name)
+    if flt is None:
+        return []
+    if sort not in WORKLIST_SORTS:
+        raise ValueError(f"Неизвестная сортировка: {sort}")
+    where, params = flt
+    return _keyset_page(
+        "applications", WORKLIST_COLUMNS, where, params,
+        sort_expr=WORKLIST_SORTS[sort], descending=descending, after=after, limit=limit, offset=offset,
+    )
+
+
+def get_worklist_rows(
+    role: Role, user_name: str, app_ids: Sequence[int], *, sort: str = "id"
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Строки списка задач (как в list_worklist, с sort_key) для заданных заявок.
+    Заявки, которых больше нет в списке роли, в результат не попадают.
+    """
+    ids = sorted({int(i) for i in app_ids})
+    flt = _worklist_filter(role, user_name)
+    if flt is None or not ids:
+        return {}
+    if sort not in WORKLIST_SORTS:
+        raise ValueError(f"Неизвестная сортировка: {sort}")
+    where, params = flt
+    with _connect() as conn:
+        cur = conn.execute(
+            f"SELECT {WORKLIST_COLUMNS}, {WORKLIST_SORTS[sort]} AS sort_key FROM applications "
+            f"WHERE id IN ({_placeholders(len(ids))}) AND {where}",
+            (*ids, *params),
+        )
+        return {int(r["id"]): dict(r) for r in cur.fetchall()}
+
+
+def count_worklist(role: Role, user_name: str) -> int:
+    flt = _worklist_filter(role, user_name)
+    if flt is None:
+        return 0
+    where, params = flt
+    with _connect() as conn:
+        cur = conn.execute(f"SELECT COUNT(*) AS c FROM applications WHERE {where}", params)
+        return int(cur.fetchone()["c"])
+
+
+@_retrying
+def set_application_status(app_id: int, status: ApplicationStatus, *, expected: Optional[ApplicationStatus] = None):
+    """
+    Меняет статус заявки. Если передан expected, запись выполняется только
+    при совпадении текущего статуса (compare-and-set), иначе ConcurrentUpdateError.
+    """
     now = _now_iso()
     with _connect() as conn:
-        conn.execute("""
+        if expected is None:
+            conn.execute("""
+                UPDATE applications
+                SET status = ?, updated_at = ?
+                WHERE id = ?
+            """, (status.name, now, app_id))
+            return
+
+        cur = conn.execute("""
             UPDATE applications
             SET status = ?, updated_at = ?
-            WHERE id = ?
-        """, (status.name, now, app_id))
-        conn.commit()
+            WHERE id = ? AND status = ?
+        """, (status.name, now, app_id, expected.name))
+        if cur.rowcount != 1:
+            raise ConcurrentUpdateError("Заявку уже обработал другой пользователь (статус изменился). Обновите список.")
 
 
+@_retrying
+def set_application_statuses(rows: Iterable[Tuple[int, ApplicationStatus, ApplicationStatus]]):
+    """
+    Пакетная смена статусов: (app_id, новый статус, ожидаемый текущий).
+    Если хотя бы одна строка не прошла compare-and-set — ConcurrentUpdateError
+    (вызывающий код откатывает транзакцию целиком).
+    """
+    now = _now_iso()
+    params = [(new.name, now, int(app_id), expected.name) for app_id, new, expected in rows]
+    with _connect() as conn:
+        cur = conn.executemany("""
+            UPDATE applications
+            SET status = ?, updated_at = ?
+            WHERE id = ? AND status = ?
+        """, params)
+        if cur.rowcount != len(params):
+            raise ConcurrentUpdateError("Часть заявок уже обработана другим пользователем (статус изменился).")
+        _trim_changelog(conn)
+
+
+@_retrying
 def set_underwriter_assessment(app_id: int, *, risk_percent: int, insurance_type_id: int):
     now = _now_iso()
     with _connect() as conn:
@@ -196,9 +669,9 @@ def set_underwriter_assessment(app_id: int, *, risk_percent: int, insurance_type
             SET risk_percent = ?, insurance_type_id = ?, underwriter_updated_at = ?, updated_at = ?
             WHERE id = ?
         """, (int(risk_percent), int(insurance_type_id), now, now, app_id))
-        conn.commit()
 
 
+@_retrying
 def set_admin_decision(app_id: int, *, insurance_sum: float, tariff_rate: float) -> float:
     """
     Сохраняет страховую сумму и тарифную ставку (%).
@@ -215,24 +688,211 @@ def set_admin_decision(app_id: int, *, insurance_sum: float, tariff_rate: float)
             SET insurance_sum = ?, tariff_rate = ?, tariff_amount = ?, admin_updated_at = ?, updated_at = ?
             WHERE id = ?
         """, (insurance_sum, tariff_rate, tariff_amount, now, now, app_id))
-        conn.commit()
 
     return tariff_amount
 
 
+# колонки пересчёта тарифов (core/pricing.py); NULL заменены нулём + признак наличия суммы
+PRICING_COLUMNS = (
+    "id", "COALESCE(insurance_type_id, 0)", "risk_percent",
+    "insurance_sum IS NOT NULL", "COALESCE(insurance_sum, 0)",
+    "tariff_rate IS NOT NULL", "COALESCE(tariff_rate, 0)", "COALESCE(tariff_amount, 0)",
+)
+
+
+def list_pricing_rows(
+    status: ApplicationStatus, *, insurance_type_id: Optional[int] = None, after_id: int = 0, limit: int = 50_000
+) -> List[tuple]:
+    """
+    Строки сегмента для пересчёта тарифов по возрастанию id (keyset-порциями).
+    Возвращает кортежи в порядке PRICING_COLUMNS — их напрямую загружает numpy.
+    """
+    where, params = "status = ? AND id > ?", [status.name, int(after_id)]
+    if insurance_type_id is not None:
+        where += " AND insurance_type_id = ?"
+        params.append(int(insurance_type_id))
+    with _connect() as conn:
+        cur = conn.cursor()
+        cur.row_factory = None   # простые кортежи: без sqlite3.Row загрузка в массив заметно быстрее
+        cur.execute(
+            f"SELECT {', '.join(PRICING_COLUMNS)} FROM applications WHERE {where} ORDER BY id LIMIT ?",
+            (*params, int(limit)),
+        )
+        return cur.fetchall()
+
+
+@_retrying
+def set_tariffs(rows: Iterable[Tuple[float, Optional[float], int]]):
+    """Пакетная запись (tariff_rate, tariff_amount, id) после пересчёта тарифов — одним executemany."""
+    now = _now_iso()
+    with _connect() as conn:
+        conn.executemany(
+            "UPDATE applications SET tariff_rate = ?, tariff_amount = ?, updated_at = ? WHERE id = ?",
+            ((rate, amount, now, app_id) for rate, amount, app_id in rows),
+        )
+        _trim_changelog(conn)
+
+
+@_retrying
+def set_underwriter_assessments(rows: Iterable[Tuple[int, int, int]]):
+    """Пакетная запись оценок андеррайтера: (app_id, risk_percent, insurance_type_id)."""
+    now = _now_iso()
+    params = [(int(risk), int(type_id), now, now, int(app_id)) for app_id, risk, type_id in rows]
+    with _connect() as conn:
+        conn.executemany("""
+            UPDATE applications
+            SET risk_percent = ?, insurance_type_id = ?, underwriter_updated_at = ?, updated_at = ?
+            WHERE id = ?
+        """, params)
+
+
+@_retrying
+def set_admin_decisions(rows: Iterable[Tuple[int, float, float]]):
+    """Пакетная запись решений администратора: (app_id, insurance_sum, tariff_rate)."""
+    now = _now_iso()
+    params = []
+    for app_id, insurance_sum, tariff_rate in rows:
+        insurance_sum = float(insurance_sum)
+        tariff_rate = float(tariff_rate)
+        params.append((insurance_sum, tariff_rate, insurance_sum * (tariff_rate / 100.0), now, now, int(app_id)))
+    with _connect() as conn:
+        conn.executemany("""
+            UPDATE applications
+            SET insurance_sum = ?, tariff_rate = ?, tariff_amount = ?, admin_updated_at = ?, updated_at = ?
+            WHERE id = ?
+        """, params)
+
+
+# -------------------------
+# Full-text search
+# -------------------------
+
+SEARCH_RANK_LIMIT = 5000       # совпадений больше — сортировка по новизне вместо bm25
+SEARCH_MIN_PREFIX = 2          # короче — без поиска по началу слова (слишком много вариантов)
+_SEARCH_TOKEN_RE = re.compile(r'"([^"]*)"?|(\S+)')
+_SEARCH_WORD_RE = re.compile(r"\w+")
+
+
+def build_search_query(text: str, *, prefix_last: bool = True) -> Optional[str]:
+    """
+    Выражение FTS5 MATCH из пользовательского ввода. Слова объединяются по И;
+    "в кавычках" — фраза; слово* — поиск по началу слова; при prefix_last так же
+    ищется последнее слово (поиск по мере ввода). Служебный синтаксис FTS5 из ввода не проходит.
+    None — искать нечего.
+    """
+    text = text.replace("ё", "е").replace("Ё", "Е")
+    terms = []
+    matches = list(_SEARCH_TOKEN_RE.finditer(text))
+    for i, m in enumerate(matches):
+        phrase, word = m.group(1), m.group(2)
+        if phrase is not None:
+            words = _SEARCH_WORD_RE.findall(phrase)
+            if words:
+                terms.append('"' + " ".join(words) + '"')
+            continue
+        star = word.endswith("*") or (prefix_last and i == len(matches) - 1)
+        words = _SEARCH_WORD_RE.findall(word)
+        if not words:
+            continue
+        term = '"' + " ".join(words) + '"'
+        if star and len(words[-1]) >= SEARCH_MIN_PREFIX:
+            term += "*"
+        terms.append(term)
+    return " ".join(terms) if terms else None
+
+
+def search_applications(
+    text: str,
+    *,
+    client_name: Optional[str] = None,
+    limit: int = 50,
+    after: Optional[Tuple[Any, int]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Полнотекстовый поиск заявок (ФИО, объект, описание, проект договора).
+    Строки — как в списке задач (WORKLIST_COLUMNS + sort_key), по возрастанию sort_key:
+    если совпадений не больше SEARCH_RANK_LIMIT — по релевантности (bm25), иначе —
+    сначала новые (sort_key = -id). after — (sort_key, id) последней строки прошлой страницы.
+    client_name — только заявки этого клиента.
+    """
+    match = build_search_query(text)
+    if match is None:
+        return []
+    columns = ", ".join(f"a.{c.strip()}" for c in WORKLIST_COLUMNS.split(","))
+    client_filter, client_params = "", []
+    if client_name is not None:
+        client_filter, client_params = "AND a.client_name = ?", [client_name]
+
+    def too_broad(conn, expr: str) -> bool:
+        return conn.execute(
+            "SELECT COUNT(*) FROM (SELECT rowid FROM applications_fts WHERE applications_fts MATCH ? LIMIT ?)",
+            (expr, SEARCH_RANK_LIMIT + 1),
+        ).fetchone()[0] > SEARCH_RANK_LIMIT
+
+    with _connect() as conn:
+        # широкий запрос (например, одна буква) ранжировать дорого: bm25 считается для каждого совпадения.
+        # Следующие страницы продолжают порядок первой: sort_key = -id целое, rank — дробное.
+        # Поиск по началу длинного слова дороже точного, поэтому сначала проверяется точное совпадение.
+        if after is not None:
+            broad = isinstance(after[0], int)
+        else:
+            exact = build_search_query(text, prefix_last=False)
+            broad = too_broad(conn, exact) or (exact != match and too_broad(conn, match))
+
+        if broad:
+            keyset, params = "", []
+            if after is not None:
+                keyset, params = "AND f.rowid < ?", [-int(after[0])]
+            sql = f"""
+                SELECT {columns}, -a.id AS sort_key
+                FROM applications_fts f
+                JOIN applications a ON a.id = f.rowid
+                WHERE applications_fts MATCH ? {keyset} {client_filter}
+                ORDER BY f.rowid DESC
+                LIMIT ?
+            """
+        else:
+            keyset, params = "", []
+            if after is not None:
+                keyset, params = "AND (f.rank > ? OR (f.rank = ? AND f.rowid > ?))", [after[0], after[0], int(after[1])]
+            sql = f"""
+                SELECT {columns}, f.rank AS sort_key
+                FROM applications_fts f
+                JOIN applications a ON a.id = f.rowid
+                WHERE applications_fts MATCH ? {keyset} {client_filter}
+                ORDER BY f.rank, f.rowid
+                LIMIT ?
+            """
+        cur = conn.execute(sql, (match, *params, *client_params, int(limit)))
+        return [dict(r) for r in cur.fetchall()]
+
+
+@_retrying
+def rebuild_search_index():
+    """Строит полнотекстовый индекс заново по заявкам и договорам."""
+    with transaction() as conn:
+        migrations.rebuild_search_index(conn)
+
+
 # -------------------------
 # Contracts
 # -------------------------
 
+# длинный проект договора читается отдельно (get_contract_draft), см. проекции заявок
+CONTRACT_COLUMNS = (
+    "id", "application_id", "status", "client_signed", "director_signed", "archived", "created_at", "updated_at",
+    "contract_date", "insurance_sum", "insurance_type_id", "tariff_rate", "tariff_amount", "branch_id", "draft_text",
+)
+CONTRACT_TEXT_COLUMNS = ("draft_text",)
+CONTRACT_SUMMARY_COLUMNS = tuple(c for c in CONTRACT_COLUMNS if c not in CONTRACT_TEXT_COLUMNS)
+
+
+@_retrying
 def create_contract_from_application(application_id: int, *, branch_id: int, draft_text: str) -> int:
     """
     Создаёт договор, копируя ключевые данные из заявки:
     дата заключения, страховая сумма, вид страхования, ставка, тариф, филиал.
     """
-    app = get_application(application_id)
-    if not app:
-        raise ValueError("Заявка не найдена")
-
     now = _now_iso()
 
     with _connect() as conn:
@@ -244,29 +904,71 @@ def create_contract_from_application(application_id: int, *, branch_id: int, dra
                 branch_id, draft_text,
                 created_at, updated_at
             )
-            VALUES (?, ?, 0, 0, 0, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            SELECT id, ?, 0, 0, 0, ?, insurance_sum, insurance_type_id, tariff_rate, tariff_amount, ?, ?, ?, ?
+            FROM applications
+            WHERE id = ?
         """, (
-            application_id, "prepared",
+            "prepared",
             now,
-            app.get("insurance_sum"),
-            app.get("insurance_type_id"),
-            app.get("tariff_rate"),
-            app.get("tariff_amount"),
             int(branch_id),
             draft_text or "",
-            now, now
+            now, now,
+            application_id,
         ))
-        conn.commit()
+        if cur.rowcount != 1:
+            raise ValueError("Заявка не найдена")
         return int(cur.lastrowid)
 
 
-def get_contract_by_application(application_id: int) -> Optional[Dict[str, Any]]:
+@_retrying
+def create_contracts_from_applications(rows: Iterable[Tuple[int, int, str]]):
+    """Пакетное создание договоров: (application_id, branch_id, draft_text)."""
+    now = _now_iso()
+    params = [("prepared", now, int(branch_id), draft_text or "", now, now, int(app_id)) for app_id, branch_id, draft_text in rows]
     with _connect() as conn:
-        cur = conn.execute("SELECT * FROM contracts WHERE application_id = ?", (application_id,))
+        cur = conn.executemany("""
+            INSERT INTO contracts(
+                application_id, status,
+                client_signed, director_signed, archived,
+                contract_date, insurance_sum, insurance_type_id, tariff_rate, tariff_amount,
+                branch_id, draft_text,
+                created_at, updated_at
+            )
+            SELECT id, ?, 0, 0, 0, ?, insurance_sum, insurance_type_id, tariff_rate, tariff_amount, ?, ?, ?, ?
+            FROM applications
+            WHERE id = ?
+        """, params)
+        if cur.rowcount != len(params):
+            raise ValueError("Заявка не найдена")
+
+
+def get_contract_by_application(
+    application_id: int, columns: Sequence[str] = CONTRACT_SUMMARY_COLUMNS
+) -> Optional[Dict[str, Any]]:
+    """Договор заявки; договор заявки, перенесённой в архивную БД, читается оттуда."""
+    cols = select_list(columns, CONTRACT_COLUMNS)
+    with _connect() as conn:
+        cur = conn.execute(f"SELECT {cols} FROM contracts WHERE application_id = ?", (application_id,))
         row = cur.fetchone()
+        if row is None and archive_ready(conn):
+            row = conn.execute(
+                f"SELECT {cols} FROM archive.contracts WHERE application_id = ?", (application_id,)
+            ).fetchone()
         return dict(row) if row else None
 
 
+def get_contract_draft(application_id: int) -> Optional[str]:
+    """Текст проекта договора заявки (draft_text) — по запросу карточки."""
+    with _connect() as conn:
+        row = conn.execute("SELECT draft_text FROM contracts WHERE application_id = ?", (application_id,)).fetchone()
+        if row is None and archive_ready(conn):
+            row = conn.execute(
+                "SELECT draft_text FROM archive.contracts WHERE application_id = ?", (application_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+
+@_retrying
 def set_contract_flags(
     application_id: int,
     *,
@@ -275,29 +977,125 @@ def set_contract_flags(
     archived=None,
     status=None
 ):
-    current = get_contract_by_application(application_id)
-    if not current:
-        raise ValueError("Договор для этой заявки не найден в БД")
-
-    new_client = current["client_signed"] if client_signed is None else int(bool(client_signed))
-    new_director = current["director_signed"] if director_signed is None else int(bool(director_signed))
-    new_archived = current["archived"] if archived is None else int(bool(archived))
-    new_status = current["status"] if status is None else str(status)
+    # None = оставить текущее значение (COALESCE), чтение перед записью не нужно
+    new_client = None if client_signed is None else int(bool(client_signed))
+    new_director = None if director_signed is None else int(bool(director_signed))
+    new_archived = None if archived is None else int(bool(archived))
+    new_status = None if status is None else str(status)
 
     now = _now_iso()
     with _connect() as conn:
-        conn.execute("""
+        cur = conn.execute("""
             UPDATE contracts
-            SET client_signed=?, director_signed=?, archived=?, status=?, updated_at=?
-            WHERE application_id=?
+            SET client_signed = COALESCE(?, client_signed),
+                director_signed = COALESCE(?, director_signed),
+                archived = COALESCE(?, archived),
+                status = COALESCE(?, status),
+                updated_at = ?
+            WHERE application_id = ?
         """, (new_client, new_director, new_archived, new_status, now, application_id))
-        conn.commit()
+        if cur.rowcount != 1:
+            raise ValueError("Договор для этой заявки не найден в БД")
+
+
+@_retrying
+def set_contract_flags_many(rows: Iterable[Tuple[int, Dict[str, Any]]]):
+    """
+    Пакетная версия set_contract_flags: (application_id, {client_signed/director_signed/archived/status}).
+    """
+    now = _now_iso()
+    params = []
+    for app_id, flags in rows:
+        params.append((
+            None if flags.get("client_signed") is None else int(bool(flags["client_signed"])),
+            None if flags.get("director_signed") is None else int(bool(flags["director_signed"])),
+            None if flags.get("archived") is None else int(bool(flags["archived"])),
+            None if flags.get("status") is None else str(flags["status"]),
+            now,
+            int(app_id),
+        ))
+    with _connect() as conn:
+        cur = conn.executemany("""
+            UPDATE contracts
+            SET client_signed = COALESCE(?, client_signed),
+                director_signed = COALESCE(?, director_signed),
+                archived = COALESCE(?, archived),
+                status = COALESCE(?, status),
+                updated_at = ?
+            WHERE application_id = ?
+        """, params)
+        if cur.rowcount != len(params):
+            raise ValueError("Договор для этой заявки не найден в БД")
+
+
+# -------------------------
+# Audit
+# -------------------------
+
+AUDIT_COLUMNS = "id, ts, actor, role, action, entity_type, entity_id, payload"
+
+
+@_retrying
+def insert_audit_events(rows: Iterable[Tuple[str, str, str, str, str, Optional[int], str]]):
+    """Пакетная запись журнала: (ts, actor, role, action, entity_type, entity_id, payload_json)."""
+    with transaction() as conn:
+        conn.executemany("""
+            INSERT INTO audit_events(ts, actor, role, action, entity_type, entity_id, payload)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, list(rows))
+
+
+def list_audit_events(entity_type: str, entity_id: int, limit: int = 200) -> List[Dict[str, Any]]:
+    """История одной сущности ("application", "branch"), новые записи первыми."""
+    with _connect() as conn:
+        cur = conn.execute(f"""
+            SELECT {AUDIT_COLUMNS}
+            FROM audit_events
+            WHERE entity_type = ? AND entity_id = ?
+            ORDER BY ts DESC, id DESC
+            LIMIT ?
+        """, (entity_type, int(entity_id), int(limit)))
+        return [dict(r) for r in cur.fetchall()]
+
+
+def list_audit_events_range(
+    start: str,
+    end: str,
+    limit: int = 1000,
+    *,
+    after: Optional[Tuple[str, int]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    События с start <= ts < end (ISO-строки) по порядку времени.
+    Для продолжения выборки передавайте after = (ts, id) последней полученной записи.
+    """
+    where = "ts >= ? AND ts < ?"
+    params: list = [start, end]
+    if after is not None:
+        where += " AND (ts, id) > (?, ?)"
+        params.extend([after[0], int(after[1])])
+    with _connect() as conn:
+        cur = conn.execute(f"""
+            SELECT {AUDIT_COLUMNS}
+            FROM audit_events
+            WHERE {where}
+            ORDER BY ts, id
+            LIMIT ?
+        """, (*params, int(limit)))
+        return [dict(r) for r in cur.fetchall()]
 
 
 # -------------------------
 # Branches
 # -------------------------
 
+BRANCH_COLUMNS = (
+    "id", "branch_name", "status", "confirmed_by_director", "approved_by_lawyer",
+    "created_by", "created_at", "updated_at", "address", "phone",
+)
+
+
+@_retrying
 def create_branch_request(branch_name: str, address: str, phone: str, created_by: str) -> int:
     now = _now_iso()
     with _connect() as conn:
@@ -305,8 +1103,8 @@ def create_branch_request(branch_name: str, address: str, phone: str, created_by
             INSERT INTO branches(branch_name, address, phone, status, confirmed_by_director, approved_by_lawyer, created_by, created_at, updated_at)
             VALUES (?, ?, ?, ?, 1, 0, ?, ?, ?)
         """, (branch_name, address, phone, BranchStatus.PENDING.name, created_by, now, now))
-        conn.commit()
-        return int(cur.lastrowid)
+    invalidate_reference_cache("branches")
+    return int(cur.lastrowid)
 
 
 def list_branches() -> List[Dict[str, Any]]:
@@ -319,6 +1117,7 @@ def list_branches() -> List[Dict[str, Any]]:
         return [dict(r) for r in cur.fetchall()]
 
 
+@_reference("branches")
 def list_approved_branches() -> List[Dict[str, Any]]:
     with _connect() as conn:
         cur = conn.execute("""
@@ -330,6 +1129,69 @@ def list_approved_branches() -> List[Dict[str, Any]]:
         return [dict(r) for r in cur.fetchall()]
 
 
+BRANCH_WORKLIST_COLUMNS = "id, branch_name, status, created_by, updated_at"
+
+
+def _branch_worklist_filter(role: Role, user_name: str):
+    if role == Role.LAWYER:
+        return "status = ? AND approved_by_lawyer = 0", [BranchStatus.PENDING.name]
+    if role == Role.BRANCH_DIRECTOR:
+        return "created_by = ?", [user_name]
+    return None
+
+
+def list_branch_worklist(
+    role: Role,
+    user_name: str,
+    limit: int = 200,
+    offset: int = 0,
+    *,
+    after: Optional[Tuple[Any, int]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Юрист видит заявки на филиалы, ожидающие одобрения; директор — созданные им.
+    """
+    flt = _branch_worklist_filter(role, user_name)
+    if flt is None:
+        return []
+    where, params = flt
+    return _keyset_page(
+        "branches", BRANCH_WORKLIST_COLUMNS, where, params,
+        sort_expr="id", descending=True, after=after, limit=limit, offset=offset,
+    )
+
+
+def get_branch_worklist_rows(role: Role, user_name: str, branch_ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+    ids = sorted({int(i) for i in branch_ids})
+    flt = _branch_worklist_filter(role, user_name)
+    if flt is None or not ids:
+        return {}
+    where, params = flt
+    with _connect() as conn:
+        cur = conn.execute(
+            f"SELECT {BRANCH_WORKLIST_COLUMNS}, id AS sort_key FROM branches "
+            f"WHERE id IN ({_placeholders(len(ids))}) AND {where}",
+            (*ids, *params),
+        )
+        return {int(r["id"]): dict(r) for r in cur.fetchall()}
+
+
+def count_branch_worklist(role: Role, user_name: str) -> int:
+    flt = _branch_worklist_filter(role, user_name)
+    if flt is None:
+        return 0
+    where, params = flt
+    with _connect() as conn:
+        cur = conn.execute(f"SELECT COUNT(*) AS c FROM branches WHERE {where}", params)
+        return int(cur.fetchone()["c"])
+
+
+def branch_status_counts() -> Dict[str, int]:
+    with _connect() as conn:
+        cur = conn.execute("SELECT status, COUNT(*) AS c FROM branches GROUP BY status")
+        return {r["status"]: int(r["c"]) for r in cur.fetchall()}
+
+
 def get_branch(branch_id: int) -> Optional[Dict[str, Any]]:
     with _connect() as conn:
         cur = conn.execute("SELECT * FROM branches WHERE id = ?", (branch_id,))
@@ -337,18 +1199,356 @@ def get_branch(branch_id: int) -> Optional[Dict[str, Any]]:
         return dict(row) if row else None
 
 
+@_retrying
 def approve_branch_by_lawyer(branch_id: int):
-    branch = get_branch(branch_id)
-    if not branch:
-        raise ValueError("Заявка на филиал не найдена")
-
     now = _now_iso()
     with _connect() as conn:
-        conn.execute("""
+        cur = conn.execute("""
             UPDATE branches
             SET approved_by_lawyer = 1,
                 status = ?,
                 updated_at = ?
-            WHERE id = ?
+            WHERE id = ? AND approved_by_lawyer = 0
         """, (BranchStatus.APPROVED.name, now, branch_id))
-        conn.commit()
+        if cur.rowcount != 1:
+            # запись не прошла: разбираемся почему (только на этом, редком, пути)
+            if get_branch(branch_id) is None:
+                raise ValueError("Заявка на филиал не найдена")
+            raise ValueError("Филиал уже одобрен юристом.")
+    invalidate_reference_cache("branches")
+
+
+# -------------------------
+# Portfolio summary
+# -------------------------
+
+SUMMARY_TOLERANCE = 0.01   # допустимое расхождение сумм при сверке (накопленная погрешность REAL)
+
+
+def portfolio_summary(*, director: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Число заявок и суммы по (филиал договора, вид страхования, статус) из portfolio_summary:
+    читается готовая сводка, заявки не перебираются. branch_id = 0 — договора ещё нет.
+    director — только филиалы, заявку на которые подал этот директор.
+    """
+    # строки с нулём заявок (всё перешло в другие статусы) отбрасываем здесь: сводка мала,
+    # а условие по ним в WHERE заставило бы читать её без индекса
+    where, params = "", []
+    if director is not None:
+        where, params = "WHERE b.created_by = ?", [director]
+    with _connect() as conn:
+        cur = conn.execute(f"""
+            SELECT s.branch_id, b.branch_name, s.insurance_type_id, t.name AS insurance_type_name,
+                   s.status, s.applications, s.insurance_sum, s.tariff_amount
+            FROM portfolio_summary s
+            LEFT JOIN branches b ON b.id = s.branch_id
+            LEFT JOIN insurance_types t ON t.id = s.insurance_type_id
+            {where}
+            ORDER BY s.branch_id, s.insurance_type_id, s.status
+        """, params)
+        return [dict(r) for r in cur.fetchall() if r["applications"]]
+
+
+@_retrying
+def rebuild_portfolio_summary():
+    """Пересчитывает сводку портфеля по заявкам и договорам (полный проход)."""
+    with _connect() as conn:
+        archive_ready(conn)   # вне транзакции: архив, появившийся после открытия соединения, тоже учитывается
+        with transaction():
+            migrations.rebuild_portfolio_summary(conn)
+
+
+def verify_portfolio_summary() -> List[Dict[str, Any]]:
+    """
+    Сверяет portfolio_summary с полным пересчётом (на одном снимке БД, вместе с архивом).
+    Возвращает расхождения: ключ сводки, ожидаемые (expected) и сохранённые (actual) значения.
+    """
+    fields = ("applications", "insurance_sum", "tariff_amount")
+    with _connect() as conn:
+        archive_ready(conn)   # подключает архив, появившийся после открытия соединения
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        stored = {
+            (r["branch_id"], r["insurance_type_id"], r["status"]): r
+            for r in conn.execute("SELECT * FROM portfolio_summary").fetchall()
+            if r["applications"]
+        }
+        expected = {
+            (r["branch_id"], r["insurance_type_id"], r["status"]): r
+            for r in conn.execute(migrations.portfolio_summary_select(conn)).fetchall()
+        }
+
+    problems = []
+    for key in sorted(stored.keys() | expected.keys(), key=lambda k: (k[0], k[1], k[2])):
+        want = {f: expected[key][f] if key in expected else 0 for f in fields}
+        have = {f: stored[key][f] if key in stored else 0 for f in fields}
+        if want["applications"] != have["applications"] or any(
+            abs(float(want[f]) - float(have[f])) > SUMMARY_TOLERANCE for f in fields[1:]
+        ):
+            problems.append({
+                "branch_id": key[0], "insurance_type_id": key[1], "status": key[2],
+                "expected": want, "actual": have,
+            })
+    return problems
+
+
+# -------------------------
+# Archive
+# -------------------------
+# Завершённые заявки переносятся вместе с договорами в архивную БД (тот же id),
+# чтобы основные таблицы и их индексы содержали только заявки в работе.
+# get_application / get_application_detail / get_contract_by_application читают архив,
+# если заявки нет в основной БД; списки задач, поиск и выгрузки архив не затрагивают.
+# Файл архива создаёт первый перенос: до него соединения работают только с основной БД.
+
+
+def archive_path(db_path: Optional[Path] = None) -> Path:
+    """Файл архивной БД: ARCHIVE_PATH или <имя БД>_archive<расширение> рядом с основной."""
+    if ARCHIVE_PATH is not None and db_path is None:
+        return Path(ARCHIVE_PATH)
+    path = Path(db_path or DB_PATH)
+    return path.with_name(f"{path.stem}_archive{path.suffix}")
+
+
+def _attach_archive(conn: sqlite3.Connection):
+    # хук каждого нового соединения пула: подключает архив, только если его файл уже есть
+    if archive_path().exists():
+        conn.execute(f"ATTACH DATABASE ? AS {migrations.ARCHIVE_SCHEMA}", (str(archive_path()),))
+
+
+def archive_ready(conn: sqlite3.Connection) -> bool:
+    """
+    Можно ли читать архив через conn. Соединение, открытое до появления файла архива,
+    подключает его здесь (вне транзакции: ATTACH внутри неё невозможен).
+    False — архива нет, читается только основная БД.
+    """
+    if not migrations.archive_attached(conn) and not conn.in_transaction:
+        _attach_archive(conn)
+    return migrations.archive_ready(conn)
+
+
+def _open_archive(conn: sqlite3.Connection):
+    # перед переносом: создаёт файл архива, если его ещё нет, и приводит его схему к актуальной
+    if not migrations.archive_attached(conn):
+        conn.execute(f"ATTACH DATABASE ? AS {migrations.ARCHIVE_SCHEMA}", (str(archive_path()),))
+    migrations.migrate_archive(conn)
+
+
+def count_archivable(statuses: Sequence[ApplicationStatus], before: str) -> Dict[str, int]:
+    """Сколько заявок в статусах statuses не менялись с момента before (ISO): {status: count}."""
+    with _connect() as conn:
+        cur = conn.execute(f"""
+            SELECT status, COUNT(*) AS c FROM applications
+            WHERE status IN ({_placeholders(len(statuses))}) AND updated_at < ?
+            GROUP BY status
+        """, [s.name for s in statuses] + [before])
+        return {r["status"]: int(r["c"]) for r in cur.fetchall()}
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> str:
+    return ", ".join(r[1] for r in conn.execute(f"PRAGMA main.table_info({table})").fetchall())
+
+
+@_retrying
+def move_to_archive(statuses: Sequence[ApplicationStatus], before: str, limit: int, *, after_id: int = 0) -> List[int]:
+    """
+    Переносит в архивную БД до limit заявок с id > after_id в статусах statuses, не менявшихся
+    с before, вместе с договорами. Возвращает id перенесённых заявок (по возрастанию).
+    Две транзакции: копирование в архив, затем удаление из основной БД. В WAL коммит двух
+    файлов не атомарен, поэтому сбой между ними оставляет копию в обеих БД (её подберёт
+    следующий перенос), но не теряет заявку. Удаление срабатывает триггерами как обычно
+    (журнал изменений, полнотекстовый индекс); вклад заявок в сводку портфеля возвращается.
+    """
+    with _connect() as conn:
+        # ATTACH невозможен внутри транзакции: архив подключается до неё
+        _open_archive(conn)
+        with transaction():
+            # порция — подряд по id: удаление затрагивает соседние страницы таблиц и индексов,
+            # и журнал транзакции в разы меньше, чем при выборке по индексу статуса (+status его отключает)
+            ids = [int(r[0]) for r in conn.execute(f"""
+                SELECT id FROM applications
+                WHERE id > ? AND +status IN ({_placeholders(len(statuses))}) AND updated_at < ?
+                ORDER BY id
+                LIMIT ?
+            """, [int(after_id)] + [s.name for s in statuses] + [before, int(limit)]).fetchall()]
+            if not ids:
+                return []
+            marks = _placeholders(len(ids))
+            # OR REPLACE: копия могла остаться от прерванного переноса
+            cols = _columns(conn, "applications")
+            conn.execute(f"""
+                INSERT OR REPLACE INTO archive.applications({cols})
+                SELECT {cols} FROM main.applications WHERE id IN ({marks})
+            """, ids)
+            cols = _columns(conn, "contracts")
+            conn.execute(f"""
+                INSERT OR REPLACE INTO archive.contracts({cols})
+                SELECT {cols} FROM main.contracts WHERE application_id IN ({marks})
+            """, ids)
+    with transaction() as conn:
+        conn.execute(f"DELETE FROM main.applications WHERE id IN ({marks})", ids)   # договоры — ON DELETE CASCADE
+        conn.execute(migrations.summary_add_archived(f"a.id IN ({marks})"), ids)
+        _trim_changelog(conn)
+    return ids
+
+
+def archive_status_counts() -> Dict[str, int]:
+    with _connect() as conn:
+        if not archive_ready(conn):
+            return {}
+        cur = conn.execute("SELECT status, COUNT(*) AS c FROM archive.applications GROUP BY status")
+        return {r["status"]: int(r["c"]) for r in cur.fetchall()}
+
+
+# -------------------------
+# Export
+# -------------------------
+
+# таблица -> колонки, которые можно выгрузить; заявки и договоры есть и в архивной БД
+EXPORT_TABLES = {
+    "applications": APPLICATION_COLUMNS,
+    "contracts": CONTRACT_COLUMNS,
+    "branches": BRANCH_COLUMNS,
+}
+EXPORT_DATE_COLUMNS = ("created_at", "updated_at")
+EXPORT_FETCH_SIZE = 5000
+
+
+def _export_where(table: str, schema: str, *, status, branch_id, date_column, since, until) -> Tuple[str, list]:
+    conditions, params = ["t.id > ?"], []
+    # +status: порядок по id, без индекса статуса (иначе каждая порция — сортировка всего статуса)
+    if status is not None:
+        conditions.append("+t.status = ?")
+        params.append(status)
+    if branch_id is not None:
+        if table == "applications":
+            conditions.append(
+                f"EXISTS (SELECT 1 FROM {schema}.contracts c WHERE c.application_id = t.id AND c.branch_id = ?)"
+            )
+        elif table == "contracts":
+            conditions.append("t.branch_id = ?")
+        else:
+            conditions.append("t.id = ?")
+        params.append(int(branch_id))
+    if since is not None:
+        conditions.append(f"t.{date_column} >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append(f"t.{date_column} < ?")
+        params.append(until)
+    return " AND ".join(conditions), params
+
+
+def iter_export_rows(
+    table: str,
+    columns: Sequence[str],
+    *,
+    status: Optional[str] = None,
+    branch_id: Optional[int] = None,
+    date_column: str = "created_at",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    after_id: int = 0,
+    limit: Optional[int] = None,
+    include_archive: bool = True,
+    fetch_size: int = EXPORT_FETCH_SIZE,
+) -> Iterator[tuple]:
+    """
+    Строки table с id > after_id по возрастанию id — кортежи в порядке columns (id обязателен),
+    не больше limit. Фильтры: status (значение колонки status), branch_id (филиал договора),
+    [since, until) по date_column. Заявки и договоры, перенесённые в архивную БД, идут вперемешку
+    с основными по id (include_archive). Строки читаются порциями по fetch_size: каждая — отдельный
+    запрос с продолжением после последнего id, и соединение пула возвращается до того, как строки
+    порции отданы. Поэтому вызовы db.* в цикле перебора идут своими транзакциями и снимок WAL
+    не держится всю выгрузку; порции могут видеть разные снимки БД.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Неизвестная таблица для выгрузки: {table}")
+    if "id" not in columns:
+        raise ValueError("В выгрузке нужна колонка id")
+    if date_column not in EXPORT_DATE_COLUMNS:
+        raise ValueError(f"Фильтр по дате возможен только по {', '.join(EXPORT_DATE_COLUMNS)}")
+    select_list(columns, EXPORT_TABLES[table])
+    cols = ", ".join(f"t.{c}" for c in columns)
+    filters = dict(status=status, branch_id=branch_id, date_column=date_column, since=since, until=until)
+
+    id_index = list(columns).index("id")
+    after_id = int(after_id)
+    left = limit
+    while left is None or left > 0:
+        n = fetch_size if left is None else min(fetch_size, int(left))
+        # каждая порция — отдельный запрос с продолжением по id; соединение освобождается до yield
+        with _connect() as conn:
+            where, params = _export_where(table, "main", **filters)
+            sql = f"SELECT {cols} FROM main.{table} t WHERE {where}"
+            params = [after_id] + params
+            if include_archive and table != "branches" and archive_ready(conn):
+                where, archive_params = _export_where(table, "archive", **filters)
+                # копия, оставшаяся в обеих БД после прерванного переноса, выгружается один раз — из основной
+                sql += f"""
+                    UNION ALL
+                    SELECT {cols} FROM archive.{table} t
+                    WHERE {where} AND NOT EXISTS (SELECT 1 FROM main.{table} m WHERE m.id = t.id)
+                """
+                params += [after_id] + archive_params
+            sql += " ORDER BY id LIMIT ?"
+            params.append(n)
+
+            cur = conn.cursor()
+            cur.row_factory = None   # простые кортежи: пишутся в файл как есть
+            rows = cur.execute(sql, params).fetchall()
+        yield from rows
+        if len(rows) < n:
+            return
+        after_id = int(rows[-1][id_index])
+        if left is not None:
+            left -= n
+
+
+# -------------------------
+# Changelog
+# -------------------------
+# Журнал пополняют триггеры при каждой записи, а читают только открытые окна (core/events.py).
+# Чтобы он не рос без окна (cron, python -m cli), его обрезают db_init и пакетные записи:
+# когда накопилось вдвое больше CHANGELOG_KEEP, остаются последние CHANGELOG_KEEP записей.
+
+CHANGELOG_KEEP = 20000
+
+
+def _trim_changelog(conn: sqlite3.Connection, keep: int = CHANGELOG_KEEP):
+    # MIN и MAX — отдельными подзапросами: так каждый читает один край первичного ключа
+    first, last = conn.execute("SELECT (SELECT MIN(id) FROM changelog), (SELECT MAX(id) FROM changelog)").fetchone()
+    if first is not None and last - first >= 2 * keep:
+        conn.execute("DELETE FROM changelog WHERE id <= ?", (last - keep,))
+
+
+def last_change_id() -> int:
+    with _connect() as conn:
+        cur = conn.execute("SELECT COALESCE(MAX(id), 0) AS m FROM changelog")
+        return int(cur.fetchone()["m"])
+
+
+def first_change_id() -> int:
+    with _connect() as conn:
+        cur = conn.execute("SELECT COALESCE(MIN(id), 0) AS m FROM changelog")
+        return int(cur.fetchone()["m"])
+
+
+def list_changes(after_id: int, limit: int = 1000) -> List[Dict[str, Any]]:
+    """Записи журнала изменений (заполняется триггерами) с id > after_id, по возрастанию."""
+    with _connect() as conn:
+        cur = conn.execute("""
+            SELECT id, entity, entity_id, op
+            FROM changelog
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        """, (int(after_id), int(limit)))
+        return [dict(r) for r in cur.fetchall()]
+
+
+@_retrying
+def prune_changes(keep_after_id: int):
+    """Удаляет записи журнала изменений с id <= keep_after_id."""
+    with _connect() as conn:
+        conn.execute("DELETE FROM changelog WHERE id <= ?", (int(keep_after_id),))
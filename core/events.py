@@ -0,0 +1,163 @@
+"""
+Уведомления об изменениях данных.
+
+Источник — таблица changelog, которую заполняют триггеры на applications,
+contracts, branches и insurance_types (см. migrations._m006_changelog), поэтому
+видны изменения и этого, и других процессов, работающих с тем же файлом БД.
+
+ChangeWatcher опрашивает PRAGMA data_version на отдельном соединении (запрос
+не читает файл БД); журнал читается только когда кто-то закоммитил запись.
+Коммит через пул этого процесса будит наблюдателя сразу, не дожидаясь опроса.
+Подписчики получают пачку изменений (без повторов) в потоке наблюдателя.
+"""
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from core import db
+
+POLL_INTERVAL_MS = 500
+READ_LIMIT = 1000          # записей журнала за одно чтение
+PRUNE_INTERVAL_S = 60.0
+
+
+@dataclass(frozen=True)
+class Change:
+    entity: str                 # "application" | "branch" | "insurance_type" | "*"
+    entity_id: Optional[int]
+    op: str                     # "insert" | "update" | "delete" | "reset"
+
+
+# журнал очищен раньше, чем наблюдатель его дочитал: точечно обновить нельзя, нужна полная перезагрузка
+RESET = Change("*", None, "reset")
+
+# сущность журнала -> группа кэша справочников в core/db
+_CACHE_GROUPS = {"branch": "branches", "insurance_type": "insurance_types"}
+
+_listeners: List[Callable[[List[Change]], None]] = []
+_listeners_lock = threading.Lock()
+
+
+def subscribe(listener: Callable[[List[Change]], None]):
+    with _listeners_lock:
+        _listeners.append(listener)
+
+
+def unsubscribe(listener: Callable[[List[Change]], None]):
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def publish(changes: List[Change]):
+    if not changes:
+        return
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        try:
+            listener(changes)
+        except Exception as e:
+            print(f"events: ошибка обработчика изменений: {e}", file=sys.stderr)
+
+
+class ChangeWatcher:
+    def __init__(self, poll_interval_ms: int = POLL_INTERVAL_MS):
+        self.poll_interval = poll_interval_ms / 1000.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_id = 0
+        self._data_version: Optional[int] = None
+        self._last_prune = 0.0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._last_id = db.last_change_id()
+        self._last_prune = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="change-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        conn = sqlite3.connect(
+            Path(db.DB_PATH), timeout=db.get_pool().config.busy_timeout_ms / 1000.0, check_same_thread=False
+        )
+        try:
+            while not self._stop.is_set():
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+                try:
+                    version = int(conn.execute("PRAGMA data_version").fetchone()[0])
+                    if version != self._data_version:
+                        self._data_version = version
+                        self._poll()
+                    if time.monotonic() - self._last_prune >= PRUNE_INTERVAL_S:
+                        self._last_prune = time.monotonic()
+                        db.prune_changes(self._last_id - db.CHANGELOG_KEEP)
+                except Exception as e:
+                    print(f"events: не удалось прочитать журнал изменений: {e}", file=sys.stderr)
+        finally:
+            conn.close()
+
+    def _poll(self):
+        if db.first_change_id() > self._last_id + 1:
+            # часть журнала уже удалена другим процессом — пропущенное не восстановить
+            self._last_id = db.last_change_id()
+            self._dispatch([RESET])
+            return
+
+        while True:
+            rows = db.list_changes(self._last_id, READ_LIMIT)
+            if not rows:
+                return
+            self._last_id = int(rows[-1]["id"])
+            seen = {}
+            for r in rows:
+                key = (r["entity"], r["entity_id"])
+                # одна строка в пачке — последняя операция над ней
+                seen.pop(key, None)
+                seen[key] = Change(r["entity"], None if r["entity_id"] is None else int(r["entity_id"]), r["op"])
+            self._dispatch(list(seen.values()))
+            if len(rows) < READ_LIMIT:
+                return
+
+    def _dispatch(self, changes: List[Change]):
+        for group in {_CACHE_GROUPS[c.entity] for c in changes if c.entity in _CACHE_GROUPS}:
+            db.invalidate_reference_cache(group)
+        if RESET in changes:
+            db.invalidate_reference_cache()
+        publish(changes)
+
+
+_watcher = ChangeWatcher()
+db.add_commit_hook(_watcher.wake)
+
+
+def start_watcher():
+    _watcher.start()
+
+
+def stop_watcher():
+    _watcher.stop()
+
+
+def watcher() -> ChangeWatcher:
+    return _watcher
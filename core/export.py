@@ -0,0 +1,359 @@
+"""
+Потоковая выгрузка заявок, договоров и филиалов: CSV, JSONL и колоночный .npz (numpy).
+
+Строки читаются db.iter_export_rows по возрастанию id сегментами по segment_rows,
+каждый сегмент — порциями db.EXPORT_FETCH_SIZE (память не растёт с размером выгрузки,
+соединение с БД между порциями свободно). Сегмент — одна контрольная точка: после него
+файл сбрасывается на диск, а в контрольную точку пишутся последний id и длина файла.
+resume=True продолжает прерванную выгрузку: файл обрезается до длины из контрольной
+точки (строки недописанного сегмента) и дописывается с id после последнего. После успешной выгрузки контрольная точка удаляется.
+
+npz — каталог с частями part-000001.npz (по одной на сегмент, сжатые) и manifest.json.
+В части попадают только колонки, которые удобно считать массивами: числа (NULL — NaN),
+флаги (bool), даты (datetime64[s]) и статус (код int16, расшифровка — массив status_labels).
+Прочие текстовые колонки в npz не пишутся. numpy импортируется только для npz.
+"""
+import csv
+import io
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, TextIO
+
+from core import audit, db
+from core.enums import ApplicationStatus, BranchStatus, Role
+
+FORMATS = ("csv", "jsonl", "npz")
+ENTITIES = tuple(db.EXPORT_TABLES)
+SEGMENT_ROWS = 100_000   # строк на контрольную точку (для npz — на одну часть)
+
+# значения status по таблицам (у договоров — свои, см. InsuranceService)
+STATUSES = {
+    "applications": tuple(s.name for s in ApplicationStatus),
+    "contracts": ("prepared", "client_signed", "director_signed", "archived"),
+    "branches": tuple(s.name for s in BranchStatus),
+}
+
+# колонки по умолчанию: без длинных текстов (request_text, draft_text)
+DEFAULT_COLUMNS = {
+    "applications": db.APPLICATION_SUMMARY_COLUMNS,
+    "contracts": db.CONTRACT_SUMMARY_COLUMNS,
+    "branches": db.BRANCH_COLUMNS,
+}
+
+# колонки npz: тип массива
+_NPZ_INT = {"id", "application_id", "risk_percent"}
+_NPZ_FLOAT = {"insurance_type_id", "branch_id", "insurance_sum", "tariff_rate", "tariff_amount"}   # NULL -> NaN
+_NPZ_BOOL = {"client_signed", "director_signed", "archived", "confirmed_by_director", "approved_by_lawyer"}
+_NPZ_DATE = {"created_at", "updated_at", "contract_date", "underwriter_updated_at", "admin_updated_at"}
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Для выгрузки в npz нужен пакет numpy (pip install numpy)") from None
+    return numpy
+
+
+@dataclass
+class ExportFilters:
+    status: Optional[str] = None
+    branch_id: Optional[int] = None
+    date_column: str = "created_at"
+    since: Optional[str] = None     # ISO-дата или дата-время, включительно
+    until: Optional[str] = None     # не включительно
+    include_archive: bool = True
+
+
+@dataclass
+class ExportReport:
+    entity: str
+    format: str
+    path: str
+    columns: List[str]
+    filters: Dict[str, Any]
+    rows: int = 0
+    segments: int = 0
+    last_id: int = 0
+    resumed_after_id: Optional[int] = None
+    resumed_rows: int = 0          # строк, выгруженных до продолжения
+    seconds: float = 0.0
+    skipped_columns: List[str] = field(default_factory=list)   # не попали в npz
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "entity": self.entity,
+            "format": self.format,
+            "path": self.path,
+            "columns": self.columns,
+            "filters": self.filters,
+            "rows": self.rows,
+            "segments": self.segments,
+            "last_id": self.last_id,
+            "resumed_after_id": self.resumed_after_id,
+            "resumed_rows": self.resumed_rows,
+            "skipped_columns": self.skipped_columns,
+            "seconds": round(self.seconds, 3),
+            "rows_per_s": round((self.rows - self.resumed_rows) / self.seconds) if self.seconds and self.rows else None,
+        }
+
+
+# -------------------------
+# Writers
+# -------------------------
+
+class _TextWriter:
+    """CSV / JSONL в файл (дозапись с обрезкой до контрольной точки) или в поток (без контрольных точек)."""
+
+    def __init__(self, fmt: str, columns: Sequence[str], path: Optional[Path], stream: Optional[TextIO] = None):
+        self.fmt = fmt
+        self.columns = list(columns)
+        self.path = path
+        self._raw = None
+        self.out = stream
+        self._csv = None
+
+    def open(self, offset: Optional[int]):
+        if self.path is not None:
+            if offset is None:
+                self._raw = open(self.path, "wb")
+            else:
+                self._raw = open(self.path, "r+b")
+                self._raw.truncate(offset)
+                self._raw.seek(offset)
+            self.out = io.TextIOWrapper(self._raw, encoding="utf-8", newline="")
+        if self.fmt == "csv":
+            self._csv = csv.writer(self.out)
+            if offset is None:
+                self._csv.writerow(self.columns)
+
+    def write(self, row: tuple):
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self.out.write(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False))
+            self.out.write("\n")
+
+    def commit(self) -> Dict[str, Any]:
+        self.out.flush()
+        if self._raw is None:
+            return {}
+        os.fsync(self._raw.fileno())
+        return {"bytes": self._raw.tell()}
+
+    def close(self):
+        if self._raw is not None:
+            self.out.close()
+        else:
+            self.out.flush()
+
+
+class _NpzWriter:
+    """Каталог частей part-NNNNNN.npz: сегмент копится в памяти и пишется одной сжатой частью."""
+
+    def __init__(self, entity: str, columns: Sequence[str], path: Path):
+        self.np = _numpy()
+        self.entity = entity
+        self.path = path
+        self.columns = list(columns)
+        self.kept = [
+            (i, c) for i, c in enumerate(columns)
+            if c in _NPZ_INT or c in _NPZ_FLOAT or c in _NPZ_BOOL or c in _NPZ_DATE or c == "status"
+        ]
+        self.skipped = [c for c in columns if c not in {c for _, c in self.kept}]
+        self.labels = STATUSES[entity]
+        self._codes = {name: code for code, name in enumerate(self.labels)}
+        self._rows: List[tuple] = []
+        self.parts = 0
+
+    def open(self, parts: Optional[int]):
+        self.path.mkdir(parents=True, exist_ok=True)
+        if parts is None:
+            # новая выгрузка: убираем только свои файлы прошлой
+            for old in list(self.path.glob("part-*.npz")) + [self.path / "manifest.json"]:
+                old.unlink(missing_ok=True)
+        else:
+            self.parts = parts
+
+    def write(self, row: tuple):
+        self._rows.append(row)
+
+    def _column(self, name: str, values: list):
+        np = self.np
+        if name in _NPZ_INT:
+            return np.array(values, dtype=np.int64)
+        if name in _NPZ_FLOAT:
+            return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        if name in _NPZ_BOOL:
+            return np.array([bool(v) for v in values], dtype=np.bool_)
+        if name in _NPZ_DATE:
+            return np.array(values, dtype="datetime64[s]")   # None -> NaT
+        return np.array([self._codes.get(v, -1) for v in values], dtype=np.int16)
+
+    def commit(self) -> Dict[str, Any]:
+        if self._rows:
+            cols = list(zip(*self._rows))
+            arrays = {name: self._column(name, list(cols[i])) for i, name in self.kept}
+            if "status" in arrays:
+                arrays["status_labels"] = self.np.array(self.labels)
+            self.parts += 1
+            target = self.path / f"part-{self.parts:06d}.npz"
+            tmp = target.with_name(target.name + ".tmp")
+            with open(tmp, "wb") as f:
+                self.np.savez_compressed(f, **arrays)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, target)
+            self._rows = []
+        return {"parts": self.parts}
+
+    def close(self):
+        pass
+
+
+# -------------------------
+# Checkpoints
+# -------------------------
+
+def checkpoint_path(path: Path, fmt: str) -> Path:
+    path = Path(path)
+    return path / "checkpoint.json" if fmt == "npz" else path.with_name(path.name + ".checkpoint.json")
+
+
+def _save_checkpoint(path: Path, state: Dict[str, Any]):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _load_checkpoint(path: Path, expected: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not path.exists():
+        return None
+    try:
+        state = json.loads(path.read_text(encoding="utf-8"))
+    except ValueError as e:
+        raise ValueError(f"Повреждена контрольная точка {path}: {e}") from None
+    for key, value in expected.items():
+        if state.get(key) != value:
+            raise ValueError(
+                f"Контрольная точка {path} относится к другой выгрузке ({key}: {state.get(key)!r} вместо {value!r}); "
+                f"удалите её или запустите выгрузку без продолжения"
+            )
+    return state
+
+
+# -------------------------
+# Export
+# -------------------------
+
+def _check(entity: str, fmt: str, columns: List[str], filters: ExportFilters):
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt} (допустимо: {', '.join(FORMATS)})")
+    db.select_list(columns, db.EXPORT_TABLES[entity])
+    if filters.status is not None and filters.status not in STATUSES[entity]:
+        raise ValueError(f"Неизвестный статус: {filters.status} (допустимо: {', '.join(STATUSES[entity])})")
+    if filters.date_column not in db.EXPORT_DATE_COLUMNS:
+        raise ValueError(f"Фильтр по дате возможен только по {', '.join(db.EXPORT_DATE_COLUMNS)}")
+    for value in (filters.since, filters.until):
+        if value is not None:
+            try:
+                datetime.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"Дата должна быть в формате ISO (2024-01-31 или 2024-01-31T12:00:00): {value}")
+
+
+def export(
+    entity: str,
+    path: Optional[Path],
+    *,
+    fmt: str = "csv",
+    columns: Optional[Sequence[str]] = None,
+    filters: Optional[ExportFilters] = None,
+    segment_rows: int = SEGMENT_ROWS,
+    resume: bool = False,
+    stream: Optional[TextIO] = None,
+    user=None,
+) -> ExportReport:
+    """
+    Выгружает entity (applications, contracts, branches) в path; path=None — в stream (CSV/JSONL,
+    без контрольных точек). columns — колонки в нужном порядке (id добавляется первой, если его нет).
+    user — кто выполняет выгрузку (только администратор); итог пишется в журнал действий.
+    """
+    if user is not None and user.role != Role.ADMIN:
+        raise PermissionError("Выгрузка данных доступна только администратору")
+    if entity not in ENTITIES:
+        raise ValueError(f"Неизвестный вид данных: {entity} (допустимо: {', '.join(ENTITIES)})")
+    filters = filters or ExportFilters()
+    columns = list(columns or DEFAULT_COLUMNS[entity])
+    if "id" not in columns:
+        columns.insert(0, "id")
+    _check(entity, fmt, columns, filters)
+    if segment_rows <= 0:
+        raise ValueError("Размер сегмента должен быть больше 0")
+    if path is None and (fmt == "npz" or resume):
+        raise ValueError("В поток выгружаются только CSV и JSONL, без продолжения")
+
+    report = ExportReport(entity, fmt, str(path) if path is not None else "-", columns, asdict(filters))
+    if fmt == "npz":
+        writer = _NpzWriter(entity, columns, Path(path))
+        report.skipped_columns = writer.skipped
+    else:
+        writer = _TextWriter(fmt, columns, Path(path) if path is not None else None, stream)
+
+    # контрольная точка: чья выгрузка и докуда дописано
+    cp_path = checkpoint_path(Path(path), fmt) if path is not None else None
+    identity = {"entity": entity, "format": fmt, "columns": columns, "filters": report.filters}
+    state = _load_checkpoint(cp_path, identity) if cp_path is not None and resume else None
+    if state is not None:
+        report.resumed_after_id = report.last_id = int(state["last_id"])
+        report.rows, report.segments = int(state["rows"]), int(state["segments"])
+        report.resumed_rows = report.rows
+        writer.open(state.get("parts") if fmt == "npz" else state["bytes"])
+    else:
+        writer.open(None)
+        if cp_path is not None:
+            _save_checkpoint(cp_path, {**identity, "last_id": 0, "rows": 0, "segments": 0, **writer.commit()})
+
+    started = time.perf_counter()
+    id_index = columns.index("id")
+    try:
+        while True:
+            count = 0
+            for row in db.iter_export_rows(
+                entity, columns,
+                status=filters.status, branch_id=filters.branch_id, date_column=filters.date_column,
+                since=filters.since, until=filters.until, include_archive=filters.include_archive,
+                after_id=report.last_id, limit=segment_rows,
+            ):
+                writer.write(row)
+                count += 1
+                last_id = row[id_index]
+            if not count:
+                break
+            written = writer.commit()
+            report.rows += count
+            report.segments += 1
+            report.last_id = int(last_id)
+            if cp_path is not None:
+                _save_checkpoint(cp_path, {
+                    **identity, "last_id": report.last_id, "rows": report.rows, "segments": report.segments, **written,
+                })
+            if count < segment_rows:
+                break
+    finally:
+        writer.close()
+    report.seconds = time.perf_counter() - started
+
+    if fmt == "npz":
+        manifest = {**report.to_dict(), "parts": writer.parts, "status_labels": list(writer.labels)}
+        (Path(path) / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    if cp_path is not None:
+        cp_path.unlink(missing_ok=True)
+
+    if user is not None:
+        audit.record(user.name, user.role.name, "EXPORT", entity, None, report.to_dict())
+    return report
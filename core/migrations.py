@@ -0,0 +1,588 @@
+"""
+Версионные миграции схемы insurance.db.
+
+Версия схемы хранится в PRAGMA user_version. Шаги из MIGRATIONS применяются
+по порядку, начиная с текущей версии, в одной транзакции вместе с записью
+новой версии. Новые колонки, индексы и таблицы добавляются только новым шагом
+в конец списка; уже выпущенные шаги не меняются.
+"""
+import re
+import sqlite3
+from typing import Callable, List
+
+
+def _table_has_column(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    cur = conn.execute(f"PRAGMA table_info({table})")
+    cols = [r[1] for r in cur.fetchall()]
+    return column in cols
+
+
+def _ensure_column(conn: sqlite3.Connection, table: str, column: str, ddl: str):
+    if not _table_has_column(conn, table, column):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+# -------------------------
+# Steps
+# -------------------------
+
+def _m001_base_schema(conn: sqlite3.Connection):
+    # исходная схема; для БД, созданных до появления миграций, досоздаёт недостающие колонки
+
+    # -------------------------
+    # Applications
+    # -------------------------
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS applications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        client_name TEXT NOT NULL,
+        status TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """)
+
+    # данные клиента/объекта (вводит клиент)
+    _ensure_column(conn, "applications", "client_fio", "TEXT NOT NULL DEFAULT ''")
+    _ensure_column(conn, "applications", "insured_object", "TEXT NOT NULL DEFAULT ''")
+    _ensure_column(conn, "applications", "request_text", "TEXT NOT NULL DEFAULT ''")
+
+    # оценка андеррайтера: риск + ОДИН вид страхования
+    _ensure_column(conn, "applications", "risk_percent", "INTEGER NOT NULL DEFAULT 0")
+    _ensure_column(conn, "applications", "insurance_type_id", "INTEGER")
+    _ensure_column(conn, "applications", "underwriter_updated_at", "TEXT")
+
+    # решение администратора: страховая сумма + тарифная ставка + рассчитанный тариф
+    _ensure_column(conn, "applications", "insurance_sum", "REAL")
+    _ensure_column(conn, "applications", "tariff_rate", "REAL")   # в процентах
+    _ensure_column(conn, "applications", "tariff_amount", "REAL") # сумма к оплате (можем считать)
+    _ensure_column(conn, "applications", "admin_updated_at", "TEXT")
+
+    # -------------------------
+    # Branches (филиалы)
+    # -------------------------
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS branches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        branch_name TEXT NOT NULL,
+        status TEXT NOT NULL,
+        confirmed_by_director INTEGER NOT NULL DEFAULT 1,
+        approved_by_lawyer INTEGER NOT NULL DEFAULT 0,
+        created_by TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """)
+    _ensure_column(conn, "branches", "address", "TEXT NOT NULL DEFAULT ''")
+    _ensure_column(conn, "branches", "phone", "TEXT NOT NULL DEFAULT ''")
+
+    # -------------------------
+    # Insurance types (справочник видов страхования)
+    # -------------------------
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS insurance_types (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        is_active INTEGER NOT NULL DEFAULT 1
+    )
+    """)
+
+    # seed видов страхования (если пусто)
+    cur = conn.execute("SELECT COUNT(*) as c FROM insurance_types")
+    if int(cur.fetchone()[0]) == 0:
+        default_types = [
+            "Страхование автотранспорта от угона",
+            "Страхование домашнего имущества",
+            "Добровольное медицинское страхование",
+        ]
+        for n in default_types:
+            conn.execute("INSERT INTO insurance_types(name, is_active) VALUES (?, 1)", (n,))
+
+    # -------------------------
+    # Contracts (договоры)
+    # -------------------------
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS contracts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        application_id INTEGER NOT NULL UNIQUE,
+        status TEXT NOT NULL,
+        client_signed INTEGER NOT NULL DEFAULT 0,
+        director_signed INTEGER NOT NULL DEFAULT 0,
+        archived INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        FOREIGN KEY(application_id) REFERENCES applications(id) ON DELETE CASCADE
+    )
+    """)
+    # поля договора по предметной области
+    _ensure_column(conn, "contracts", "contract_date", "TEXT")         # дата заключения
+    _ensure_column(conn, "contracts", "insurance_sum", "REAL")
+    _ensure_column(conn, "contracts", "insurance_type_id", "INTEGER")
+    _ensure_column(conn, "contracts", "tariff_rate", "REAL")
+    _ensure_column(conn, "contracts", "tariff_amount", "REAL")
+    _ensure_column(conn, "contracts", "branch_id", "INTEGER")
+    _ensure_column(conn, "contracts", "draft_text", "TEXT")
+
+
+# горячие фильтры и сортировки (проверяются core/query_plan.py)
+_INDEXES_V2 = [
+    # список задач ролей: status IN (...) ORDER BY id DESC
+    "CREATE INDEX IF NOT EXISTS idx_applications_status ON applications(status, id)",
+    # список задач клиента: client_name = ? AND status IN (...)
+    "CREATE INDEX IF NOT EXISTS idx_applications_client ON applications(client_name, status, id)",
+    # одобренные филиалы (ORDER BY branch_name) и заявки на филиалы для юриста
+    "CREATE INDEX IF NOT EXISTS idx_branches_status ON branches(status, approved_by_lawyer, branch_name)",
+    # заявки на филиалы директора
+    "CREATE INDEX IF NOT EXISTS idx_branches_created_by ON branches(created_by, id)",
+    "CREATE INDEX IF NOT EXISTS idx_insurance_types_active ON insurance_types(is_active, name)",
+]
+
+
+def _m002_indexes(conn: sqlite3.Connection):
+    for ddl in _INDEXES_V2:
+        conn.execute(ddl)
+
+
+def _m003_worklist_sort_indexes(conn: sqlite3.Connection):
+    # сортировки списка задач по дате изменения и страховой сумме (keyset-подгрузка)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_applications_status_updated ON applications(status, updated_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_applications_status_sum ON applications(status, COALESCE(insurance_sum, 0), id)")
+
+
+def _m004_application_detail_view(conn: sqlite3.Connection):
+    # карточка заявки одним запросом: заявка + вид страхования + договор + филиал
+    conn.execute("DROP VIEW IF EXISTS application_detail_v")
+    conn.execute("""
+    CREATE VIEW application_detail_v AS
+    SELECT
+        a.id, a.client_name, a.client_fio, a.insured_object, a.request_text,
+        a.status, a.created_at, a.updated_at,
+        a.risk_percent, a.insurance_type_id, t.name AS insurance_type_name,
+        a.insurance_sum, a.tariff_rate, a.tariff_amount,
+
+        c.id AS contract_id,
+        c.status AS contract_status,
+        c.contract_date,
+        c.insurance_type_id AS contract_insurance_type_id,
+        ct.name AS contract_insurance_type_name,
+        c.insurance_sum AS contract_insurance_sum,
+        c.tariff_rate AS contract_tariff_rate,
+        c.tariff_amount AS contract_tariff_amount,
+        c.client_signed, c.director_signed, c.archived,
+        c.draft_text,
+        c.updated_at AS contract_updated_at,
+
+        c.branch_id,
+        b.branch_name, b.address AS branch_address, b.phone AS branch_phone
+    FROM applications a
+    LEFT JOIN insurance_types t ON t.id = a.insurance_type_id
+    LEFT JOIN contracts c ON c.application_id = a.id
+    LEFT JOIN insurance_types ct ON ct.id = c.insurance_type_id
+    LEFT JOIN branches b ON b.id = c.branch_id
+    """)
+
+
+def _m005_audit_events(conn: sqlite3.Connection):
+    # постоянный журнал действий пользователей (пишется фоновым потоком core/audit.py)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS audit_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts TEXT NOT NULL,
+        actor TEXT NOT NULL,
+        role TEXT NOT NULL,
+        action TEXT NOT NULL,
+        entity_type TEXT NOT NULL,
+        entity_id INTEGER,
+        payload TEXT NOT NULL DEFAULT '{}'
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_events_ts ON audit_events(ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_events_entity ON audit_events(entity_type, entity_id, ts)")
+
+
+# таблица -> (сущность в журнале изменений, выражение id сущности)
+_CHANGELOG_SOURCES = {
+    "applications": ("application", "id"),
+    "contracts": ("application", "application_id"),
+    "branches": ("branch", "id"),
+    "insurance_types": ("insurance_type", "id"),
+}
+
+
+def create_changelog_triggers(conn: sqlite3.Connection):
+    for table, (entity, key) in _CHANGELOG_SOURCES.items():
+        for op, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_changelog_{table}_{op.lower()}
+            AFTER {op} ON {table}
+            BEGIN
+                INSERT INTO changelog(entity, entity_id, op) VALUES ('{entity}', {row}.{key}, '{op.lower()}');
+            END
+            """)
+
+
+def drop_changelog_triggers(conn: sqlite3.Connection):
+    """Для массовой загрузки в новую БД: построчный журнал изменений там не нужен."""
+    for table in _CHANGELOG_SOURCES:
+        for op in ("insert", "update", "delete"):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_changelog_{table}_{op}")
+
+
+def _m006_changelog(conn: sqlite3.Connection):
+    # журнал изменений строк: его читают открытые окна (в том числе других процессов), см. core/events.py
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS changelog (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,
+        entity_id INTEGER,
+        op TEXT NOT NULL
+    )
+    """)
+    create_changelog_triggers(conn)
+
+
+# -------------------------
+# Portfolio summary
+# -------------------------
+# portfolio_summary — число заявок и суммы по (филиал договора, вид страхования, статус).
+# branch_id = 0 — договора ещё нет, insurance_type_id = 0 — вид ещё не выбран.
+# Таблицу ведут триггеры: каждое изменение заявки или договора снимает вклад старой строки
+# и добавляет вклад новой, поэтому сводка всегда согласована с applications/contracts.
+
+_SUMMARY_UPSERT = """
+    ON CONFLICT(branch_id, insurance_type_id, status) DO UPDATE SET
+        applications = applications + excluded.applications,
+        insurance_sum = insurance_sum + excluded.insurance_sum,
+        tariff_amount = tariff_amount + excluded.tariff_amount;
+"""
+
+
+def _summary_delta_row(row: str, branch: str, sign: str) -> str:
+    # вклад строки заявки NEW/OLD триггера applications
+    return f"""
+    INSERT INTO portfolio_summary(branch_id, insurance_type_id, status, applications, insurance_sum, tariff_amount)
+    VALUES ({branch}, COALESCE({row}.insurance_type_id, 0), {row}.status,
+            {sign}1, {sign}COALESCE({row}.insurance_sum, 0), {sign}COALESCE({row}.tariff_amount, 0))
+    {_SUMMARY_UPSERT}"""
+
+
+def _summary_delta_app(app_id: str, branch: str, sign: str) -> str:
+    # вклад заявки app_id из таблицы (триггеры contracts); заявки уже нет — ничего не делает
+    return f"""
+    INSERT INTO portfolio_summary(branch_id, insurance_type_id, status, applications, insurance_sum, tariff_amount)
+    SELECT {branch}, COALESCE(a.insurance_type_id, 0), a.status,
+           {sign}1, {sign}COALESCE(a.insurance_sum, 0), {sign}COALESCE(a.tariff_amount, 0)
+    FROM applications a WHERE a.id = {app_id}
+    {_SUMMARY_UPSERT}"""
+
+
+def _contract_branch(app_id: str) -> str:
+    return f"COALESCE((SELECT branch_id FROM contracts WHERE application_id = {app_id}), 0)"
+
+
+_SUMMARY_TRIGGERS = {
+    "trg_summary_applications_insert": f"""
+        AFTER INSERT ON applications
+        BEGIN {_summary_delta_row("NEW", _contract_branch("NEW.id"), "")} END""",
+    "trg_summary_applications_update": f"""
+        AFTER UPDATE OF status, insurance_type_id, insurance_sum, tariff_amount ON applications
+        WHEN OLD.status IS NOT NEW.status
+          OR OLD.insurance_type_id IS NOT NEW.insurance_type_id
+          OR OLD.insurance_sum IS NOT NEW.insurance_sum
+          OR OLD.tariff_amount IS NOT NEW.tariff_amount
+        BEGIN
+            {_summary_delta_row("OLD", _contract_branch("OLD.id"), "-")}
+            {_summary_delta_row("NEW", _contract_branch("NEW.id"), "")}
+        END""",
+    # BEFORE: договор (ON DELETE CASCADE) ещё на месте, и вклад снимается с его филиала
+    "trg_summary_applications_delete": f"""
+        BEFORE DELETE ON applications
+        BEGIN {_summary_delta_row("OLD", _contract_branch("OLD.id"), "-")} END""",
+    "trg_summary_contracts_insert": f"""
+        AFTER INSERT ON contracts
+        BEGIN
+            {_summary_delta_app("NEW.application_id", "0", "-")}
+            {_summary_delta_app("NEW.application_id", "COALESCE(NEW.branch_id, 0)", "")}
+        END""",
+    "trg_summary_contracts_update": f"""
+        AFTER UPDATE OF branch_id ON contracts
+        WHEN OLD.branch_id IS NOT NEW.branch_id
+        BEGIN
+            {_summary_delta_app("NEW.application_id", "COALESCE(OLD.branch_id, 0)", "-")}
+            {_summary_delta_app("NEW.application_id", "COALESCE(NEW.branch_id, 0)", "")}
+        END""",
+    "trg_summary_contracts_delete": f"""
+        AFTER DELETE ON contracts
+        BEGIN
+            {_summary_delta_app("OLD.application_id", "COALESCE(OLD.branch_id, 0)", "-")}
+            {_summary_delta_app("OLD.application_id", "0", "")}
+        END""",
+}
+
+# полный пересчёт сводки (миграция, rebuild, сверка)
+PORTFOLIO_SUMMARY_SELECT = """
+    SELECT COALESCE(c.branch_id, 0) AS branch_id, COALESCE(a.insurance_type_id, 0) AS insurance_type_id,
+           a.status, COUNT(*) AS applications,
+           TOTAL(a.insurance_sum) AS insurance_sum, TOTAL(a.tariff_amount) AS tariff_amount
+    FROM applications a
+    LEFT JOIN contracts c ON c.application_id = a.id
+    GROUP BY 1, 2, 3
+"""
+
+
+def portfolio_summary_select(conn: sqlite3.Connection) -> str:
+    """
+    Полный пересчёт сводки с учётом архивной БД (если она подключена): перенесённые
+    в архив заявки остаются в портфеле. Копия заявки, оставшаяся в обеих БД (перенос
+    прервали между копированием и удалением), считается один раз (UNION).
+    """
+    if not archive_ready(conn):
+        return PORTFOLIO_SUMMARY_SELECT
+    parts = [
+        f"""
+        SELECT a.id, COALESCE(c.branch_id, 0) AS branch_id, COALESCE(a.insurance_type_id, 0) AS insurance_type_id,
+               a.status, a.insurance_sum, a.tariff_amount
+        FROM {schema}.applications a
+        LEFT JOIN {schema}.contracts c ON c.application_id = a.id"""
+        for schema in ("main", ARCHIVE_SCHEMA)
+    ]
+    return f"""
+    SELECT branch_id, insurance_type_id, status, COUNT(*) AS applications,
+           TOTAL(insurance_sum) AS insurance_sum, TOTAL(tariff_amount) AS tariff_amount
+    FROM ({" UNION ".join(parts)})
+    GROUP BY 1, 2, 3
+    """
+
+
+def summary_add_archived(id_filter: str) -> str:
+    """
+    Возвращает в сводку вклад заявок, перенесённых в архив (id_filter — условие по a.id):
+    при удалении из основной БД его сняли триггеры, а в портфеле заявки остаются.
+    """
+    return f"""
+    INSERT INTO main.portfolio_summary(branch_id, insurance_type_id, status, applications, insurance_sum, tariff_amount)
+    SELECT COALESCE(c.branch_id, 0), COALESCE(a.insurance_type_id, 0), a.status,
+           COUNT(*), TOTAL(a.insurance_sum), TOTAL(a.tariff_amount)
+    FROM {ARCHIVE_SCHEMA}.applications a
+    LEFT JOIN {ARCHIVE_SCHEMA}.contracts c ON c.application_id = a.id
+    WHERE {id_filter}
+    GROUP BY 1, 2, 3
+    {_SUMMARY_UPSERT}"""
+
+
+def create_summary_triggers(conn: sqlite3.Connection):
+    for name, body in _SUMMARY_TRIGGERS.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def drop_summary_triggers(conn: sqlite3.Connection):
+    """Для массовой загрузки: после неё сводку дешевле пересчитать целиком (rebuild_portfolio_summary)."""
+    for name in _SUMMARY_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def rebuild_portfolio_summary(conn: sqlite3.Connection):
+    conn.execute("DELETE FROM main.portfolio_summary")
+    conn.execute(f"""
+    INSERT INTO main.portfolio_summary(branch_id, insurance_type_id, status, applications, insurance_sum, tariff_amount)
+    {portfolio_summary_select(conn)}
+    """)
+
+
+def _m007_portfolio_summary(conn: sqlite3.Connection):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS portfolio_summary (
+        branch_id INTEGER NOT NULL,
+        insurance_type_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        applications INTEGER NOT NULL DEFAULT 0,
+        insurance_sum REAL NOT NULL DEFAULT 0,
+        tariff_amount REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (branch_id, insurance_type_id, status)
+    ) WITHOUT ROWID
+    """)
+    create_summary_triggers(conn)
+    rebuild_portfolio_summary(conn)
+
+
+# -------------------------
+# Full-text search
+# -------------------------
+# applications_fts — индекс FTS5 по ФИО, объекту, описанию заявки и проекту договора; rowid = id заявки.
+# Если SQLite поддерживает contentless_delete (3.43+), текст в индексе не хранится;
+# иначе таблица хранит свою копию текста. Триггеры одинаковы для обоих вариантов:
+# строка заявки переиндексируется целиком (удалить по rowid + вставить актуальную).
+
+SEARCH_COLUMNS = ("client_fio", "insured_object", "request_text", "draft_text")
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0, 1.0)   # bm25: совпадение в ФИО важнее, чем в описании
+
+
+def _search_text(expr: str) -> str:
+    # «ё» в поиске и в индексе пишем как «е»: пользователи обычно вводят «е»
+    return f"replace(replace(COALESCE({expr}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _search_reindex(app_id: str) -> str:
+    values = ", ".join(_search_text(e) for e in ("a.client_fio", "a.insured_object", "a.request_text", "c.draft_text"))
+    return f"""
+    DELETE FROM applications_fts WHERE rowid = {app_id};
+    INSERT INTO applications_fts(rowid, {", ".join(SEARCH_COLUMNS)})
+    SELECT a.id, {values}
+    FROM applications a LEFT JOIN contracts c ON c.application_id = a.id
+    WHERE a.id = {app_id};"""
+
+
+_SEARCH_TRIGGERS = {
+    "trg_search_applications_insert": f"AFTER INSERT ON applications BEGIN {_search_reindex('NEW.id')} END",
+    "trg_search_applications_update": f"""
+        AFTER UPDATE OF client_fio, insured_object, request_text ON applications
+        BEGIN {_search_reindex('NEW.id')} END""",
+    "trg_search_applications_delete": "AFTER DELETE ON applications BEGIN DELETE FROM applications_fts WHERE rowid = OLD.id; END",
+    "trg_search_contracts_insert": f"AFTER INSERT ON contracts BEGIN {_search_reindex('NEW.application_id')} END",
+    "trg_search_contracts_update": f"""
+        AFTER UPDATE OF draft_text ON contracts
+        BEGIN {_search_reindex('NEW.application_id')} END""",
+    "trg_search_contracts_delete": f"AFTER DELETE ON contracts BEGIN {_search_reindex('OLD.application_id')} END",
+}
+
+
+def _create_search_table(conn: sqlite3.Connection):
+    options = f"{', '.join(SEARCH_COLUMNS)}, prefix='2 3', tokenize='unicode61 remove_diacritics 2'"
+    try:
+        conn.execute(f"CREATE VIRTUAL TABLE applications_fts USING fts5({options}, content='', contentless_delete=1)")
+    except sqlite3.OperationalError:
+        conn.execute(f"CREATE VIRTUAL TABLE applications_fts USING fts5({options})")
+    weights = ", ".join(str(w) for w in SEARCH_WEIGHTS)
+    conn.execute(f"INSERT INTO applications_fts(applications_fts, rank) VALUES ('rank', 'bm25({weights})')")
+
+
+def create_search_triggers(conn: sqlite3.Connection):
+    for name, body in _SEARCH_TRIGGERS.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def drop_search_triggers(conn: sqlite3.Connection):
+    """Для массовой загрузки: индекс дешевле построить заново (rebuild_search_index)."""
+    for name in _SEARCH_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def rebuild_search_index(conn: sqlite3.Connection):
+    conn.execute("DROP TABLE IF EXISTS applications_fts")
+    _create_search_table(conn)
+    values = ", ".join(_search_text(e) for e in ("a.client_fio", "a.insured_object", "a.request_text", "c.draft_text"))
+    conn.execute(f"""
+    INSERT INTO applications_fts(rowid, {", ".join(SEARCH_COLUMNS)})
+    SELECT a.id, {values}
+    FROM applications a LEFT JOIN contracts c ON c.application_id = a.id
+    """)
+    conn.execute("INSERT INTO applications_fts(applications_fts) VALUES ('optimize')")
+
+
+def _m008_full_text_search(conn: sqlite3.Connection):
+    rebuild_search_index(conn)
+    create_search_triggers(conn)
+
+
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _m001_base_schema,
+    _m002_indexes,
+    _m003_worklist_sort_indexes,
+    _m004_application_detail_view,
+    _m005_audit_events,
+    _m006_changelog,
+    _m007_portfolio_summary,
+    _m008_full_text_search,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def current_version(conn: sqlite3.Connection, schema: str = "main") -> int:
+    return int(conn.execute(f"PRAGMA {schema}.user_version").fetchone()[0])
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Применяет недостающие миграции. Возвращает версию схемы после применения.
+    """
+    if current_version(conn) >= SCHEMA_VERSION:
+        return SCHEMA_VERSION
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # версию перечитываем под блокировкой: другой процесс мог успеть мигрировать
+        version = current_version(conn)
+        for step in MIGRATIONS[version:]:
+            step(conn)
+        if version < SCHEMA_VERSION:
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return SCHEMA_VERSION
+
+
+# -------------------------
+# Archive database
+# -------------------------
+# Завершённые заявки (ARCHIVED, REJECTED) с договорами переносятся в отдельный файл,
+# подключаемый к каждому соединению как ATTACH ... AS archive (см. core/archive.py).
+# Таблицы архива повторяют applications и contracts основной БД: те же колонки и id,
+# без индексов для списков и без триггеров — архив только читают по id.
+
+ARCHIVE_SCHEMA = "archive"
+ARCHIVE_TABLES = ("applications", "contracts")
+
+
+def archive_attached(conn: sqlite3.Connection) -> bool:
+    return any(r[1] == ARCHIVE_SCHEMA for r in conn.execute("PRAGMA database_list").fetchall())
+
+
+def archive_ready(conn: sqlite3.Connection) -> bool:
+    """Архив подключён и его таблицы уже созданы (migrate_archive)."""
+    return archive_attached(conn) and conn.execute(
+        f"SELECT 1 FROM {ARCHIVE_SCHEMA}.sqlite_master WHERE type = 'table' AND name = 'applications'"
+    ).fetchone() is not None
+
+
+def _sync_archive_table(conn: sqlite3.Connection, table: str):
+    ddl = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+    conn.execute(re.sub(
+        r"^CREATE TABLE\s+(IF NOT EXISTS\s+)?\"?\w+\"?",
+        f"CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.{table}",
+        ddl.strip(),
+    ))
+    # колонки, добавленные в основную БД после создания архива
+    have = {r[1] for r in conn.execute(f"PRAGMA {ARCHIVE_SCHEMA}.table_info({table})").fetchall()}
+    for _, name, ddl_type, notnull, default, _ in conn.execute(f"PRAGMA main.table_info({table})").fetchall():
+        if name in have:
+            continue
+        column = f"{name} {ddl_type}"
+        if notnull and default is not None:
+            column += f" NOT NULL DEFAULT {default}"
+        elif default is not None:
+            column += f" DEFAULT {default}"
+        conn.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.{table} ADD COLUMN {column}")
+
+
+def migrate_archive(conn: sqlite3.Connection) -> int:
+    """
+    Приводит таблицы подключённой архивной БД к схеме основной (после migrate).
+    Версия архива — его PRAGMA user_version. Без подключённого архива ничего не делает.
+    """
+    if not archive_attached(conn) or current_version(conn, ARCHIVE_SCHEMA) >= SCHEMA_VERSION:
+        return SCHEMA_VERSION
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if current_version(conn, ARCHIVE_SCHEMA) < SCHEMA_VERSION:
+            for table in ARCHIVE_TABLES:
+                _sync_archive_table(conn, table)
+            conn.execute(f"PRAGMA {ARCHIVE_SCHEMA}.user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return SCHEMA_VERSION
@@ -1,4 +1,6 @@
 from dataclasses import dataclass
+from typing import Optional
+
 from core.enums import Role, ApplicationStatus
 from core.enums import BranchStatus
 
@@ -10,31 +12,106 @@ class User:
     role: Role
 
 
-@dataclass
+# демонстрационные пользователи (регистрация пользователей в MVP не реализована)
+DEFAULT_USERS = [
+    User(1, "Иван", Role.CLIENT),
+    User(2, "Ольга", Role.UNDERWRITER),
+    User(3, "Сергей", Role.ADMIN),
+    User(4, "Анна", Role.LAWYER),
+    User(5, "Дмитрий", Role.BRANCH_DIRECTOR),
+]
+
+
+# строки БД в виде объектов: собираются core/repository.py (статусы — перечисления, флаги — bool).
+# slots: без __dict__ у каждого экземпляра — заметно меньше памяти на больших выборках.
+# Длинные тексты (request_text, draft_text) по умолчанию не читаются: None — «не загружен»
+
+
+@dataclass(slots=True)
 class InsuranceApplication:
     id: int
     client_name: str
     status: ApplicationStatus = ApplicationStatus.CREATED
+    client_fio: str = ""
+    insured_object: str = ""
+    request_text: Optional[str] = None
+    risk_percent: int = 0
+    insurance_type_id: Optional[int] = None
+    insurance_sum: Optional[float] = None
+    tariff_rate: Optional[float] = None      # в процентах
+    tariff_amount: Optional[float] = None
+    created_at: str = ""
+    updated_at: str = ""
+    underwriter_updated_at: Optional[str] = None
+    admin_updated_at: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class InsuranceContract:
     id: int
     application_id: int
     status: str
-    client_signed: int
-    director_signed: int
-    archived: int
+    client_signed: bool
+    director_signed: bool
+    archived: bool
     created_at: str
     updated_at: str
+    contract_date: Optional[str] = None
+    insurance_sum: Optional[float] = None
+    insurance_type_id: Optional[int] = None
+    tariff_rate: Optional[float] = None
+    tariff_amount: Optional[float] = None
+    branch_id: Optional[int] = None
+    draft_text: Optional[str] = None
 
-@dataclass
+
+@dataclass(slots=True)
 class Branch:
     id: int
     branch_name: str
     status: BranchStatus = BranchStatus.PENDING
-    confirmed_by_director: int = 1
-    approved_by_lawyer: int = 0
+    confirmed_by_director: bool = True
+    approved_by_lawyer: bool = False
     created_by: str = ""
     created_at: str = ""
     updated_at: str = ""
+    address: str = ""
+    phone: str = ""
+
+
+@dataclass(slots=True)
+class ApplicationDetail:
+    """Карточка заявки (view application_detail_v): поля договора — None, пока договора нет."""
+    id: int
+    client_name: str
+    status: ApplicationStatus
+    client_fio: str = ""
+    insured_object: str = ""
+    request_text: Optional[str] = None
+    created_at: str = ""
+    updated_at: str = ""
+    risk_percent: int = 0
+    insurance_type_id: Optional[int] = None
+    insurance_type_name: Optional[str] = None
+    insurance_sum: Optional[float] = None
+    tariff_rate: Optional[float] = None
+    tariff_amount: Optional[float] = None
+
+    contract_id: Optional[int] = None
+    contract_status: Optional[str] = None
+    contract_date: Optional[str] = None
+    contract_insurance_type_id: Optional[int] = None
+    contract_insurance_type_name: Optional[str] = None
+    contract_insurance_sum: Optional[float] = None
+    contract_tariff_rate: Optional[float] = None
+    contract_tariff_amount: Optional[float] = None
+    client_signed: Optional[bool] = None
+    director_signed: Optional[bool] = None
+    archived: Optional[bool] = None
+    draft_text: Optional[str] = None
+    contract_updated_at: Optional[str] = None
+
+    branch_id: Optional[int] = None
+    branch_name: Optional[str] = None
+    branch_address: Optional[str] = None
+    branch_phone: Optional[str] = None
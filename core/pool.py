@@ -0,0 +1,187 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from queue import LifoQueue, Empty, Full
+from typing import Callable, List, Optional
+
+
+@dataclass
+class PoolConfig:
+    pool_size: int = 4
+    checkout_timeout: float = 30.0
+    cached_statements: int = 256     # кэш подготовленных выражений sqlite3 на соединение
+    cache_size_kib: int = 16384      # PRAGMA cache_size (в КиБ, передаётся отрицательным числом)
+    mmap_size: int = 64 * 1024 * 1024
+    synchronous: str = "FULL"        # OFF | NORMAL | FULL | EXTRA
+    factory: Optional[type] = None   # подкласс sqlite3.Connection (например, для профилирования)
+    journal_mode: Optional[str] = None   # WAL — совместная работа нескольких процессов; None — режим файла БД
+    busy_timeout_ms: int = 5000      # сколько ждать чужую блокировку, прежде чем вернуть «database is locked»
+    busy_retries: int = 5            # повторов всей операции при блокировке (см. db.run_with_retry)
+    retry_base_ms: int = 25          # начальная пауза между повторами, растёт вдвое (со случайным разбросом)
+    retry_max_ms: int = 1000
+    checkpoint_interval_s: float = 30.0   # WAL: не чаще этого — PRAGMA wal_checkpoint(PASSIVE) после коммита
+
+
+JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL"}
+
+
+class ConnectionPool:
+    """
+    Пул долгоживущих соединений sqlite3.
+
+    Соединение выдаётся потоку на время блока `with pool.connection()`.
+    Вложенные блоки в том же потоке получают то же соединение, а commit/rollback
+    выполняется только при выходе из самого внешнего блока.
+    """
+
+    def __init__(self, path: Path, config: Optional[PoolConfig] = None):
+        self.path = Path(path)
+        self.config = config or PoolConfig()
+        self._idle: LifoQueue = LifoQueue(maxsize=self.config.pool_size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._local = threading.local()
+        self._connect_hooks: List[Callable[[sqlite3.Connection], None]] = []
+        self._commit_hooks: List[Callable[[], None]] = []
+        self._closed = False
+        self._last_checkpoint = time.monotonic()
+        self.journal_mode: Optional[str] = None
+
+    def add_connect_hook(self, hook: Callable[[sqlite3.Connection], None]):
+        """Хук вызывается для каждого нового соединения (уже открытые не затрагиваются)."""
+        self._connect_hooks.append(hook)
+
+    def add_commit_hook(self, hook: Callable[[], None]):
+        """Хук вызывается после каждого коммита самого внешнего блока connection()."""
+        self._commit_hooks.append(hook)
+
+    @property
+    def opened(self) -> int:
+        return self._opened
+
+    def in_block(self) -> bool:
+        """Текущий поток уже внутри with connection() (значит, внутри чужой транзакции)."""
+        return getattr(self._local, "conn", None) is not None
+
+    def _open(self) -> sqlite3.Connection:
+        cfg = self.config
+        conn = sqlite3.connect(
+            self.path,
+            cached_statements=cfg.cached_statements,
+            timeout=cfg.busy_timeout_ms / 1000.0,
+            check_same_thread=False,
+            factory=cfg.factory or sqlite3.Connection,
+        )
+        conn.row_factory = sqlite3.Row
+        if cfg.journal_mode:
+            mode = cfg.journal_mode.upper()
+            if mode not in JOURNAL_MODES:
+                raise ValueError(f"Неизвестный режим журнала: {cfg.journal_mode}")
+            # режим WAL сохраняется в файле БД: переключаем (нужна монопольная блокировка), только если он другой
+            current = str(conn.execute("PRAGMA journal_mode;").fetchone()[0]).upper()
+            if current != mode:
+                current = str(conn.execute(f"PRAGMA journal_mode = {mode};").fetchone()[0]).upper()
+            self.journal_mode = current
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute(f"PRAGMA cache_size = {-int(cfg.cache_size_kib)};")
+        conn.execute(f"PRAGMA mmap_size = {int(cfg.mmap_size)};")
+        conn.execute(f"PRAGMA synchronous = {cfg.synchronous};")
+        for hook in self._connect_hooks:
+            hook(conn)
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+
+        with self._lock:
+            can_open = self._opened < self.config.pool_size
+            if can_open:
+                self._opened += 1
+        if can_open:
+            try:
+                return self._open()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.config.checkout_timeout)
+        except Empty:
+            raise TimeoutError("Нет свободных соединений с БД (пул исчерпан)")
+
+    def _checkin(self, conn: sqlite3.Connection):
+        if self._closed:
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except Full:
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._checkout()
+        self._local.conn = conn
+        self._local.depth = 1
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+                for hook in self._commit_hooks:
+                    hook()
+                self._maybe_checkpoint(conn)
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            self._checkin(conn)
+
+    def _maybe_checkpoint(self, conn: sqlite3.Connection):
+        # автоматический checkpoint SQLite срабатывает по размеру WAL; при постоянных читателях
+        # он может не успевать, поэтому раз в checkpoint_interval_s переносим журнал явно
+        if self.journal_mode != "WAL":
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_checkpoint < self.config.checkpoint_interval_s:
+                return
+            self._last_checkpoint = now
+        try:
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE);").fetchall()
+        except sqlite3.OperationalError:
+            # PASSIVE не ждёт читателей; неудача не важна — повторим в следующий раз
+            pass
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            conn.close()
+        with self._lock:
+            self._opened = 0
@@ -0,0 +1,336 @@
+"""
+Профилирование обращений к БД (включается переменной окружения).
+
+INSURANCE_PROFILE=1            — включить при запуске (main.py, python -m cli)
+INSURANCE_PROFILE_SLOW_MS=50   — порог медленного SQL-выражения, мс
+INSURANCE_PROFILE_DUMP=путь    — при выходе записать отчёт в JSON (см. python -m cli profile)
+
+После enable() каждая публичная функция core/db и core/repository, InsuranceService.perform_action /
+perform_actions_bulk учитывают число вызовов, время (сумма, p50/p95/p99 по последним
+SAMPLE_LIMIT вызовам) и число возвращённых строк. Соединения пула создаются классом
+ProfiledConnection: он считает открытые соединения и пишет в журнал медленных
+выражений SQL с параметрами — и свои execute(), и execute() курсоров из conn.cursor()
+(ProfiledCursor: потоковые выборки тарифов и выгрузок идут через курсор).
+Время выражения conn.execute() — только сам вызов, без последующего fetch; у курсора —
+execute() вместе со всеми fetch до конца строк (там строки читает именно fetch).
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import is_dataclass
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+from core import db, repository
+
+ENV_ENABLE = "INSURANCE_PROFILE"
+ENV_SLOW_MS = "INSURANCE_PROFILE_SLOW_MS"
+ENV_DUMP = "INSURANCE_PROFILE_DUMP"
+
+SAMPLE_LIMIT = 5000      # длительностей на функцию для процентилей
+SLOW_LOG_LIMIT = 500     # записей в журнале медленных выражений
+PARAMS_REPR_LIMIT = 300
+
+# функции core/db и core/repository, которые не обращаются к данным (transaction — контекстный менеджер,
+# iter_applications, iter_export_rows — генераторы: время их вызова не показательно, выражения всё равно попадают в журнал)
+_SKIP = {
+    "configure", "close_pool", "get_pool", "add_commit_hook", "add_connect_hook",
+    "invalidate_reference_cache", "cache_stats", "transaction",
+    "configure_from_env", "is_busy_error", "run_with_retry", "retry_stats", "build_search_query", "archive_path", "archive_ready",
+    "iter_applications", "select_list", "application_detail_sql", "iter_export_rows",
+}
+
+
+class _CallStats:
+    __slots__ = ("count", "errors", "total", "rows", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.rows = 0
+        self.samples: Deque[float] = deque(maxlen=SAMPLE_LIMIT)
+
+
+def _percentile(sorted_samples: List[float], q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * q))]
+
+
+def _count_rows(result: Any) -> int:
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        # {id: row} от пакетных выборок или одна строка
+        if not result or all(isinstance(v, dict) or is_dataclass(v) for v in result.values()):
+            return len(result)
+        return 1
+    if is_dataclass(result):
+        return 1   # модель core/repository
+    return 0
+
+
+class Profiler:
+    def __init__(self, slow_ms: float = 50.0):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _CallStats] = {}
+        self._slow: Deque[Dict[str, Any]] = deque(maxlen=SLOW_LOG_LIMIT)
+        self.connections_opened = 0
+        self.statements = 0
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+
+    def record_call(self, name: str, elapsed: float, rows: int, failed: bool):
+        with self._lock:
+            st = self._calls.get(name)
+            if st is None:
+                st = self._calls[name] = _CallStats()
+            st.count += 1
+            st.total += elapsed
+            st.rows += rows
+            st.errors += int(failed)
+            st.samples.append(elapsed)
+
+    def record_statement(self, sql: str, params: Any, elapsed: float):
+        elapsed_ms = elapsed * 1000.0
+        with self._lock:
+            self.statements += 1
+            if elapsed_ms < self.slow_ms:
+                return
+            self._slow.append({
+                "ts": datetime.now().isoformat(timespec="milliseconds"),
+                "ms": round(elapsed_ms, 3),
+                "sql": " ".join(sql.split()),
+                "params": repr(params)[:PARAMS_REPR_LIMIT],
+                "thread": threading.current_thread().name,
+            })
+
+    def record_connection(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._slow.clear()
+            self.connections_opened = 0
+            self.statements = 0
+            self.started_at = datetime.now().isoformat(timespec="seconds")
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = {}
+            for name, st in self._calls.items():
+                samples = sorted(st.samples)
+                calls[name] = {
+                    "count": st.count,
+                    "errors": st.errors,
+                    "total_ms": round(st.total * 1000.0, 3),
+                    "p50_ms": round(_percentile(samples, 0.50) * 1000.0, 3),
+                    "p95_ms": round(_percentile(samples, 0.95) * 1000.0, 3),
+                    "p99_ms": round(_percentile(samples, 0.99) * 1000.0, 3),
+                    "rows": st.rows,
+                }
+            return {
+                "started_at": self.started_at,
+                "generated_at": datetime.now().isoformat(timespec="seconds"),
+                "slow_ms": self.slow_ms,
+                "connections_opened": self.connections_opened,
+                "statements": self.statements,
+                "calls": dict(sorted(calls.items(), key=lambda kv: -kv[1]["total_ms"])),
+                "slow_statements": list(self._slow),
+            }
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """
+    Курсор ProfiledConnection.cursor(). Через курсор идут потоковые выборки (тарифы, выгрузки):
+    execute() только начинает выражение, строки читает fetch*, поэтому здесь время выражения —
+    execute и все fetch до конца строк. В журнал оно попадает, когда строки кончились,
+    курсор закрыт или выполняет следующее выражение.
+    """
+
+    _pending: Optional[List[Any]] = None   # [sql, params, секунды]
+
+    def _flush(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            _profiler.record_statement(*pending)
+
+    def _start(self, sql, params, run, *args):
+        self._flush()
+        t = time.perf_counter()
+        try:
+            return run(*args)
+        finally:
+            self._pending = [sql, params, time.perf_counter() - t]
+
+    def _fetch(self, fetch, *args, done=None):
+        t = time.perf_counter()
+        rows = fetch(*args)
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - t
+            if done is None or done(rows):
+                self._flush()
+        return rows
+
+    def execute(self, sql, parameters=(), /):
+        return self._start(sql, parameters, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        params = f"<executemany {type(seq_of_parameters).__name__}>"
+        return self._start(sql, params, super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        return self._fetch(super().fetchone, done=lambda row: row is None)
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        return self._fetch(super().fetchmany, size, done=lambda rows: len(rows) < size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def close(self):
+        self._flush()
+        super().close()
+
+    def __del__(self):
+        self._flush()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Соединение, замеряющее execute/executemany (используется пулом при включённом профилировании)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _profiler.record_connection()
+
+    def cursor(self, factory=ProfiledCursor):
+        # Connection.execute курсор отсюда не берёт — двойного учёта нет
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=(), /):
+        t = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _profiler.record_statement(sql, parameters, time.perf_counter() - t)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        # параметры могут быть генератором — в журнал попадает только их тип
+        t = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _profiler.record_statement(sql, f"<executemany {type(seq_of_parameters).__name__}>", time.perf_counter() - t)
+
+
+_profiler = Profiler()
+_enabled = False
+_enable_lock = threading.Lock()
+
+
+def _wrap(name: str, fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        t = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            _profiler.record_call(name, time.perf_counter() - t, 0, True)
+            raise
+        _profiler.record_call(name, time.perf_counter() - t, _count_rows(result), False)
+        return result
+
+    wrapper._profiled = True
+    return wrapper
+
+
+def enable(slow_ms: Optional[float] = None):
+    """Включает профилирование в этом процессе (повторный вызов только меняет порог)."""
+    global _enabled
+    with _enable_lock:
+        if slow_ms is not None:
+            _profiler.slow_ms = float(slow_ms)
+        if _enabled:
+            return
+        _enabled = True
+
+        for prefix, module in (("db", db), ("repository", repository)):
+            for name, obj in list(vars(module).items()):
+                if (
+                    callable(obj)
+                    and not name.startswith("_")
+                    and name not in _SKIP
+                    and getattr(obj, "__module__", None) == module.__name__
+                    and not isinstance(obj, type)
+                    and not getattr(obj, "_profiled", False)
+                ):
+                    setattr(module, name, _wrap(f"{prefix}.{name}", obj))
+
+        from core.services import InsuranceService
+        for name in ("perform_action", "perform_actions_bulk"):
+            setattr(InsuranceService, name, _wrap(f"InsuranceService.{name}", getattr(InsuranceService, name)))
+
+        # новые соединения пула — с замером выражений
+        db.configure(factory=ProfiledConnection)
+
+
+def enable_from_env(force: bool = False) -> bool:
+    """
+    Включает профилирование, если задана INSURANCE_PROFILE (или force).
+    Порог и файл отчёта берутся из окружения. Возвращает, включено ли профилирование.
+    """
+    if force or os.environ.get(ENV_ENABLE, "").strip().lower() not in ("", "0", "false", "no"):
+        slow = os.environ.get(ENV_SLOW_MS)
+        enable(float(slow) if slow else None)
+        dump_path = os.environ.get(ENV_DUMP)
+        if dump_path:
+            atexit.register(dump, Path(dump_path))
+    return _enabled
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def report() -> Dict[str, Any]:
+    return _profiler.report()
+
+
+def reset():
+    _profiler.reset()
+
+
+def dump(path: Path):
+    Path(path).write_text(json.dumps(report(), ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def format_report(data: Optional[Dict[str, Any]] = None, limit: int = 40) -> str:
+    """Текстовый отчёт: функции по суммарному времени и последние медленные выражения."""
+    data = data or report()
+    lines = [
+        f"Период: {data['started_at']} — {data['generated_at']}",
+        f"Открыто соединений: {data['connections_opened']}, SQL-выражений: {data['statements']}",
+        "",
+        f"{'функция':<44}{'вызовов':>9}{'ошибок':>8}{'всего, мс':>12}{'p50':>9}{'p95':>9}{'p99':>9}{'строк':>10}",
+    ]
+    for name, c in list(data["calls"].items())[:limit]:
+        lines.append(
+            f"{name:<44}{c['count']:>9}{c['errors']:>8}{c['total_ms']:>12.1f}"
+            f"{c['p50_ms']:>9.2f}{c['p95_ms']:>9.2f}{c['p99_ms']:>9.2f}{c['rows']:>10}"
+        )
+    slow = data["slow_statements"]
+    lines += ["", f"Медленные выражения (≥ {data['slow_ms']} мс): {len(slow)}"]
+    for s in slow[-limit:]:
+        lines.append(f"{s['ts']}  {s['ms']:>9.1f} мс  [{s['thread']}]  {s['sql']}")
+        lines.append(f"{'':>38}параметры: {s['params']}")
+    return "\n".join(lines)
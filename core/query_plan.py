@@ -0,0 +1,298 @@
+"""
+Проверка планов запросов core/db.
+
+Прогоняет сценарий, вызывающий каждую публичную функцию core/db и core/repository на временной БД,
+перехватывает все выполненные SQL-выражения и для каждого строит EXPLAIN QUERY PLAN.
+Выражение с WHERE, которое читает таблицу полным сканированием (SCAN <table>),
+считается регрессией. Выборки без WHERE (полные списки) допускаются.
+
+Запуск: python -m core.query_plan
+"""
+import re
+import sqlite3
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Set, Tuple
+
+from core import archive, audit, db, export, migrations, repository
+
+# "--" — внутренние выражения триггеров и FTS5, которые SQLite передаёт в трассировку комментарием
+_SKIP_PREFIXES = ("CREATE", "ALTER", "DROP", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "EXPLAIN", "ATTACH", "--")
+# SCAN виртуальной таблицы FTS5 с ограничением MATCH (индекс "...:M...") — поиск по полнотекстовому индексу
+_SCAN_RE = re.compile(r"^SCAN (\w+)\b(?! VIRTUAL TABLE INDEX \d+:\S*M)")
+_WHERE_RE = re.compile(r"\bWHERE\b", re.IGNORECASE)
+# системный каталог (проверка и синхронизация схемы) мал, индексов у него нет
+_CATALOG_RE = re.compile(r"\bsqlite_master\b", re.IGNORECASE)
+
+# функции core/db, которые не выполняют запросов к данным
+_NOT_QUERIES = {
+    "configure", "close_pool", "get_pool", "add_commit_hook", "add_connect_hook",
+    "invalidate_reference_cache", "cache_stats",
+    "configure_from_env", "is_busy_error", "run_with_retry", "retry_stats", "checkpoint",
+    "build_search_query", "archive_path", "archive_ready", "select_list", "application_detail_sql",
+}
+
+
+@dataclass
+class PlanProblem:
+    sql: str
+    detail: str
+
+    def __str__(self) -> str:
+        return f"{self.detail}\n    {self.sql}"
+
+
+@dataclass
+class PlanReport:
+    statements: int = 0
+    problems: List[PlanProblem] = field(default_factory=list)
+    uncovered: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems and not self.uncovered
+
+
+def _normalize(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+def _public_functions(module) -> Dict[str, Callable]:
+    return {
+        name: obj
+        for name, obj in vars(module).items()
+        if callable(obj)
+        and not name.startswith("_")
+        and getattr(obj, "__module__", None) == module.__name__
+        and not isinstance(obj, type)
+        and name not in _NOT_QUERIES
+    }
+
+
+def _run_scenario():
+    from core.actions import Action
+    from core.enums import ApplicationStatus, Role
+    from core.models import User
+    from core.services import InsuranceService
+
+    users = {role: User(i, f"user{i}", role) for i, role in enumerate(Role, start=1)}
+    service = InsuranceService()
+
+    db.list_insurance_types(active_only=True)
+    db.list_insurance_types(active_only=False)
+    db.get_insurance_type(1)
+
+    branch_id = db.create_branch_request("Филиал", "Адрес", "Телефон", users[Role.BRANCH_DIRECTOR].name)
+    db.list_branches()
+    for role, user in users.items():
+        db.list_branch_worklist(role, user.name)
+        db.list_branch_worklist(role, user.name, after=(branch_id + 1, branch_id + 1))
+        db.count_branch_worklist(role, user.name)
+        db.get_branch_worklist_rows(role, user.name, [branch_id])
+    db.approve_branch_by_lawyer(branch_id)
+    db.list_approved_branches()
+    db.get_branch(branch_id)
+    assert repository.get_branch(branch_id).approved_by_lawyer, "филиал не одобрен"
+    db.branch_status_counts()
+
+    app_id = db.create_application(users[Role.CLIENT].name, client_fio="ФИО", insured_object="Объект", request_text="Описание")
+    rejected_id = db.create_application(users[Role.CLIENT].name, client_fio="ФИО", insured_object="Объект", request_text="Описание")
+    db.list_applications()
+    db.list_applications(columns=db.APPLICATION_COLUMNS)
+    db.get_application(app_id)
+    assert "request_text" not in db.get_application(app_id), "проекция заявки читает описание"
+    assert db.get_application_text(app_id) == "Описание"
+    db.create_applications([(users[Role.CLIENT].name, "ФИО", "Объект", "Описание")])
+    db.list_applications_page(limit=1)
+    db.list_applications_page(status=ApplicationStatus.CREATED, limit=1, after_id=app_id + 1)
+    db.application_status_counts()
+
+    steps = [
+        (Action.ASSESS_RISK, Role.UNDERWRITER, {"risk_percent": 10, "insurance_type_id": 1}),
+        (Action.APPROVE, Role.ADMIN, {"insurance_sum": 1000, "tariff_rate": 2}),
+        (Action.PREPARE_CONTRACT, Role.LAWYER, {"branch_id": branch_id, "draft_text": "Черновик"}),
+        (Action.CLIENT_SIGN, Role.CLIENT, {}),
+        (Action.DIRECTOR_SIGN, Role.BRANCH_DIRECTOR, {}),
+        (Action.ARCHIVE_CONTRACT, Role.LAWYER, {}),
+    ]
+    for action, role, data in steps:
+        for r, user in users.items():
+            for sort in db.WORKLIST_SORTS:
+                page = db.list_worklist(r, user.name, limit=1, sort=sort)
+                if page:
+                    db.list_worklist(r, user.name, limit=1, sort=sort, after=(page[-1]["sort_key"], page[-1]["id"]))
+            db.count_worklist(r, user.name)
+            db.get_worklist_rows(r, user.name, [app_id], sort="updated_at")
+        service.perform_action(app_id, action, users[role], data=data)
+
+    service.perform_action(rejected_id, Action.ASSESS_RISK, users[Role.UNDERWRITER], {"risk_percent": 90, "insurance_type_id": 2})
+    try:
+        # оператор видел заявку ещё в статусе CREATED — её уже оценили
+        service.perform_action(
+            rejected_id, Action.ASSESS_RISK, users[Role.UNDERWRITER], {"risk_percent": 90, "insurance_type_id": 2},
+            expected_status=ApplicationStatus.CREATED,
+        )
+        raise AssertionError("устаревший статус не дал конфликта")
+    except db.ConcurrentUpdateError:
+        pass
+    service.perform_action(rejected_id, Action.REJECT, users[Role.ADMIN], expected_status=ApplicationStatus.RISK_ANALYSIS)
+    db.get_contract_by_application(app_id)
+    db.get_application_detail(app_id)
+    db.get_application_detail(app_id, columns=db.APPLICATION_DETAIL_COLUMNS)
+    assert db.get_contract_draft(app_id) == "Черновик"
+    assert repository.get_contract_by_application(app_id, columns=db.CONTRACT_COLUMNS).draft_text == "Черновик"
+    assert repository.get_application(app_id).request_text is None, "проекция заявки читает описание"
+    assert repository.get_application_detail(app_id).status == ApplicationStatus.ARCHIVED, "карточка заявки не разобрана"
+    assert repository.get_contract_by_application(app_id).archived, "договор не разобран"
+    assert repository.get_applications([app_id, rejected_id])[rejected_id].status == ApplicationStatus.REJECTED
+    assert rejected_id not in repository.get_contracts_by_applications([app_id, rejected_id])
+    assert [a.id for a in repository.iter_applications(ApplicationStatus.REJECTED, fetch_size=1)] == [rejected_id]
+    assert len(list(repository.iter_applications(fetch_size=2))) == len(db.list_applications())
+
+    bulk_ids = [
+        db.create_application(users[Role.CLIENT].name, client_fio="ФИО", insured_object="Объект", request_text="Описание")
+        for _ in range(3)
+    ]
+    for action, role, data in steps:
+        service.perform_actions_bulk([(i, action, data) for i in bulk_ids], users[role])
+    stale = service.perform_actions_bulk(
+        [(i, Action.ARCHIVE_CONTRACT, {}) for i in bulk_ids], users[Role.LAWYER],
+        expected_statuses=dict.fromkeys(bulk_ids, ApplicationStatus.DIRECTOR_SIGNED),
+    )
+    assert all(r.conflict for r in stale), "пакет с устаревшими статусами не дал конфликтов"
+
+    pricing_rows = db.list_pricing_rows(ApplicationStatus.APPROVED, limit=10)
+    db.list_pricing_rows(ApplicationStatus.APPROVED, insurance_type_id=1, after_id=0, limit=10)
+    db.set_tariffs([(r[6], r[7], r[0]) for r in pricing_rows])
+
+    page = db.search_applications("фио объ", limit=1)
+    assert page, "полнотекстовый поиск ничего не нашёл"
+    db.search_applications("ФИО", limit=1, after=(page[-1]["sort_key"], page[-1]["id"]))
+    db.search_applications("черновик", client_name=users[Role.CLIENT].name)
+    rank_limit = db.SEARCH_RANK_LIMIT
+    db.SEARCH_RANK_LIMIT = 0   # ветка широкого запроса (сортировка по новизне)
+    try:
+        page = db.search_applications("ФИО", limit=1)
+        db.search_applications("ФИО", limit=1, after=(page[-1]["sort_key"], page[-1]["id"]))
+    finally:
+        db.SEARCH_RANK_LIMIT = rank_limit
+    db.rebuild_search_index()
+
+    db.count_archivable(archive.TERMINAL_STATUSES, archive.cutoff(0))
+    archive.archive_terminal(older_than_days=0, chunk_size=2)
+    assert db.get_application(app_id) and db.get_contract_by_application(app_id), "архивная заявка не найдена"
+    assert db.get_application_detail(app_id)["contract_id"], "карточка архивной заявки без договора"
+    assert repository.get_application(app_id).status == ApplicationStatus.ARCHIVED, "архивная заявка не найдена"
+    assert repository.get_contract_by_application(app_id).director_signed, "архивный договор не найден"
+    assert repository.get_application_detail(app_id).contract_id, "карточка архивной заявки без договора"
+    assert db.get_application_text(app_id) == "Описание" and db.get_contract_draft(app_id) == "Черновик"
+    assert db.get_application_detail(app_id, columns=db.APPLICATION_DETAIL_COLUMNS)["draft_text"] == "Черновик"
+    db.archive_status_counts()
+
+    # выгрузка: все форматы, фильтры, основная и архивная БД, продолжение с контрольной точки
+    with tempfile.TemporaryDirectory() as out:
+        for entity in export.ENTITIES:
+            for fmt in export.FORMATS:
+                export.export(entity, Path(out) / f"{entity}.{fmt}", fmt=fmt, segment_rows=2)
+        export.export("applications", Path(out) / "f.csv", filters=export.ExportFilters(
+            status=ApplicationStatus.ARCHIVED.name, branch_id=branch_id, date_column="updated_at", since="2000-01-01", until="9999-12-31",
+        ))
+        export.export("contracts", Path(out) / "f.csv", filters=export.ExportFilters(status="archived", branch_id=branch_id))
+        export.export("branches", Path(out) / "f.csv", filters=export.ExportFilters(status="APPROVED", branch_id=branch_id))
+        export.export(
+            "applications", Path(out) / "f.jsonl", fmt="jsonl", resume=True,
+            filters=export.ExportFilters(branch_id=branch_id, include_archive=False),
+        )
+
+    assert not db.verify_portfolio_summary(), "сводка портфеля расходится с заявками"
+    db.portfolio_summary()
+    db.portfolio_summary(director=users[Role.BRANCH_DIRECTOR].name)
+    db.rebuild_portfolio_summary()
+
+    audit.flush()
+    events = db.list_audit_events("application", app_id)
+    page = db.list_audit_events_range("0000", "9999", limit=1)
+    db.list_audit_events_range("0000", "9999", limit=1, after=(page[-1]["ts"], page[-1]["id"]))
+    assert events, "журнал действий пуст"
+
+    changes = db.list_changes(db.first_change_id(), limit=10)
+    assert changes, "журнал изменений пуст"
+    db.prune_changes(db.last_change_id() - 10)
+    with db.transaction() as conn:
+        db._trim_changelog(conn, keep=1)
+    assert db.first_change_id() == db.last_change_id(), "журнал изменений не обрезан"
+
+
+def check() -> PlanReport:
+    report = PlanReport()
+    statements: List[str] = []
+    called: Set[Tuple[str, str]] = set()
+
+    modules = {"db": db, "repository": repository}
+    functions = {
+        (prefix, name): fn for prefix, module in modules.items() for name, fn in _public_functions(module).items()
+    }
+
+    def wrap(key, fn):
+        def wrapper(*args, **kwargs):
+            called.add(key)
+            return fn(*args, **kwargs)
+        return wrapper
+
+    saved_path, saved_archive = db.DB_PATH, db.ARCHIVE_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH, db.ARCHIVE_PATH = Path(tmp) / "plan_check.db", None
+        db.close_pool()
+        db.get_pool().add_connect_hook(lambda conn: conn.set_trace_callback(statements.append))
+        for (prefix, name), fn in functions.items():
+            setattr(modules[prefix], name, wrap((prefix, name), fn))
+        try:
+            db.db_init()
+            _run_scenario()
+        finally:
+            for (prefix, name), fn in functions.items():
+                setattr(modules[prefix], name, fn)
+            db.close_pool()
+            plan_db, plan_archive = db.DB_PATH, db.archive_path()
+            db.DB_PATH, db.ARCHIVE_PATH = saved_path, saved_archive
+
+        report.uncovered = sorted(f"{prefix}.{name}" for prefix, name in set(functions) - called - {("db", "db_init")})
+
+        seen = set()
+        conn = sqlite3.connect(plan_db)
+        conn.execute(f"ATTACH DATABASE ? AS {migrations.ARCHIVE_SCHEMA}", (str(plan_archive),))
+        try:
+            for sql in statements:
+                sql = _normalize(sql)
+                if not sql or sql.upper().startswith(_SKIP_PREFIXES) or sql in seen:
+                    continue
+                seen.add(sql)
+                report.statements += 1
+                if not _WHERE_RE.search(sql) or _CATALOG_RE.search(sql):
+                    continue
+                for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"):
+                    detail = row[3]
+                    if _SCAN_RE.match(detail):
+                        report.problems.append(PlanProblem(sql, detail))
+        finally:
+            conn.close()
+
+    return report
+
+
+def main() -> int:
+    report = check()
+    print(f"Проверено выражений: {report.statements}")
+    for name in report.uncovered:
+        print(f"Не покрыто сценарием: {name}")
+    for problem in report.problems:
+        print(f"Полное сканирование: {problem}")
+    if report.ok:
+        print("OK")
+    return 0 if report.ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Чтение заявок, договоров и филиалов в виде объектов core.models.
+
+Функции core/db возвращают словари (dict(sqlite3.Row)), и каждый потребитель заново
+приводит поля: ApplicationStatus[row["status"]], int(row["client_signed"])...
+Здесь строка превращается в экземпляр модели один раз, прямо при выборке: курсору
+назначается row_factory, который по cursor.description один раз на выражение строит
+план разбора (колонка -> поле модели и преобразование). Статусы становятся перечислениями,
+флаги 0/1 — bool; числа SQLite уже отдаёт типизированными (INTEGER/REAL), их не трогаем.
+Колонки, которых нет в модели, пропускаются.
+
+Как и в core/db, по умолчанию читаются проекции без длинных текстов (db.APPLICATION_SUMMARY_COLUMNS,
+db.CONTRACT_SUMMARY_COLUMNS, db.APPLICATION_DETAIL_SUMMARY_COLUMNS): request_text и draft_text
+в моделях остаются None, пока их не запросят явно (columns=...) или отдельно
+(db.get_application_text, db.get_contract_draft).
+
+iter_applications отдаёт строки порциями fetchmany, не собирая весь список в памяти.
+"""
+import dataclasses
+import typing
+from enum import Enum
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence
+
+from core import db
+from core.enums import ApplicationStatus
+from core.models import ApplicationDetail, Branch, InsuranceApplication, InsuranceContract
+
+FETCH_SIZE = 1000   # строк за один fetchmany при потоковом чтении
+
+
+# -------------------------
+# Row factory
+# -------------------------
+
+_converters_cache: Dict[type, Dict[str, Optional[Callable[[Any], Any]]]] = {}
+
+
+def _converter(hint) -> Optional[Callable[[Any], Any]]:
+    if typing.get_origin(hint) is typing.Union:
+        # Optional[X]: NULL остаётся None, остальное — как X
+        hint = next(a for a in typing.get_args(hint) if a is not type(None))
+    if isinstance(hint, type) and issubclass(hint, Enum):
+        return hint.__getitem__   # в БД хранится имя члена перечисления
+    if hint is bool:
+        return bool
+    return None
+
+
+def _converters(model: type) -> Dict[str, Optional[Callable[[Any], Any]]]:
+    conv = _converters_cache.get(model)
+    if conv is None:
+        conv = _converters_cache[model] = {
+            name: _converter(hint) for name, hint in typing.get_type_hints(model).items()
+        }
+    return conv
+
+
+class ModelRowFactory:
+    """
+    row_factory курсора: собирает из строки экземпляр model.
+    План разбора строится по первой строке и запоминается — один объект на одно выражение.
+    Значения переставляются в порядок полей модели одним itemgetter и передаются позиционно;
+    поля, которых нет в выборке (проекция без длинных текстов), получают значение по умолчанию.
+    """
+
+    __slots__ = ("model", "_build")
+
+    def __init__(self, model: type):
+        self.model = model
+        self._build: Optional[Callable[[tuple], Any]] = None
+
+    def _plan(self, description) -> Callable[[tuple], Any]:
+        model = self.model
+        fields = _converters(model)
+        columns = {col[0]: i for i, col in enumerate(description)}
+        defaults = {f.name: f.default for f in dataclasses.fields(model)}
+
+        # отсутствующие в выборке поля берутся из хвоста со значениями по умолчанию
+        tail, indices = [], []
+        for name in fields:
+            if name in columns:
+                indices.append(columns[name])
+            elif defaults[name] is not dataclasses.MISSING:
+                indices.append(len(description) + len(tail))
+                tail.append(defaults[name])
+            else:
+                raise ValueError(f"{model.__name__}: в выборке нет обязательного поля {name}")
+        tail = tuple(tail)
+        pick = itemgetter(*indices)
+        convs = [(pos, conv) for pos, (name, conv) in enumerate(fields.items()) if conv is not None and name in columns]
+
+        def build(row):
+            args = list(pick(row + tail if tail else row))
+            for pos, conv in convs:
+                v = args[pos]
+                if v is not None:
+                    args[pos] = conv(v)
+            return model(*args)
+        return build
+
+    def __call__(self, cursor, row):
+        build = self._build
+        if build is None:
+            build = self._build = self._plan(cursor.description)
+        return build(row)
+
+
+def _fetch_one(conn, model: type, sql: str, params: Sequence[Any]):
+    cur = conn.execute(sql, params)
+    cur.row_factory = ModelRowFactory(model)
+    return cur.fetchone()
+
+
+def _fetch_all(conn, model: type, sql: str, params: Sequence[Any]) -> list:
+    cur = conn.execute(sql, params)
+    cur.row_factory = ModelRowFactory(model)
+    return cur.fetchall()
+
+
+# -------------------------
+# Applications
+# -------------------------
+
+def get_application(
+    app_id: int, columns: Sequence[str] = db.APPLICATION_SUMMARY_COLUMNS
+) -> Optional[InsuranceApplication]:
+    """Заявка по id; перенесённая в архивную БД читается оттуда."""
+    cols = db.select_list(columns, db.APPLICATION_COLUMNS)
+    with db.get_pool().connection() as conn:
+        app = _fetch_one(conn, InsuranceApplication, f"SELECT {cols} FROM applications WHERE id = ?", (app_id,))
+        if app is None and db.archive_ready(conn):
+            app = _fetch_one(
+                conn, InsuranceApplication, f"SELECT {cols} FROM archive.applications WHERE id = ?", (app_id,)
+            )
+        return app
+
+
+def get_applications(
+    app_ids: Sequence[int], columns: Sequence[str] = db.APPLICATION_SUMMARY_COLUMNS
+) -> Dict[int, InsuranceApplication]:
+    """Заявки по списку id одним запросом: {id: заявка}. Отсутствующих id в ответе нет."""
+    if not app_ids:
+        return {}
+    cols = db.select_list(columns, db.APPLICATION_COLUMNS)
+    with db.get_pool().connection() as conn:
+        apps = _fetch_all(
+            conn, InsuranceApplication,
+            f"SELECT {cols} FROM applications WHERE id IN ({', '.join('?' for _ in app_ids)})",
+            [int(i) for i in app_ids],
+        )
+        return {a.id: a for a in apps}
+
+
+def get_application_detail(
+    app_id: int, columns: Sequence[str] = db.APPLICATION_DETAIL_SUMMARY_COLUMNS
+) -> Optional[ApplicationDetail]:
+    """Карточка заявки с видом страхования, договором и филиалом (как db.get_application_detail)."""
+    main_sql, archive_sql = db.application_detail_sql(columns)
+    with db.get_pool().connection() as conn:
+        detail = _fetch_one(conn, ApplicationDetail, main_sql, (app_id,))
+        if detail is None and db.archive_ready(conn):
+            detail = _fetch_one(conn, ApplicationDetail, archive_sql, (app_id,))
+        return detail
+
+
+def iter_applications(
+    status: Optional[ApplicationStatus] = None,
+    *,
+    columns: Sequence[str] = db.APPLICATION_SUMMARY_COLUMNS,
+    fetch_size: int = FETCH_SIZE,
+) -> Iterator[InsuranceApplication]:
+    """
+    Заявки основной БД по возрастанию id (со статусом status, если задан) — потоком через fetchmany.
+    Соединение пула занято до конца перебора: внутри цикла этого потока можно читать,
+    но писать лучше после него (запись попадёт в ту же незавершённую транзакцию чтения).
+    """
+    cols = db.select_list(columns, db.APPLICATION_COLUMNS)
+    if status is None:
+        sql, params = f"SELECT {cols} FROM applications ORDER BY id", ()
+    else:
+        sql, params = f"SELECT {cols} FROM applications WHERE status = ? ORDER BY id", (status.name,)
+    with db.get_pool().connection() as conn:
+        cur = conn.execute(sql, params)
+        cur.row_factory = ModelRowFactory(InsuranceApplication)
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+
+
+# -------------------------
+# Contracts
+# -------------------------
+
+def get_contract_by_application(
+    application_id: int, columns: Sequence[str] = db.CONTRACT_SUMMARY_COLUMNS
+) -> Optional[InsuranceContract]:
+    """Договор заявки; договор заявки, перенесённой в архивную БД, читается оттуда."""
+    cols = db.select_list(columns, db.CONTRACT_COLUMNS)
+    with db.get_pool().connection() as conn:
+        contract = _fetch_one(
+            conn, InsuranceContract, f"SELECT {cols} FROM contracts WHERE application_id = ?", (application_id,)
+        )
+        if contract is None and db.archive_ready(conn):
+            contract = _fetch_one(
+                conn, InsuranceContract,
+                f"SELECT {cols} FROM archive.contracts WHERE application_id = ?", (application_id,),
+            )
+        return contract
+
+
+def get_contracts_by_applications(
+    application_ids: Sequence[int], columns: Sequence[str] = db.CONTRACT_SUMMARY_COLUMNS
+) -> Dict[int, InsuranceContract]:
+    """Договоры по списку заявок одним запросом: {application_id: договор}."""
+    if not application_ids:
+        return {}
+    cols = db.select_list(columns, db.CONTRACT_COLUMNS)
+    with db.get_pool().connection() as conn:
+        contracts = _fetch_all(
+            conn, InsuranceContract,
+            f"SELECT {cols} FROM contracts WHERE application_id IN ({', '.join('?' for _ in application_ids)})",
+            [int(i) for i in application_ids],
+        )
+        return {c.application_id: c for c in contracts}
+
+
+# -------------------------
+# Branches
+# -------------------------
+
+def get_branch(branch_id: int) -> Optional[Branch]:
+    with db.get_pool().connection() as conn:
+        return _fetch_one(conn, Branch, "SELECT * FROM branches WHERE id = ?", (branch_id,))
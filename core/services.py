@@ -1,20 +1,202 @@
-from typing import Optional, Dict, Any
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, Callable, Iterable, List, Tuple
 
 from core.workflow import ALLOWED_ACTIONS
 from core.permissions import ACTION_ROLES
-from core.enums import ApplicationStatus
+from core.enums import ApplicationStatus, BranchStatus
 from core.actions import Action
 from core.storage import storage
-from core import db
+from core.models import InsuranceApplication, InsuranceContract
+from core import audit, db, repository
+
+# статус заявки после успешного действия
+NEXT_STATUS = {
+    Action.ASSESS_RISK: ApplicationStatus.RISK_ANALYSIS,
+    Action.APPROVE: ApplicationStatus.APPROVED,
+    Action.REJECT: ApplicationStatus.REJECTED,
+    Action.PREPARE_CONTRACT: ApplicationStatus.CONTRACT_PREPARED,
+    Action.CLIENT_SIGN: ApplicationStatus.CLIENT_SIGNED,
+    Action.DIRECTOR_SIGN: ApplicationStatus.DIRECTOR_SIGNED,
+    Action.ARCHIVE_CONTRACT: ApplicationStatus.ARCHIVED,
+}
+
+# действия, которым для проверки нужен договор
+_CONTRACT_ACTIONS = {Action.PREPARE_CONTRACT, Action.CLIENT_SIGN, Action.DIRECTOR_SIGN, Action.ARCHIVE_CONTRACT}
+
+BULK_CHUNK_SIZE = 500
+
+
+@dataclass
+class BulkItemResult:
+    application_id: int
+    action: Action
+    ok: bool
+    error: str = ""
+    conflict: bool = False   # заявку уже обработал другой пользователь (db.ConcurrentUpdateError)
+
+
+def _is_type_active(type_id: int) -> bool:
+    t = db.get_insurance_type(type_id)
+    return bool(t) and int(t.get("is_active", 0)) == 1
+
+
+def _is_branch_approved(branch_id: int) -> bool:
+    branch = repository.get_branch(branch_id)
+    return branch is not None and branch.status == BranchStatus.APPROVED and branch.approved_by_lawyer
+
+
+def _check_expected(app: Optional[InsuranceApplication], expected_status: Optional[ApplicationStatus]):
+    # статус, который видел пользователь (строка списка, открытая карточка), сверяется с прочитанным в транзакции
+    if app is not None and expected_status is not None and app.status != expected_status:
+        raise db.ConcurrentUpdateError(
+            f"Заявку #{app.id} уже обработал другой пользователь: статус «{app.status.value}» "
+            f"вместо «{expected_status.value}». Обновите список."
+        )
 
 
 class InsuranceService:
-    def perform_action(self, application_id: int, action: Action, user, data: Optional[Dict[str, Any]] = None):
-        app = db.get_application(application_id)
+    def perform_action(
+        self,
+        application_id: int,
+        action: Action,
+        user,
+        data: Optional[Dict[str, Any]] = None,
+        *,
+        expected_status: Optional[ApplicationStatus] = None,
+    ):
+        # чтение, проверки и все записи — одна транзакция; смена статуса — compare-and-set.
+        # expected_status — статус, который видел пользователь: если заявку успели изменить,
+        # db.ConcurrentUpdateError. При блокировке БД другим процессом транзакция повторяется целиком
+        def apply():
+            with db.transaction():
+                app = repository.get_application(application_id)
+                _check_expected(app, expected_status)
+                contract = repository.get_contract_by_application(application_id) if action in _CONTRACT_ACTIONS else None
+                plan = self._check_action(
+                    app, contract, action, user, data or {},
+                    is_type_active=_is_type_active,
+                    is_branch_approved=_is_branch_approved,
+                )
+                self._write_action(application_id, action, plan)
+
+        db.run_with_retry(apply)
+
+        storage.log(
+            f"{user.role.value} '{user.name}' -> {action.value} (заявка #{application_id})",
+            application_id=application_id,
+        )
+        audit.record(user.name, user.role.name, action.name, "application", application_id, data)
+
+    def perform_actions_bulk(
+        self,
+        items: Iterable[Tuple[int, Action, Optional[Dict[str, Any]]]],
+        user,
+        *,
+        chunk_size: int = BULK_CHUNK_SIZE,
+        expected_statuses: Optional[Dict[int, ApplicationStatus]] = None,
+    ) -> List[BulkItemResult]:
+        """
+        Выполняет пакет действий (application_id, action, data).
+        Пакет делится на части по chunk_size, каждая часть — одна транзакция,
+        записи одного вида выполняются одним executemany.
+        expected_statuses — {application_id: статус, который видел пользователь}; заявки,
+        изменённые с тех пор, не обрабатываются и попадают в отчёт с conflict=True.
+        Ошибка по одной заявке не останавливает пакет: итог — отчёт по каждой позиции.
+        """
+        expected_statuses = expected_statuses or {}
+        items = [(int(app_id), action, data or {}) for app_id, action, data in items]
+        results: List[Optional[BulkItemResult]] = [None] * len(items)
+
+        # права и повторы проверяем до обращения к БД
+        pending: List[int] = []
+        seen = set()
+        for i, (app_id, action, _) in enumerate(items):
+            if user.role not in ACTION_ROLES.get(action, set()):
+                results[i] = BulkItemResult(app_id, action, False, "Недостаточно прав для выполнения действия")
+            elif app_id in seen:
+                results[i] = BulkItemResult(app_id, action, False, "Заявка уже есть в этом пакете")
+            else:
+                seen.add(app_id)
+                pending.append(i)
+
+        # справочники читаем один раз на весь пакет
+        active_types = {int(t["id"]) for t in db.list_insurance_types(active_only=True)}
+        approved_branches = {int(b["id"]) for b in db.list_approved_branches()}
+
+        def apply_chunk(chunk: List[int]) -> Tuple[List[int], Dict[int, Exception]]:
+            # результат — только после коммита: при повторе из-за блокировки часть проверяется заново
+            planned: List[int] = []
+            rejected: Dict[int, Exception] = {}
+            with db.transaction():
+                ids = [items[i][0] for i in chunk]
+                apps = repository.get_applications(ids)
+                contracts = repository.get_contracts_by_applications(ids)
+
+                batch = _BulkBatch()
+                for i in chunk:
+                    app_id, action, data = items[i]
+                    try:
+                        _check_expected(apps.get(app_id), expected_statuses.get(app_id))
+                        plan = self._check_action(
+                            apps.get(app_id), contracts.get(app_id), action, user, data,
+                            is_type_active=active_types.__contains__,
+                            is_branch_approved=approved_branches.__contains__,
+                        )
+                    except Exception as e:
+                        rejected[i] = e
+                        continue
+                    batch.add(app_id, action, plan)
+                    planned.append(i)
+
+                batch.write()
+            return planned, rejected
+
+        for start in range(0, len(pending), max(1, int(chunk_size))):
+            chunk = pending[start:start + chunk_size]
+            try:
+                planned, rejected = db.run_with_retry(apply_chunk, chunk)
+                for i, error in rejected.items():
+                    results[i] = BulkItemResult(
+                        items[i][0], items[i][1], False, str(error), isinstance(error, db.ConcurrentUpdateError)
+                    )
+            except Exception as e:
+                # часть откатилась целиком: все её позиции помечаем ошибкой записи
+                for i in chunk:
+                    if results[i] is None:
+                        app_id, action, _ = items[i]
+                        results[i] = BulkItemResult(app_id, action, False, str(e), isinstance(e, db.ConcurrentUpdateError))
+                continue
+
+            for i in planned:
+                app_id, action, data = items[i]
+                results[i] = BulkItemResult(app_id, action, True)
+                storage.log(
+                    f"{user.role.value} '{user.name}' -> {action.value} (заявка #{app_id}, пакет)",
+                    application_id=app_id,
+                )
+                audit.record(user.name, user.role.name, action.name, "application", app_id, {**data, "bulk": True})
+
+        return results
+
+    def _check_action(
+        self,
+        app: Optional[InsuranceApplication],
+        contract: Optional[InsuranceContract],
+        action: Action,
+        user,
+        data: Dict[str, Any],
+        *,
+        is_type_active: Callable[[int], bool],
+        is_branch_approved: Callable[[int], bool],
+    ) -> Dict[str, Any]:
+        """
+        Проверяет действие над заявкой и возвращает нормализованные данные для записи.
+        В БД ничего не пишет.
+        """
         if not app:
             raise ValueError("Заявка не найдена в БД")
 
-        status = ApplicationStatus[app["status"]]
+        status = app.status
 
         allowed = ALLOWED_ACTIONS.get(status, set())
         if action not in allowed:
@@ -23,7 +205,7 @@ class InsuranceService:
         if user.role not in ACTION_ROLES.get(action, set()):
             raise PermissionError("Недостаточно прав для выполнения действия")
 
-        data = data or {}
+        plan: Dict[str, Any] = {"status": status}
 
         if action == Action.ASSESS_RISK:
             risk_percent = int(data.get("risk_percent", -1))
@@ -35,12 +217,10 @@ class InsuranceService:
             if type_id is None:
                 raise ValueError("Нужно выбрать вид страхования")
 
-            t = db.get_insurance_type(int(type_id))
-            if not t or int(t.get("is_active", 0)) != 1:
+            if not is_type_active(int(type_id)):
                 raise ValueError("Выбранный вид страхования недоступен")
 
-            db.set_underwriter_assessment(application_id, risk_percent=risk_percent, insurance_type_id=int(type_id))
-            db.set_application_status(application_id, ApplicationStatus.RISK_ANALYSIS)
+            plan.update(risk_percent=risk_percent, insurance_type_id=int(type_id))
 
         elif action == Action.APPROVE:
             insurance_sum = data.get("insurance_sum", None)
@@ -60,11 +240,10 @@ class InsuranceService:
             if tariff_rate_val <= 0:
                 raise ValueError("Тарифная ставка должна быть > 0")
 
-            db.set_admin_decision(application_id, insurance_sum=insurance_sum_val, tariff_rate=tariff_rate_val)
-            db.set_application_status(application_id, ApplicationStatus.APPROVED)
+            plan.update(insurance_sum=insurance_sum_val, tariff_rate=tariff_rate_val)
 
         elif action == Action.REJECT:
-            db.set_application_status(application_id, ApplicationStatus.REJECTED)
+            pass
 
         elif action == Action.PREPARE_CONTRACT:
             branch_id = data.get("branch_id", None)
@@ -72,52 +251,90 @@ class InsuranceService:
                 raise ValueError("Нужно выбрать филиал для договора")
 
             # проверка обязательных данных договора из заявки
-            app = db.get_application(application_id)
-            if not app:
-                raise ValueError("Заявка не найдена")
-
-            if app.get("insurance_type_id") is None:
+            if app.insurance_type_id is None:
                 raise ValueError("Нельзя подготовить договор: не выбран вид страхования (нужен андеррайтер)")
-            if app.get("insurance_sum") is None or app.get("tariff_rate") is None or app.get("tariff_amount") is None:
+            if app.insurance_sum is None or app.tariff_rate is None or app.tariff_amount is None:
                 raise ValueError("Нельзя подготовить договор: не заполнены сумма/ставка (нужен администратор)")
 
-            branch = db.get_branch(int(branch_id))
-            if not branch or branch["status"] != "APPROVED" or int(branch["approved_by_lawyer"]) != 1:
+            if not is_branch_approved(int(branch_id)):
                 raise ValueError("Выбранный филиал не одобрен юристом или не найден")
 
             draft_text = str(data.get("draft_text", "")).strip()
             if not draft_text:
                 draft_text = "Проект договора (черновик)."
 
-            contract = db.get_contract_by_application(application_id)
-            if not contract:
-                db.create_contract_from_application(application_id, branch_id=int(branch_id), draft_text=draft_text)
-
-            db.set_application_status(application_id, ApplicationStatus.CONTRACT_PREPARED)
+            plan.update(branch_id=int(branch_id), draft_text=draft_text, create_contract=not contract)
 
         elif action == Action.CLIENT_SIGN:
-            contract = db.get_contract_by_application(application_id)
             if not contract:
                 raise ValueError("Нельзя подписать: договор ещё не создан (юрист должен подготовить)")
-            db.set_contract_flags(application_id, client_signed=True, status="client_signed")
-            db.set_application_status(application_id, ApplicationStatus.CLIENT_SIGNED)
+            plan["flags"] = {"client_signed": True, "status": "client_signed"}
 
         elif action == Action.DIRECTOR_SIGN:
-            contract = db.get_contract_by_application(application_id)
             if not contract:
                 raise ValueError("Нельзя подписать: договор ещё не создан")
-            if int(contract["client_signed"]) != 1:
+            if not contract.client_signed:
                 raise ValueError("Сначала должен подписать клиент")
-            db.set_contract_flags(application_id, director_signed=True, status="director_signed")
-            db.set_application_status(application_id, ApplicationStatus.DIRECTOR_SIGNED)
+            plan["flags"] = {"director_signed": True, "status": "director_signed"}
 
         elif action == Action.ARCHIVE_CONTRACT:
-            contract = db.get_contract_by_application(application_id)
             if not contract:
                 raise ValueError("Нельзя архивировать: договора нет в БД")
-            if int(contract["client_signed"]) != 1 or int(contract["director_signed"]) != 1:
+            if not (contract.client_signed and contract.director_signed):
                 raise ValueError("Нельзя архивировать: нет всех подписей (клиент + директор)")
-            db.set_contract_flags(application_id, archived=True, status="archived")
-            db.set_application_status(application_id, ApplicationStatus.ARCHIVED)
+            plan["flags"] = {"archived": True, "status": "archived"}
+
+        return plan
+
+    def _write_action(self, application_id: int, action: Action, plan: Dict[str, Any]):
+        if action == Action.ASSESS_RISK:
+            db.set_underwriter_assessment(
+                application_id, risk_percent=plan["risk_percent"], insurance_type_id=plan["insurance_type_id"]
+            )
+        elif action == Action.APPROVE:
+            db.set_admin_decision(application_id, insurance_sum=plan["insurance_sum"], tariff_rate=plan["tariff_rate"])
+        elif action == Action.PREPARE_CONTRACT:
+            if plan["create_contract"]:
+                db.create_contract_from_application(
+                    application_id, branch_id=plan["branch_id"], draft_text=plan["draft_text"]
+                )
+        elif "flags" in plan:
+            db.set_contract_flags(application_id, **plan["flags"])
+
+        db.set_application_status(application_id, NEXT_STATUS[action], expected=plan["status"])
+
+
+class _BulkBatch:
+    """Накопитель записей части пакета: по одному executemany на вид записи."""
+
+    def __init__(self):
+        self.assessments: List[Tuple[int, int, int]] = []
+        self.decisions: List[Tuple[int, float, float]] = []
+        self.contracts: List[Tuple[int, int, str]] = []
+        self.flags: List[Tuple[int, Dict[str, Any]]] = []
+        self.statuses: List[Tuple[int, ApplicationStatus, ApplicationStatus]] = []
+
+    def add(self, application_id: int, action: Action, plan: Dict[str, Any]):
+        if action == Action.ASSESS_RISK:
+            self.assessments.append((application_id, plan["risk_percent"], plan["insurance_type_id"]))
+        elif action == Action.APPROVE:
+            self.decisions.append((application_id, plan["insurance_sum"], plan["tariff_rate"]))
+        elif action == Action.PREPARE_CONTRACT:
+            if plan["create_contract"]:
+                self.contracts.append((application_id, plan["branch_id"], plan["draft_text"]))
+        elif "flags" in plan:
+            self.flags.append((application_id, plan["flags"]))
+
+        self.statuses.append((application_id, NEXT_STATUS[action], plan["status"]))
 
-        storage.log(f"{user.role.value} '{user.name}' -> {action.value} (заявка #{application_id})")
+    def write(self):
+        if self.assessments:
+            db.set_underwriter_assessments(self.assessments)
+        if self.decisions:
+            db.set_admin_decisions(self.decisions)
+        if self.contracts:
+            db.create_contracts_from_applications(self.contracts)
+        if self.flags:
+            db.set_contract_flags_many(self.flags)
+        if self.statuses:
+            db.set_application_statuses(self.statuses)
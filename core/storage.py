@@ -1,10 +1,89 @@
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Callable, Deque, List, Optional
+
+LOG_CAPACITY = 10000          # общий журнал сессии (кольцевой буфер)
+ENTITY_LOG_CAPACITY = 200     # записей на одну заявку/филиал
+TRACKED_ENTITIES = 5000       # сколько заявок/филиалов держим в индексе (LRU)
+
+
+@dataclass(frozen=True)
+class LogEntry:
+    seq: int
+    text: str
+    application_id: Optional[int] = None
+    branch_id: Optional[int] = None
+
+
+class _EntityIndex:
+    def __init__(self, per_entity: int, max_entities: int):
+        self.per_entity = per_entity
+        self.max_entities = max_entities
+        self._items: "OrderedDict[int, Deque[LogEntry]]" = OrderedDict()
+
+    def add(self, entity_id: int, entry: LogEntry):
+        bucket = self._items.get(entity_id)
+        if bucket is None:
+            bucket = deque(maxlen=self.per_entity)
+            self._items[entity_id] = bucket
+            while len(self._items) > self.max_entities:
+                self._items.popitem(last=False)
+        else:
+            self._items.move_to_end(entity_id)
+        bucket.append(entry)
+
+    def get(self, entity_id: int) -> List[LogEntry]:
+        return list(self._items.get(entity_id, ()))
+
+
 class MemoryStorage:
-    def __init__(self):
+    def __init__(
+        self,
+        capacity: int = LOG_CAPACITY,
+        entity_capacity: int = ENTITY_LOG_CAPACITY,
+        tracked_entities: int = TRACKED_ENTITIES,
+    ):
         self.users = []
-        self.logs = []
+        self.logs: Deque[str] = deque(maxlen=capacity)
+        self._by_application = _EntityIndex(entity_capacity, tracked_entities)
+        self._by_branch = _EntityIndex(entity_capacity, tracked_entities)
+        self._listeners: List[Callable[[LogEntry], None]] = []
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def log(self, text: str, *, application_id: Optional[int] = None, branch_id: Optional[int] = None) -> LogEntry:
+        with self._lock:
+            self._seq += 1
+            entry = LogEntry(self._seq, text, application_id, branch_id)
+            self.logs.append(text)
+            if application_id is not None:
+                self._by_application.add(int(application_id), entry)
+            if branch_id is not None:
+                self._by_branch.add(int(branch_id), entry)
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            listener(entry)
+        return entry
+
+    def application_log(self, application_id: int) -> List[str]:
+        with self._lock:
+            return [e.text for e in self._by_application.get(int(application_id))]
+
+    def branch_log(self, branch_id: int) -> List[str]:
+        with self._lock:
+            return [e.text for e in self._by_branch.get(int(branch_id))]
+
+    def subscribe(self, listener: Callable[[LogEntry], None]):
+        """listener(entry) вызывается на каждую новую запись (в потоке, который её добавил)."""
+        with self._lock:
+            self._listeners.append(listener)
 
-    def log(self, text: str):
-        self.logs.append(text)
+    def unsubscribe(self, listener: Callable[[LogEntry], None]):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
 
 
 storage = MemoryStorage()
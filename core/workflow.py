@@ -1,5 +1,6 @@
-from core.enums import ApplicationStatus
+from core.enums import ApplicationStatus, Role
 from core.actions import Action
+from core.permissions import ACTION_ROLES
 
 ALLOWED_ACTIONS = {
     ApplicationStatus.CREATED: {
@@ -24,3 +25,13 @@ ALLOWED_ACTIONS = {
     ApplicationStatus.REJECTED: set(),
     ApplicationStatus.ARCHIVED: set(),
 }
+
+# статусы, на которых роль может выполнить хотя бы одно действие (для списка "Мои задачи")
+ACTIONABLE_STATUSES = {
+    role: frozenset(
+        status
+        for status, actions in ALLOWED_ACTIONS.items()
+        if any(role in ACTION_ROLES.get(a, set()) for a in actions)
+    )
+    for role in Role
+}
@@ -2,7 +2,8 @@ import sys
 from PyQt5.QtWidgets import QApplication
 
 from ui.main_window import MainWindow
-from core.db import db_init
+from core.db import configure_from_env, db_init
+from core import events, profiling
 
 
 APP_STYLE = """
@@ -94,21 +95,21 @@ QPushButton#Secondary:hover { border-color: #cbd5e1; }
 QPushButton#Secondary:pressed { background: #f3f4f6; }
 
 /* Lists */
-QListWidget {
+QListView {
     background: #ffffff;
     border: 1px solid #e5e7eb;
     border-radius: 12px;
     padding: 6px;
 }
-QListWidget::item {
+QListView::item {
     padding: 10px;
     border-radius: 10px;
 }
-QListWidget::item:selected {
+QListView::item:selected {
     background: #111827;
     color: #ffffff;
 }
-QListWidget::item:hover {
+QListView::item:hover {
     background: #f3f4f6;
 }
 
@@ -120,7 +121,10 @@ QMessageBox {
 
 
 def main():
+    configure_from_env()
+    profiling.enable_from_env()
     db_init()
+    events.start_watcher()
     app = QApplication(sys.argv)
     app.setStyleSheet(APP_STYLE)
     window = MainWindow()
@@ -1,9 +1,11 @@
+from typing import Optional
+
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QLabel,
     QPushButton, QMessageBox, QListWidget, QGroupBox, QHBoxLayout,
     QSpacerItem, QSizePolicy, QSlider, QTextEdit, QLineEdit, QComboBox
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 
 from core.services import InsuranceService
 from core.actions import Action
@@ -11,23 +13,40 @@ from core.workflow import ALLOWED_ACTIONS
 from core.permissions import ACTION_ROLES
 from core.enums import ApplicationStatus, Role
 from core.storage import storage
-from core import db
+from core import db, repository
 
 
-def _status_pretty(status_name: str) -> str:
-    try:
-        return ApplicationStatus[status_name].value
-    except Exception:
-        return status_name
+def _load_view(application_id: int, role: Role) -> dict:
+    """Всё, что нужно окну заявки: карточка и справочники для формы роли (выполняется в фоне)."""
+    view = {"app": repository.get_application_detail(application_id), "types": [], "branches": []}
+    if role == Role.UNDERWRITER:
+        view["types"] = db.list_insurance_types(active_only=True)
+    elif role == Role.LAWYER:
+        view["branches"] = db.list_approved_branches()
+    return view
 
 
 class ApplicationWindow(QWidget):
+    # записи лога приходят из фоновых потоков — в виджет попадают через сигнал
+    log_entry_added = pyqtSignal(str)
+
     def __init__(self, application_id: int, user, parent):
         super().__init__()
         self.application_id = application_id
         self.user = user
         self.parent = parent
         self.service = InsuranceService()
+        self.runner = parent.runner
+        self._load_channel = f"application-{id(self)}"
+        # длинные тексты карточка не читает: описание и проект договора загружаются по кнопке
+        self._text_channel = f"application-text-{id(self)}"
+        # результат действия доставляется, только пока окно открыто
+        self._action_channel = f"application-action-{id(self)}"
+        self._request_text: Optional[str] = None
+        self._draft_text: Optional[str] = None
+        # статус, с которым показана карточка: действие выполняется, только если он не изменился
+        self._status: Optional[ApplicationStatus] = None
+        parent.changes.changed.connect(self._on_data_changed)
 
         self.setWindowTitle(f"Заявка #{application_id}")
         self.resize(920, 720)
@@ -53,6 +72,16 @@ class ApplicationWindow(QWidget):
         self.info_label = QLabel()
         self.info_label.setWordWrap(True)
         info_l.addWidget(self.info_label)
+
+        self.request_btn = QPushButton("Показать описание заявки")
+        self.request_btn.setObjectName("Secondary")
+        self.request_btn.clicked.connect(self._load_request_text)
+        info_l.addWidget(self.request_btn)
+
+        self.request_view = QTextEdit()
+        self.request_view.setReadOnly(True)
+        self.request_view.setVisible(False)
+        info_l.addWidget(self.request_view)
         info_box.setLayout(info_l)
         root.addWidget(info_box)
 
@@ -68,6 +97,11 @@ class ApplicationWindow(QWidget):
         self.contract_label.setWordWrap(True)
         contract_l.addWidget(self.contract_label)
 
+        self.draft_btn = QPushButton("Показать проект договора")
+        self.draft_btn.setObjectName("Secondary")
+        self.draft_btn.clicked.connect(self._load_draft_text)
+        contract_l.addWidget(self.draft_btn)
+
         self.contract_draft = QTextEdit()
         self.contract_draft.setPlaceholderText("Текст проекта договора (черновик)")
         contract_l.addWidget(self.contract_draft)
@@ -82,9 +116,31 @@ class ApplicationWindow(QWidget):
         logs_box.setLayout(logs_l)
         root.addWidget(logs_box, 1)
 
+        # история только этой заявки; новые записи дописываются по подписке
+        self.log_list.addItems(storage.application_log(application_id))
+        self.log_entry_added.connect(self.log_list.addItem)
+        storage.subscribe(self._on_log_entry)
+
         self.setLayout(root)
         self.update_ui()
 
+    def _on_log_entry(self, entry):
+        if entry.application_id == self.application_id:
+            self.log_entry_added.emit(entry.text)
+
+    def _on_data_changed(self, changes):
+        if any(c.op == "reset" or (c.entity == "application" and c.entity_id == self.application_id) for c in changes):
+            self.update_ui()
+
+    def closeEvent(self, event):
+        self.parent.changes.changed.disconnect(self._on_data_changed)
+        storage.unsubscribe(self._on_log_entry)
+        self.runner.cancel(self._load_channel)
+        self.runner.cancel(self._text_channel)
+        self.runner.cancel(f"{self._text_channel}-draft")
+        self.runner.cancel(self._action_channel)
+        super().closeEvent(event)
+
     def _allowed_for_user(self, status: ApplicationStatus, action: Action) -> bool:
         allowed = ALLOWED_ACTIONS.get(status, set())
         return (action in allowed) and (self.user.role in ACTION_ROLES.get(action, set()))
@@ -97,12 +153,65 @@ class ApplicationWindow(QWidget):
                 w.deleteLater()
 
     def _run(self, action: Action, data=None):
-        try:
-            self.service.perform_action(self.application_id, action, self.user, data=data or {})
+        self.role_box.setEnabled(False)
+        self.runner.submit(
+            self.service.perform_action, self.application_id, action, self.user,
+            data=data or {},
+            expected_status=self._status,
+            channel=self._action_channel,
+            on_done=self._on_action_done,
+            on_error=self._on_action_failed,
+        )
+
+    def _load_request_text(self):
+        self.request_btn.setEnabled(False)
+        self.runner.submit(
+            db.get_application_text, self.application_id,
+            channel=self._text_channel,
+            on_done=self._show_request_text,
+            on_error=self._on_text_failed,
+        )
+
+    def _show_request_text(self, text):
+        # описание заявки после создания не меняется — загружается один раз
+        self._request_text = text or ""
+        self.request_btn.setVisible(False)
+        self.request_view.setPlainText(self._request_text)
+        self.request_view.setVisible(True)
+
+    def _load_draft_text(self):
+        self.draft_btn.setEnabled(False)
+        self.runner.submit(
+            db.get_contract_draft, self.application_id,
+            channel=f"{self._text_channel}-draft",
+            on_done=self._show_draft_text,
+            on_error=self._on_text_failed,
+        )
+
+    def _show_draft_text(self, text):
+        self._draft_text = text or ""
+        self.draft_btn.setVisible(False)
+        self.contract_draft.setPlainText(self._draft_text)
+        self.contract_draft.setReadOnly(True)
+        self.contract_draft.setVisible(True)
+
+    def _on_text_failed(self, error):
+        self.request_btn.setEnabled(True)
+        self.draft_btn.setEnabled(True)
+        QMessageBox.warning(self, "Ошибка", str(error))
+
+    def _on_action_done(self, _):
+        # список задач обновится по уведомлению об изменении (см. MainWindow.on_data_changed)
+        self.update_ui()
+
+    def _on_action_failed(self, error):
+        self.role_box.setEnabled(True)
+        if isinstance(error, db.ConcurrentUpdateError):
+            # карточка устарела: показываем актуальное состояние заявки
+            QMessageBox.information(self, "Заявка изменена", str(error))
             self.update_ui()
-            self.parent.refresh_current_list()
-        except Exception as e:
-            QMessageBox.warning(self, "Ошибка", str(e))
+            return
+        QMessageBox.warning(self, "Ошибка", str(error))
 
     # ---- role UIs ----
 
@@ -114,7 +223,7 @@ class ApplicationWindow(QWidget):
         else:
             self.role_l.addWidget(QLabel("Нет действий по этой заявке на текущем этапе."))
 
-    def _build_underwriter_ui(self, status: ApplicationStatus):
+    def _build_underwriter_ui(self, status: ApplicationStatus, types):
         if not self._allowed_for_user(status, Action.ASSESS_RISK):
             self.role_l.addWidget(QLabel("Нет действий по этой заявке на текущем этапе."))
             return
@@ -137,7 +246,7 @@ class ApplicationWindow(QWidget):
 
         self.type_combo = QComboBox()
         self.type_combo.addItem("Выберите вид страхования...", None)
-        for t in db.list_insurance_types(active_only=True):
+        for t in types:
             self.type_combo.addItem(t["name"], int(t["id"]))
 
         l.addWidget(QLabel("Вид страхования (из БД):"))
@@ -197,13 +306,12 @@ class ApplicationWindow(QWidget):
         r = self.rate_input.text().strip().replace(",", ".")
         self._run(Action.APPROVE, data={"insurance_sum": s, "tariff_rate": r})
 
-    def _build_lawyer_ui(self, status: ApplicationStatus):
+    def _build_lawyer_ui(self, status: ApplicationStatus, branches):
         if self._allowed_for_user(status, Action.PREPARE_CONTRACT):
             box = QGroupBox("Подготовка договора")
             l = QVBoxLayout()
             l.setSpacing(8)
 
-            branches = db.list_approved_branches()
             self.branch_combo = QComboBox()
             self.branch_combo.addItem("Выберите филиал...", None)
             for b in branches:
@@ -256,97 +364,86 @@ class ApplicationWindow(QWidget):
             self.role_l.addWidget(QLabel("Нет действий по этой заявке на текущем этапе."))
 
     def update_ui(self):
-        app = db.get_application(self.application_id)
+        # заявка, вид страхования, договор и филиал — одним запросом в фоне
+        self.role_box.setEnabled(False)
+        self.runner.submit(
+            _load_view, self.application_id, self.user.role,
+            channel=self._load_channel,
+            on_done=self._render,
+            on_error=lambda e: QMessageBox.warning(self, "Ошибка", str(e)),
+        )
+
+    def _render(self, view: dict):
+        app = view["app"]
+        self.role_box.setEnabled(True)
         if not app:
             self.info_label.setText("Заявка удалена или не найдена.")
+            self.request_btn.setVisible(False)
             self.role_box.setVisible(False)
             self.contract_box.setVisible(False)
             return
 
-        status = ApplicationStatus[app["status"]]
-        status_pretty = _status_pretty(app["status"])
-
-        # вид страхования (1)
-        type_name = "—"
-        if app.get("insurance_type_id") is not None:
-            t = db.get_insurance_type(int(app["insurance_type_id"]))
-            if t:
-                type_name = t["name"]
-
-        insurance_sum = app.get("insurance_sum")
-        tariff_rate = app.get("tariff_rate")
-        tariff_amount = app.get("tariff_amount")
+        # карточка уже типизирована (core.models.ApplicationDetail): статус — перечисление, флаги — bool
+        status = self._status = app.status
+        type_name = app.insurance_type_name or "—"
 
         self.info_label.setText(
-            f"ФИО клиента: {app.get('client_fio', '')}\n"
-            f"Объект: {app.get('insured_object', '')}\n"
-            f"Описание: {app.get('request_text', '')}\n\n"
-            f"Статус: {status_pretty}\n"
-            f"Риск: {int(app.get('risk_percent') or 0)}%\n"
+            f"ФИО клиента: {app.client_fio}\n"
+            f"Объект: {app.insured_object}\n\n"
+            f"Статус: {status.value}\n"
+            f"Риск: {app.risk_percent}%\n"
             f"Вид страхования: {type_name}\n"
-            f"Страховая сумма: {insurance_sum if insurance_sum is not None else '—'}\n"
-            f"Тарифная ставка (%): {tariff_rate if tariff_rate is not None else '—'}\n"
-            f"Тариф к оплате: {tariff_amount if tariff_amount is not None else '—'}\n"
-            f"updated_at: {app.get('updated_at')}"
+            f"Страховая сумма: {app.insurance_sum if app.insurance_sum is not None else '—'}\n"
+            f"Тарифная ставка (%): {app.tariff_rate if app.tariff_rate is not None else '—'}\n"
+            f"Тариф к оплате: {app.tariff_amount if app.tariff_amount is not None else '—'}\n"
+            f"updated_at: {app.updated_at}"
         )
 
-        contract = db.get_contract_by_application(self.application_id)
-        show_contract = bool(contract) or (self.user.role == Role.LAWYER and status == ApplicationStatus.APPROVED)
+        has_contract = app.contract_id is not None
+        show_contract = has_contract or (self.user.role == Role.LAWYER and status == ApplicationStatus.APPROVED)
         self.contract_box.setVisible(show_contract)
 
+        # проект договора — только юристу и только по кнопке
+        show_draft = has_contract and self.user.role == Role.LAWYER
+        self.draft_btn.setVisible(show_draft and self._draft_text is None)
+        self.contract_draft.setVisible(show_draft and self._draft_text is not None)
+
         if not show_contract:
             self.contract_label.setText("")
-            self.contract_draft.setVisible(False)
         else:
-            if not contract:
+            if not has_contract:
                 self.contract_label.setText("Договор ещё не создан.")
-                self.contract_draft.setVisible(False)
             else:
                 branch_name = "—"
-                if contract.get("branch_id"):
-                    b = db.get_branch(int(contract["branch_id"]))
-                    if b:
-                        branch_name = f"{b.get('branch_name','')} ({b.get('address','')}, {b.get('phone','')})"
+                if app.branch_name is not None:
+                    branch_name = f"{app.branch_name} ({app.branch_address or ''}, {app.branch_phone or ''})"
 
-                c_type = "—"
-                if contract.get("insurance_type_id") is not None:
-                    t = db.get_insurance_type(int(contract["insurance_type_id"]))
-                    if t:
-                        c_type = t["name"]
+                c_type = app.contract_insurance_type_name or "—"
 
                 self.contract_label.setText(
-                    f"Дата заключения: {contract.get('contract_date','—')}\n"
+                    f"Дата заключения: {app.contract_date or '—'}\n"
                     f"Филиал: {branch_name}\n"
                     f"Вид страхования: {c_type}\n"
-                    f"Страховая сумма: {contract.get('insurance_sum','—')}\n"
-                    f"Тарифная ставка (%): {contract.get('tariff_rate','—')}\n"
-                    f"Тариф к оплате: {contract.get('tariff_amount','—')}\n\n"
-                    f"Подписано клиентом: {bool(contract.get('client_signed'))}\n"
-                    f"Подписано директором: {bool(contract.get('director_signed'))}\n"
-                    f"Архивировано: {bool(contract.get('archived'))}\n"
-                    f"updated_at: {contract.get('updated_at')}"
+                    f"Страховая сумма: {app.contract_insurance_sum}\n"
+                    f"Тарифная ставка (%): {app.contract_tariff_rate}\n"
+                    f"Тариф к оплате: {app.contract_tariff_amount}\n\n"
+                    f"Подписано клиентом: {app.client_signed}\n"
+                    f"Подписано директором: {app.director_signed}\n"
+                    f"Архивировано: {app.archived}\n"
+                    f"updated_at: {app.contract_updated_at}"
                 )
 
-                if self.user.role == Role.LAWYER:
-                    self.contract_draft.setVisible(True)
-                    self.contract_draft.setPlainText(contract.get("draft_text") or "")
-                    self.contract_draft.setReadOnly(True)
-                else:
-                    self.contract_draft.setVisible(False)
-
         self._clear_role_layout()
         if self.user.role == Role.CLIENT:
             self._build_client_ui(status)
         elif self.user.role == Role.UNDERWRITER:
-            self._build_underwriter_ui(status)
+            self._build_underwriter_ui(status, view["types"])
         elif self.user.role == Role.ADMIN:
             self._build_admin_ui(status)
         elif self.user.role == Role.LAWYER:
-            self._build_lawyer_ui(status)
+            self._build_lawyer_ui(status, view["branches"])
         elif self.user.role == Role.BRANCH_DIRECTOR:
             self._build_director_ui(status)
         else:
             self.role_l.addWidget(QLabel("Роль не поддерживается."))
 
-        self.log_list.clear()
-        self.log_list.addItems(storage.logs)
@@ -1,23 +1,19 @@
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QMessageBox, QGroupBox, QHBoxLayout, QSpacerItem, QSizePolicy
 
-from core.enums import Role, BranchStatus
-from core import db
+from core.enums import Role
+from core import audit, db, repository
 from core.storage import storage
 
 
-def _branch_status_pretty(status_name: str) -> str:
-    try:
-        return BranchStatus[status_name].value
-    except Exception:
-        return status_name
-
-
 class BranchWindow(QWidget):
     def __init__(self, branch_id: int, user, parent):
         super().__init__()
         self.branch_id = branch_id
         self.user = user
         self.parent = parent
+        self.runner = parent.runner
+        self._load_channel = f"branch-{id(self)}"
+        parent.changes.changed.connect(self._on_data_changed)
 
         self.setWindowTitle(f"Филиал #{branch_id}")
         self.resize(780, 460)
@@ -62,43 +58,62 @@ class BranchWindow(QWidget):
         self.update_ui()
 
     def approve(self):
-        try:
-            if self.user.role != Role.LAWYER:
-                raise PermissionError("Одобрить филиал может только Юрист.")
+        if self.user.role != Role.LAWYER:
+            QMessageBox.warning(self, "Ошибка", "Одобрить филиал может только Юрист.")
+            return
+
+        self.approve_btn.setEnabled(False)
+        self.runner.submit(
+            db.approve_branch_by_lawyer, self.branch_id,
+            on_done=self._on_approved,
+            on_error=self._on_approve_failed,
+        )
 
-            branch = db.get_branch(self.branch_id)
-            if not branch:
-                raise ValueError("Заявка на филиал не найдена")
+    def _on_approved(self, _):
+        storage.log(f"Юрист '{self.user.name}' одобрил филиал #{self.branch_id}", branch_id=self.branch_id)
+        audit.record(self.user.name, self.user.role.name, "APPROVE_BRANCH", "branch", self.branch_id)
+        self.approve_btn.setEnabled(True)
+        self.update_ui()
 
-            if int(branch["approved_by_lawyer"]) == 1:
-                raise ValueError("Филиал уже одобрен юристом.")
+    def _on_approve_failed(self, error):
+        self.approve_btn.setEnabled(True)
+        QMessageBox.warning(self, "Ошибка", str(error))
 
-            db.approve_branch_by_lawyer(self.branch_id)
-            storage.log(f"Юрист '{self.user.name}' одобрил филиал #{self.branch_id}")
+    def _on_data_changed(self, changes):
+        if any(c.op == "reset" or (c.entity == "branch" and c.entity_id == self.branch_id) for c in changes):
             self.update_ui()
-            self.parent.refresh_current_list()
 
-        except Exception as e:
-            QMessageBox.warning(self, "Ошибка", str(e))
+    def closeEvent(self, event):
+        self.parent.changes.changed.disconnect(self._on_data_changed)
+        self.runner.cancel(self._load_channel)
+        super().closeEvent(event)
 
     def update_ui(self):
-        branch = db.get_branch(self.branch_id)
+        self.runner.submit(
+            repository.get_branch, self.branch_id,
+            channel=self._load_channel,
+            on_done=self._render,
+            on_error=lambda e: QMessageBox.warning(self, "Ошибка", str(e)),
+        )
+
+    def _render(self, branch):
         if not branch:
             self.info.setText("Заявка на филиал не найдена.")
             self.approve_btn.setVisible(False)
             return
 
+        # core.models.Branch: статус — перечисление, флаги — bool
         self.info.setText(
-            f"Название: {branch.get('branch_name','')}\n"
-            f"Адрес: {branch.get('address','')}\n"
-            f"Телефон: {branch.get('phone','')}\n\n"
-            f"Статус: {_branch_status_pretty(branch.get('status',''))}\n"
-            f"Создатель: {branch.get('created_by','')}\n"
-            f"updated_at: {branch.get('updated_at','')}"
+            f"Название: {branch.branch_name}\n"
+            f"Адрес: {branch.address}\n"
+            f"Телефон: {branch.phone}\n\n"
+            f"Статус: {branch.status.value}\n"
+            f"Создатель: {branch.created_by}\n"
+            f"updated_at: {branch.updated_at}"
         )
 
-        confirmed = bool(branch["confirmed_by_director"])
-        approved = bool(branch["approved_by_lawyer"])
+        confirmed = branch.confirmed_by_director
+        approved = branch.approved_by_lawyer
 
         self.flags.setText(
             f"Подтверждено директором: {confirmed}\n"
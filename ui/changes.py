@@ -0,0 +1,23 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from core import events
+
+
+class ChangeBridge(QObject):
+    """
+    Переносит пачки изменений из потока наблюдателя (core/events) в GUI-поток.
+    Окна подключаются к сигналу changed(list[events.Change]).
+    """
+
+    changed = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        events.subscribe(self._on_changes)
+
+    def _on_changes(self, changes):
+        # сигнал из чужого потока доставляется получателям в GUI-потоке (очередью)
+        self.changed.emit(list(changes))
+
+    def close(self):
+        events.unsubscribe(self._on_changes)
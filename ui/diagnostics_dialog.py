@@ -0,0 +1,59 @@
+from PyQt5.QtGui import QFontDatabase
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QPlainTextEdit, QFileDialog, QMessageBox
+
+from core import profiling
+
+
+class DiagnosticsDialog(QDialog):
+    """Отчёт профилирования core/db (доступен при запуске с INSURANCE_PROFILE=1)."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Диагностика БД")
+        self.resize(1100, 600)
+
+        root = QVBoxLayout()
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.text.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        root.addWidget(self.text, 1)
+
+        row = QHBoxLayout()
+        refresh = QPushButton("Обновить")
+        refresh.clicked.connect(self.refresh)
+        reset = QPushButton("Сбросить")
+        reset.setObjectName("Secondary")
+        reset.clicked.connect(self.reset)
+        save = QPushButton("Сохранить JSON...")
+        save.setObjectName("Secondary")
+        save.clicked.connect(self.save)
+        close = QPushButton("Закрыть")
+        close.setObjectName("Secondary")
+        close.clicked.connect(self.accept)
+
+        row.addWidget(refresh)
+        row.addWidget(reset)
+        row.addWidget(save)
+        row.addStretch(1)
+        row.addWidget(close)
+        root.addLayout(row)
+
+        self.setLayout(root)
+        self.refresh()
+
+    def refresh(self):
+        self.text.setPlainText(profiling.format_report())
+
+    def reset(self):
+        profiling.reset()
+        self.refresh()
+
+    def save(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Сохранить отчёт", "profile.json", "JSON (*.json)")
+        if not path:
+            return
+        try:
+            profiling.dump(path)
+        except Exception as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
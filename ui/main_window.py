@@ -1,17 +1,23 @@
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QLabel, QListWidget, QComboBox, QMessageBox, QGroupBox,
-    QLineEdit, QTextEdit, QStackedWidget
+    QPushButton, QLabel, QListView, QComboBox, QMessageBox, QGroupBox,
+    QLineEdit, QTextEdit, QStackedWidget, QCheckBox, QAbstractItemView, QInputDialog
 )
 
-from core.models import User
+from core.models import User, DEFAULT_USERS
 from core.enums import Role, ApplicationStatus, BranchStatus
-from core.storage import storage
-from core.workflow import ALLOWED_ACTIONS
+from core.actions import Action
 from core.permissions import ACTION_ROLES
-from core import db
+from core.services import InsuranceService
+from core.storage import storage
+from core import audit, db, events, profiling
 from ui.application_window import ApplicationWindow
 from ui.branch_window import BranchWindow
+from ui.worklist_model import WorklistModel
+from ui.workers import DbRunner
+from ui.changes import ChangeBridge
+from ui.diagnostics_dialog import DiagnosticsDialog
 
 
 def _app_status_pretty(status_name: str) -> str:
@@ -28,19 +34,56 @@ def _branch_status_pretty(status_name: str) -> str:
         return status_name
 
 
-def _needs_user_action(app_row: dict, user: User) -> bool:
-    try:
-        status = ApplicationStatus[app_row["status"]]
-    except Exception:
-        return False
+WORKLIST_PAGE_SIZE = 200
+SEARCH_DEBOUNCE_MS = 250   # поиск запускается, когда пользователь перестал печатать
+
+WORKLIST_SORTS = [
+    ("Номер", "id"),
+    ("Дата изменения", "updated_at"),
+    ("Страховая сумма", "insurance_sum"),
+    ("Статус", "status"),
+]
+
+
+def _format_application_row(a: dict) -> str:
+    text = f"Заявка #{a['id']}  •  {_app_status_pretty(a['status'])}  •  {a.get('client_fio','')}  •  {a.get('insured_object','')}"
+    if a.get("insurance_sum") is not None:
+        text += f"  •  {a['insurance_sum']}"
+    return text
+
 
-    allowed_actions = ALLOWED_ACTIONS.get(status, set())
-    for a in allowed_actions:
-        if user.role in ACTION_ROLES.get(a, set()):
-            if user.role == Role.CLIENT and app_row.get("client_name") != user.name:
-                return False
-            return True
-    return False
+def _format_branch_row(b: dict) -> str:
+    return f"Филиал #{b['id']}  •  {_branch_status_pretty(b['status'])}  •  {b['branch_name']}"
+
+
+def _format_portfolio(rows: list) -> str:
+    # сводка по филиалам директора: строки portfolio_summary (филиал, вид, статус) складываем по филиалу
+    by_branch = {}
+    for r in rows:
+        b = by_branch.setdefault(r["branch_id"], {"name": r["branch_name"], "count": 0, "sum": 0.0, "tariff": 0.0, "signed": 0})
+        b["count"] += r["applications"]
+        b["sum"] += r["insurance_sum"]
+        b["tariff"] += r["tariff_amount"]
+        if r["status"] in (ApplicationStatus.DIRECTOR_SIGNED.name, ApplicationStatus.ARCHIVED.name):
+            b["signed"] += r["applications"]
+    if not by_branch:
+        return "Портфель: договоров по вашим филиалам пока нет"
+    lines = ["Портфель:"]
+    for b in by_branch.values():
+        amount = f"{b['sum']:,.0f}".replace(",", " ")
+        tariff = f"{b['tariff']:,.2f}".replace(",", " ")
+        lines.append(f"{b['name']}: договоров {b['count']} (подписано {b['signed']}), страховая сумма {amount}, тариф {tariff}")
+    return "\n".join(lines)
+
+
+def _load_bulk_refs(action: Action) -> dict:
+    # справочники для диалогов массовой обработки (выполняется в фоне)
+    refs = {}
+    if action == Action.ASSESS_RISK:
+        refs["types"] = db.list_insurance_types(active_only=True)
+    elif action == Action.PREPARE_CONTRACT:
+        refs["branches"] = db.list_approved_branches()
+    return refs
 
 
 class MainWindow(QMainWindow):
@@ -49,19 +92,20 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Insurance BPMN MVP")
         self.resize(980, 700)
 
+        self.service = InsuranceService()
+        # все обращения к БД идут через фоновые задачи, GUI-поток только отображает результат
+        self.runner = DbRunner(self)
+        # изменения данных (в том числе из других процессов) приходят сюда и в открытые окна
+        self.changes = ChangeBridge(self)
+        self.changes.changed.connect(self.on_data_changed)
+        self._fetch_rows = None
         self._init_users()
         self._init_ui()
         self.refresh_current_list()
 
     def _init_users(self):
         if not storage.users:
-            storage.users = [
-                User(1, "Иван", Role.CLIENT),
-                User(2, "Ольга", Role.UNDERWRITER),
-                User(3, "Сергей", Role.ADMIN),
-                User(4, "Анна", Role.LAWYER),
-                User(5, "Дмитрий", Role.BRANCH_DIRECTOR),
-            ]
+            storage.users = list(DEFAULT_USERS)
 
     def _init_ui(self):
         central = QWidget()
@@ -160,8 +204,23 @@ class MainWindow(QMainWindow):
         list_box = QGroupBox("Мои задачи")
         list_l = QVBoxLayout()
 
-        self.list_widget = QListWidget()
-        list_l.addWidget(self.list_widget, 1)
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Поиск заявок: ФИО, объект, описание, проект договора")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.refresh_current_list)
+        self.search_edit.textChanged.connect(lambda _: self.search_timer.start())
+        list_l.addWidget(self.search_edit)
+
+        self.list_model = WorklistModel(_format_application_row, self.runner, page_size=WORKLIST_PAGE_SIZE, parent=self)
+        self.list_model.load_failed.connect(lambda e: QMessageBox.warning(self, "Ошибка", str(e)))
+        self.list_view = QListView()
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setModel(self.list_model)
+        self.list_view.doubleClicked.connect(lambda _: self.open_item())
+        list_l.addWidget(self.list_view, 1)
 
         row = QHBoxLayout()
         self.open_btn = QPushButton("Открыть")
@@ -171,15 +230,48 @@ class MainWindow(QMainWindow):
         self.refresh_btn.setObjectName("Secondary")
         self.refresh_btn.clicked.connect(self.refresh_current_list)
 
+        self.sort_combo = QComboBox()
+        for label, key in WORKLIST_SORTS:
+            self.sort_combo.addItem(label, key)
+        self.sort_combo.currentIndexChanged.connect(lambda _: self.refresh_current_list())
+
+        self.diagnostics_btn = QPushButton("Диагностика")
+        self.diagnostics_btn.setObjectName("Secondary")
+        self.diagnostics_btn.clicked.connect(lambda: DiagnosticsDialog(self).exec_())
+        self.diagnostics_btn.setVisible(profiling.enabled())
+
         row.addWidget(self.open_btn)
         row.addWidget(self.refresh_btn)
+        row.addWidget(self.diagnostics_btn)
         row.addStretch(1)
+        row.addWidget(QLabel("Сортировка:"))
+        row.addWidget(self.sort_combo)
         list_l.addLayout(row)
 
+        # Массовая обработка выбранных заявок
+        bulk_row = QHBoxLayout()
+        self.bulk_check = QCheckBox("Массовая обработка")
+        self.bulk_check.toggled.connect(self.on_bulk_mode_changed)
+
+        self.bulk_action_combo = QComboBox()
+
+        self.bulk_btn = QPushButton("Выполнить для выбранных")
+        self.bulk_btn.clicked.connect(self.run_bulk_action)
+
+        bulk_row.addWidget(self.bulk_check)
+        bulk_row.addWidget(self.bulk_action_combo, 1)
+        bulk_row.addWidget(self.bulk_btn)
+        list_l.addLayout(bulk_row)
+
         self.hint = QLabel("")
         self.hint.setObjectName("Muted")
         list_l.addWidget(self.hint)
 
+        self.portfolio_label = QLabel("")
+        self.portfolio_label.setObjectName("Muted")
+        self.portfolio_label.setVisible(False)
+        list_l.addWidget(self.portfolio_label)
+
         list_box.setLayout(list_l)
         root.addWidget(list_box, 2)
 
@@ -195,10 +287,30 @@ class MainWindow(QMainWindow):
         return str(self.section_combo.currentData() or "applications")
 
     def on_context_changed(self):
+        # запросы, относящиеся к прежнему пользователю/разделу, больше не нужны
+        self.runner.cancel("bulk-refs")
+        self.bulk_btn.setEnabled(True)
         self._rebuild_sections_for_role()
         self._rebuild_create_panel_for_role()
+        self._rebuild_bulk_actions_for_role()
         self.refresh_current_list()
 
+    def _rebuild_bulk_actions_for_role(self):
+        user = self.current_user()
+        self.bulk_action_combo.clear()
+        if user:
+            for action in Action:
+                if user.role in ACTION_ROLES.get(action, set()):
+                    self.bulk_action_combo.addItem(action.value, action)
+        self.bulk_check.setChecked(False)
+        self.on_bulk_mode_changed(False)
+
+    def on_bulk_mode_changed(self, checked: bool):
+        mode = QAbstractItemView.ExtendedSelection if checked else QAbstractItemView.SingleSelection
+        self.list_view.setSelectionMode(mode)
+        self.bulk_action_combo.setVisible(checked)
+        self.bulk_btn.setVisible(checked)
+
     def _rebuild_sections_for_role(self):
         user = self.current_user()
         self.section_combo.blockSignals(True)
@@ -226,34 +338,110 @@ class MainWindow(QMainWindow):
 
     def refresh_current_list(self):
         self._rebuild_create_panel_for_role()
-        self.list_widget.clear()
 
         user = self.current_user()
         if not user:
+            self.runner.cancel("worklist-count")
+            self._fetch_rows = None
+            self.list_model.set_source(None)
             return
 
         section = self.current_section()
+        search = self.search_edit.text().strip() if section == "applications" else ""
+        self.search_timer.stop()
+        self.search_edit.setVisible(section == "applications")
+        self.bulk_check.setVisible(section == "applications" and self.bulk_action_combo.count() > 0)
+        if section != "applications":
+            # массовые действия — только над заявками: id филиалов в пакет попасть не должны
+            self.bulk_check.setChecked(False)
+            self.on_bulk_mode_changed(False)
+        self.sort_combo.setEnabled(section == "applications" and not search)
+        self.hint.setText("Загрузка…")
 
         if section == "branches":
-            branches = db.list_branches()
-            filtered = []
-            if user.role == Role.LAWYER:
-                filtered = [b for b in branches if b["status"] == BranchStatus.PENDING.name and int(b["approved_by_lawyer"]) == 0]
-            elif user.role == Role.BRANCH_DIRECTOR:
-                filtered = [b for b in branches if b.get("created_by") == user.name]
-
-            for b in filtered:
-                st = _branch_status_pretty(b["status"])
-                self.list_widget.addItem(f"Филиал #{b['id']}  •  {st}  •  {b['branch_name']}")
-            self.hint.setText(f"Филиалов в работе: {len(filtered)}")
+            self.list_model.set_source(
+                lambda after, limit: db.list_branch_worklist(user.role, user.name, limit, after=after),
+                _format_branch_row,
+            )
+            self._fetch_rows = ("branch", lambda ids: db.get_branch_worklist_rows(user.role, user.name, ids))
+        elif search:
+            # результаты поиска упорядочены по релевантности — точечно их не обновить, только по «Обновить»
+            client_name = user.name if user.role == Role.CLIENT else None
+            self.list_model.set_source(
+                lambda after, limit: db.search_applications(search, client_name=client_name, limit=limit, after=after),
+                _format_application_row,
+                descending=False,
+            )
+            self._fetch_rows = None
+            self.runner.cancel("worklist-count")
+            self.hint.setText(f"Результаты поиска «{search}»")
+            self._refresh_portfolio()
+            return
+        else:
+            sort = str(self.sort_combo.currentData() or "id")
+            self.list_model.set_source(
+                lambda after, limit: db.list_worklist(user.role, user.name, limit, sort=sort, after=after),
+                _format_application_row,
+            )
+            self._fetch_rows = ("application", lambda ids: db.get_worklist_rows(user.role, user.name, ids, sort=sort))
+        self._refresh_count()
+        self._refresh_portfolio()
+
+    def _refresh_count(self):
+        user = self.current_user()
+        if not user:
             return
+        if self.current_section() == "branches":
+            fn, text = db.count_branch_worklist, "Филиалов в работе: {}"
+        else:
+            fn, text = db.count_worklist, "Заявок, требующих вашего действия: {}"
+        self.runner.submit(
+            fn, user.role, user.name,
+            channel="worklist-count",
+            on_done=lambda total: self.hint.setText(text.format(total)),
+            on_error=self._show_error,
+        )
+
+    def _refresh_portfolio(self):
+        # итоги по филиалам директора читаются из готовой сводки (portfolio_summary), без обхода заявок
+        user = self.current_user()
+        is_director = bool(user) and user.role == Role.BRANCH_DIRECTOR
+        self.portfolio_label.setVisible(is_director)
+        if not is_director:
+            self.runner.cancel("portfolio")
+            return
+        self.runner.submit(
+            db.portfolio_summary, director=user.name,
+            channel="portfolio",
+            on_done=lambda rows: self.portfolio_label.setText(_format_portfolio(rows)),
+            on_error=self._show_error,
+        )
+
+    def on_data_changed(self, changes):
+        """Точечно обновляет изменившиеся строки открытого списка."""
+        if events.RESET in changes:
+            self.refresh_current_list()
+            return
+        if any(c.entity in ("application", "branch") for c in changes):
+            self._refresh_portfolio()
+        if self._fetch_rows is None:
+            return
+
+        entity, fetch_rows = self._fetch_rows
+        ids = sorted({c.entity_id for c in changes if c.entity == entity and c.entity_id is not None})
+        if not ids:
+            return
+
+        generation = self.list_model.generation
+        self.runner.submit(
+            fetch_rows, ids,
+            on_done=lambda rows: self.list_model.patch(generation, ids, rows),
+            on_error=self._show_error,
+        )
+        self._refresh_count()
 
-        apps = db.list_applications()
-        actionable = [a for a in apps if _needs_user_action(a, user)]
-        for a in actionable:
-            st = _app_status_pretty(a["status"])
-            self.list_widget.addItem(f"Заявка #{a['id']}  •  {st}  •  {a.get('client_fio','')}  •  {a.get('insured_object','')}")
-        self.hint.setText(f"Заявок, требующих вашего действия: {len(actionable)}")
+    def _show_error(self, error):
+        QMessageBox.warning(self, "Ошибка", str(error))
 
     def create_application_from_client(self):
         user = self.current_user()
@@ -271,15 +459,29 @@ class MainWindow(QMainWindow):
                 raise ValueError("Укажи объект страхования.")
             if len(txt) < 10:
                 raise ValueError("Добавь описание (минимум 10 символов).")
+        except Exception as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
+            return
 
-            new_id = db.create_application(user.name, client_fio=fio, insured_object=obj, request_text=txt)
-            storage.log(f"Клиент '{user.name}' создал заявку #{new_id}")
+        def done(new_id):
+            self.client_create_btn.setEnabled(True)
+            storage.log(f"Клиент '{user.name}' создал заявку #{new_id}", application_id=new_id)
+            audit.record(user.name, user.role.name, "CREATE_APPLICATION", "application", new_id,
+                         {"client_fio": fio, "insured_object": obj})
             self.client_fio.clear()
             self.client_object.clear()
             self.client_text.clear()
-            self.refresh_current_list()
-        except Exception as e:
-            QMessageBox.warning(self, "Ошибка", str(e))
+
+        def failed(error):
+            self.client_create_btn.setEnabled(True)
+            self._show_error(error)
+
+        self.client_create_btn.setEnabled(False)
+        self.runner.submit(
+            db.create_application, user.name,
+            client_fio=fio, insured_object=obj, request_text=txt,
+            on_done=done, on_error=failed,
+        )
 
     def create_branch_from_director(self):
         user = self.current_user()
@@ -297,49 +499,157 @@ class MainWindow(QMainWindow):
                 raise ValueError("Укажи адрес филиала.")
             if not phone:
                 raise ValueError("Укажи телефон филиала.")
+        except Exception as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
+            return
 
-            new_id = db.create_branch_request(name, address=address, phone=phone, created_by=user.name)
-            storage.log(f"Директор '{user.name}' создал заявку на филиал #{new_id} ({name})")
+        def done(new_id):
+            self.branch_create_btn.setEnabled(True)
+            storage.log(f"Директор '{user.name}' создал заявку на филиал #{new_id} ({name})", branch_id=new_id)
+            audit.record(user.name, user.role.name, "CREATE_BRANCH", "branch", new_id,
+                         {"branch_name": name, "address": address, "phone": phone})
             self.branch_name.clear()
             self.branch_address.clear()
             self.branch_phone.clear()
-            self.refresh_current_list()
-        except Exception as e:
-            QMessageBox.warning(self, "Ошибка", str(e))
+
+        def failed(error):
+            self.branch_create_btn.setEnabled(True)
+            self._show_error(error)
+
+        self.branch_create_btn.setEnabled(False)
+        self.runner.submit(
+            db.create_branch_request, name,
+            address=address, phone=phone, created_by=user.name,
+            on_done=done, on_error=failed,
+        )
 
     def open_item(self):
-        row = self.list_widget.currentRow()
-        if row < 0:
+        item_id = self.list_model.item_id(self.list_view.currentIndex().row())
+        if item_id is None:
             return
 
         user = self.current_user()
         if not user:
             return
 
-        section = self.current_section()
-
         try:
-            if section == "branches":
-                all_branches = db.list_branches()
-                if user.role == Role.LAWYER:
-                    filtered = [b for b in all_branches if b["status"] == BranchStatus.PENDING.name and int(b["approved_by_lawyer"]) == 0]
-                elif user.role == Role.BRANCH_DIRECTOR:
-                    filtered = [b for b in all_branches if b.get("created_by") == user.name]
-                else:
-                    filtered = []
-
-                if row >= len(filtered):
-                    return
-                self.branch_window = BranchWindow(filtered[row]["id"], user, self)
+            if self.current_section() == "branches":
+                self.branch_window = BranchWindow(item_id, user, self)
                 self.branch_window.show()
                 return
 
-            all_apps = db.list_applications()
-            actionable = [a for a in all_apps if _needs_user_action(a, user)]
-            if row >= len(actionable):
-                return
-            self.app_window = ApplicationWindow(actionable[row]["id"], user, self)
+            self.app_window = ApplicationWindow(item_id, user, self)
             self.app_window.show()
 
         except Exception as e:
             QMessageBox.warning(self, "Ошибка", str(e))
+
+    # ---- bulk ----
+
+    def _ask_bulk_data(self, action: Action, refs: dict):
+        """Общие для всех выбранных заявок данные действия. None — пользователь отменил."""
+        title = action.value
+
+        if action == Action.ASSESS_RISK:
+            risk, ok = QInputDialog.getInt(self, title, "Процент риска:", 0, 0, 100, 1)
+            if not ok:
+                return None
+            types = refs.get("types") or []
+            if not types:
+                raise ValueError("Нет доступных видов страхования.")
+            name, ok = QInputDialog.getItem(self, title, "Вид страхования:", [t["name"] for t in types], 0, False)
+            if not ok:
+                return None
+            type_id = next(int(t["id"]) for t in types if t["name"] == name)
+            return {"risk_percent": risk, "insurance_type_id": type_id}
+
+        if action == Action.APPROVE:
+            insurance_sum, ok = QInputDialog.getDouble(self, title, "Страховая сумма:", 0, 0, 1e12, 2)
+            if not ok:
+                return None
+            tariff_rate, ok = QInputDialog.getDouble(self, title, "Тарифная ставка (%):", 0, 0, 100, 3)
+            if not ok:
+                return None
+            return {"insurance_sum": insurance_sum, "tariff_rate": tariff_rate}
+
+        if action == Action.PREPARE_CONTRACT:
+            branches = refs.get("branches") or []
+            if not branches:
+                raise ValueError("Нет одобренных филиалов.")
+            labels = [f"{b['branch_name']} — {b.get('address','')}" for b in branches]
+            label, ok = QInputDialog.getItem(self, title, "Филиал:", labels, 0, False)
+            if not ok:
+                return None
+            draft, ok = QInputDialog.getMultiLineText(self, title, "Проект договора (общий для всех):", "")
+            if not ok:
+                return None
+            return {"branch_id": int(branches[labels.index(label)]["id"]), "draft_text": draft}
+
+        answer = QMessageBox.question(self, title, "Выполнить действие для выбранных заявок?")
+        return {} if answer == QMessageBox.Yes else None
+
+    def run_bulk_action(self):
+        user = self.current_user()
+        action = self.bulk_action_combo.currentData()
+        if not user or action is None or self.current_section() != "applications":
+            return
+
+        rows = sorted(index.row() for index in self.list_view.selectionModel().selectedRows())
+        ids = [self.list_model.item_id(r) for r in rows]
+        # статусы, которые видит пользователь: заявки, изменённые после этого, пакет не тронет
+        expected = {
+            self.list_model.item_id(r): ApplicationStatus[self.list_model.item_status(r)]
+            for r in rows if self.list_model.item_status(r) in ApplicationStatus.__members__
+        }
+        if not ids:
+            QMessageBox.information(self, "Массовая обработка", "Выберите заявки в списке.")
+            return
+
+        self.bulk_btn.setEnabled(False)
+        self.runner.submit(
+            _load_bulk_refs, action,
+            channel="bulk-refs",
+            on_done=lambda refs: self._continue_bulk_action(user, action, ids, expected, refs),
+            on_error=self._on_bulk_failed,
+        )
+
+    def _continue_bulk_action(self, user, action: Action, ids, expected, refs: dict):
+        try:
+            data = self._ask_bulk_data(action, refs)
+        except Exception as e:
+            self._on_bulk_failed(e)
+            return
+        if data is None:
+            self.bulk_btn.setEnabled(True)
+            return
+
+        self.hint.setText(f"Обработка {len(ids)} заявок…")
+        self.runner.submit(
+            self.service.perform_actions_bulk, [(i, action, data) for i in ids], user,
+            expected_statuses=expected,
+            on_done=self._on_bulk_done,
+            on_error=self._on_bulk_failed,
+        )
+
+    def _on_bulk_done(self, results):
+        self.bulk_btn.setEnabled(True)
+        conflicts = [r for r in results if r.conflict]
+        failed = [r for r in results if not r.ok and not r.conflict]
+
+        text = f"Выполнено: {sum(r.ok for r in results)} из {len(results)}"
+        if conflicts:
+            text += (
+                f"\n\nУже обработаны другим пользователем: {len(conflicts)}\n"
+                + ", ".join(f"#{r.application_id}" for r in conflicts[:50])
+            )
+            if len(conflicts) > 50:
+                text += ", …"
+        if failed:
+            text += "\n\nОшибки:\n" + "\n".join(f"#{r.application_id}: {r.error}" for r in failed[:20])
+            if len(failed) > 20:
+                text += f"\n... и ещё {len(failed) - 20}"
+        QMessageBox.information(self, "Массовая обработка", text)
+
+    def _on_bulk_failed(self, error):
+        self.bulk_btn.setEnabled(True)
+        self._show_error(error)
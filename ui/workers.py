@@ -0,0 +1,107 @@
+import itertools
+from typing import Any, Callable, Dict, Optional
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class _TaskSignals(QObject):
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, object)
+
+
+class _Task(QRunnable):
+    def __init__(self, token: int, fn: Callable, args, kwargs, signals: _TaskSignals):
+        super().__init__()
+        self.token = token
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = signals
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.failed.emit(self.token, e)
+            return
+        self.signals.finished.emit(self.token, result)
+
+
+class DbRunner(QObject):
+    """
+    Выполняет вызовы core/db и InsuranceService в QThreadPool и возвращает результат
+    в GUI-поток через колбэки on_done / on_error.
+
+    Запросы одного канала (channel) вытесняют друг друга: результат учитывается
+    только у последнего запроса канала, ещё не начатые предыдущие снимаются с очереди.
+    """
+
+    busy_changed = pyqtSignal(str, bool)
+
+    def __init__(self, parent=None, pool: Optional[QThreadPool] = None):
+        super().__init__(parent)
+        self._pool = pool or QThreadPool.globalInstance()
+        self._signals = _TaskSignals()
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+        self._tokens = itertools.count(1)
+        self._pending: Dict[int, tuple] = {}
+        self._latest: Dict[str, int] = {}
+        self._tasks: Dict[int, _Task] = {}
+
+    def submit(
+        self,
+        fn: Callable,
+        *args,
+        channel: Optional[str] = None,
+        on_done: Optional[Callable[[Any], None]] = None,
+        on_error: Optional[Callable[[Exception], None]] = None,
+        **kwargs,
+    ) -> int:
+        token = next(self._tokens)
+        if channel is not None:
+            self.cancel(channel)
+            self._latest[channel] = token
+            self.busy_changed.emit(channel, True)
+
+        task = _Task(token, fn, args, kwargs, self._signals)
+        # задачу держит self._tasks до _take/cancel; при autoDelete Qt удалил бы её раньше,
+        # чем очередной finished дойдёт до GUI-потока, и tryTake упал бы на удалённом объекте
+        task.setAutoDelete(False)
+        self._pending[token] = (channel, on_done, on_error)
+        self._tasks[token] = task
+        self._pool.start(task)
+        return token
+
+    def cancel(self, channel: str):
+        """Отменяет текущий запрос канала: не начатый снимается с очереди, результат начатого игнорируется."""
+        token = self._latest.pop(channel, None)
+        if token is None:
+            return
+        task = self._tasks.pop(token, None)
+        if task is not None and self._pool.tryTake(task):
+            self._pending.pop(token, None)
+        self.busy_changed.emit(channel, False)
+
+    def is_busy(self, channel: str) -> bool:
+        return channel in self._latest
+
+    def _take(self, token: int):
+        self._tasks.pop(token, None)
+        channel, on_done, on_error = self._pending.pop(token, (None, None, None))
+        if channel is not None:
+            if self._latest.get(channel) != token:
+                return None  # устаревший результат
+            del self._latest[channel]
+            self.busy_changed.emit(channel, False)
+        return on_done, on_error
+
+    def _on_finished(self, token: int, result):
+        callbacks = self._take(token)
+        if callbacks and callbacks[0] is not None:
+            callbacks[0](result)
+
+    def _on_failed(self, token: int, error):
+        callbacks = self._take(token)
+        if callbacks and callbacks[1] is not None:
+            callbacks[1](error)
@@ -0,0 +1,188 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, pyqtSignal
+
+from ui.workers import DbRunner
+
+# fetch_page(after, limit) -> строки с полями id и sort_key (см. db.list_worklist)
+FetchPage = Callable[[Optional[Tuple[Any, int]], int], List[Dict[str, Any]]]
+
+
+class WorklistModel(QAbstractListModel):
+    """
+    Список задач с ленивой подгрузкой: строки запрашиваются страницами по мере прокрутки
+    (canFetchMore/fetchMore), продолжение страницы — по ключу (sort_key, id), без OFFSET.
+    Текст строки формируется только при отрисовке.
+    Страницы загружаются в фоне через DbRunner; смена источника отбрасывает незавершённую загрузку.
+    Изменения отдельных строк применяются через patch(), без перезагрузки списка.
+    """
+
+    IdRole = Qt.UserRole
+
+    loading_changed = pyqtSignal(bool)
+    load_failed = pyqtSignal(object)
+
+    def __init__(self, format_row: Callable[[Dict[str, Any]], str], runner: DbRunner, page_size: int = 200, parent=None):
+        super().__init__(parent)
+        self._format_row = format_row
+        self._runner = runner
+        self._channel = f"worklist-{id(self)}"
+        self._page_size = page_size
+        self._fetch_page: Optional[FetchPage] = None
+        self._rows: List[Dict[str, Any]] = []
+        self._exhausted = True
+        self._loading = False
+        self._descending = True
+        self._generation = 0
+
+    def set_source(
+        self,
+        fetch_page: Optional[FetchPage],
+        format_row: Optional[Callable[[Dict[str, Any]], str]] = None,
+        *,
+        descending: bool = True,
+    ):
+        self._runner.cancel(self._channel)
+        self._set_loading(False)
+        self.beginResetModel()
+        self._generation += 1
+        self._fetch_page = fetch_page
+        self._descending = descending
+        if format_row is not None:
+            self._format_row = format_row
+        self._rows = []
+        self._exhausted = fetch_page is None
+        self.endResetModel()
+        if self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex())
+
+    def reload(self):
+        self.set_source(self._fetch_page, descending=self._descending)
+
+    @property
+    def generation(self) -> int:
+        """Номер текущего источника: результат, запрошенный для прежнего источника, применять нельзя."""
+        return self._generation
+
+    def patch(self, generation: int, ids: Iterable[int], rows: Dict[int, Dict[str, Any]]):
+        """
+        Применяет изменения строк ids. rows — актуальные строки (с sort_key) тех из них,
+        что остаются в списке; отсутствующие в rows удаляются из модели.
+        Новая строка вставляется на своё место, только если оно внутри уже загруженной части.
+        """
+        if generation != self._generation:
+            return
+        for item_id in ids:
+            item_id = int(item_id)
+            pos = self._find(item_id)
+            row = rows.get(item_id)
+
+            if pos is not None and row is not None and self._key(self._rows[pos]) == self._key(row):
+                self._rows[pos] = row
+                index = self.index(pos)
+                self.dataChanged.emit(index, index)
+                continue
+
+            if pos is not None:
+                self.beginRemoveRows(QModelIndex(), pos, pos)
+                del self._rows[pos]
+                self.endRemoveRows()
+
+            if row is not None:
+                target = self._insert_position(row)
+                if target is not None:
+                    self.beginInsertRows(QModelIndex(), target, target)
+                    self._rows.insert(target, row)
+                    self.endInsertRows()
+
+    def _find(self, item_id: int) -> Optional[int]:
+        for i, r in enumerate(self._rows):
+            if int(r["id"]) == item_id:
+                return i
+        return None
+
+    @staticmethod
+    def _key(row: Dict[str, Any]) -> Tuple[Any, int]:
+        return row["sort_key"], int(row["id"])
+
+    def _insert_position(self, row: Dict[str, Any]) -> Optional[int]:
+        key = self._key(row)
+        for i, r in enumerate(self._rows):
+            other = self._key(r)
+            if (other < key) if self._descending else (other > key):
+                return i
+        # за последней загруженной строкой — место известно, только если список загружен целиком
+        return len(self._rows) if self._exhausted else None
+
+    # ---- Qt model API ----
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._rows):
+            return None
+        row = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return self._format_row(row)
+        if role == self.IdRole:
+            return int(row["id"])
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        return not parent.isValid() and not self._exhausted and not self._loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted or self._loading or self._fetch_page is None:
+            return
+        after = None
+        if self._rows:
+            last = self._rows[-1]
+            after = (last["sort_key"], int(last["id"]))
+
+        self._set_loading(True)
+        self._runner.submit(
+            self._fetch_page, after, self._page_size,
+            channel=self._channel,
+            on_done=self._append_page,
+            on_error=self._on_load_error,
+        )
+
+    def _set_loading(self, loading: bool):
+        if self._loading != loading:
+            self._loading = loading
+            self.loading_changed.emit(loading)
+
+    def _on_load_error(self, error):
+        self._set_loading(False)
+        self._exhausted = True
+        self.load_failed.emit(error)
+
+    def _append_page(self, page: List[Dict[str, Any]]):
+        self._set_loading(False)
+        if len(page) < self._page_size:
+            self._exhausted = True
+        if not page:
+            return
+
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(page) - 1)
+        self._rows.extend(page)
+        self.endInsertRows()
+
+    # ---- helpers ----
+
+    @property
+    def loading(self) -> bool:
+        return self._loading
+
+    def item_id(self, row: int) -> Optional[int]:
+        if 0 <= row < len(self._rows):
+            return int(self._rows[row]["id"])
+        return None
+
+    def item_status(self, row: int) -> Optional[str]:
+        """Статус строки в том виде, в каком он показан пользователю (имя из БД)."""
+        if 0 <= row < len(self._rows):
+            return self._rows[row].get("status")
+        return None